@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the HTML extraction backends of get_events.py.
+Checks that every backend gives byte-identical output to the 'bs4'
+reference and reports pages/second for each backend.
+
+Usage: python benchmark_extraction.py [page.html ...]
+Without arguments test.html and all pages in the scraper's page cache are used.
+"""
+
+import glob
+import os
+import sys
+import time
+from typing import List
+
+import get_events
+
+
+ROUNDS = 5
+
+
+def load_pages(paths: List[str]) -> List[str]:
+    """Read the HTML pages to benchmark."""
+    if not paths:
+        paths = ["test.html"]
+        paths += sorted(glob.glob(os.path.join(get_events.CACHE_DIR, "blobs", "*", "*")))
+    pages = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages
+
+
+def run_backend(name: str, pages: List[str]):
+    """Extract links and content from every page, return (outputs, pages/second)."""
+    extract_links, extract_content = get_events.EXTRACTION_BACKENDS[name]
+    outputs = []
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        outputs = [(extract_links(page), extract_content(page)) for page in pages]
+    elapsed = time.perf_counter() - start
+    return outputs, (len(pages) * ROUNDS) / elapsed if elapsed > 0 else float('inf')
+
+
+def main():
+    pages = load_pages(sys.argv[1:])
+    print(f"Benchmarking {len(pages)} pages, {ROUNDS} rounds")
+    print()
+
+    reference, reference_rate = run_backend("bs4", pages)
+    all_identical = True
+    for name in get_events.EXTRACTION_BACKENDS:
+        if name == "bs4":
+            outputs, rate = reference, reference_rate
+        else:
+            outputs, rate = run_backend(name, pages)
+        identical = outputs == reference
+        all_identical = all_identical and identical
+        print(f"  {name:8s} {rate:10.1f} pages/s  {rate / reference_rate:5.2f}x  "
+              f"{'identical' if identical else 'OUTPUT DIFFERS'}")
+
+    if not all_identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for calendar events.
+
+The calendar often lists the same concert several times (repeat
+performances, the same programme in different cities). Such events differ
+only in the date, time and place lines, so those lines are left out and the
+rest of the text is compared with MinHash signatures of word shingles.
+Candidates are found with LSH banding and accepted when the estimated
+Jaccard similarity reaches the threshold.
+
+Only the most recent `window` representatives are kept in the index: the
+calendar is chronological and repeats are close to each other, and memory
+stays bounded on big corpora.
+"""
+
+import hashlib
+import re
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from event_rules import LABEL_RE, parse_date, parse_time
+
+
+WORD_RE = re.compile(r'\w+')
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def comparable_text(event_text: str) -> str:
+    """Event text without the date line and the 'Koht:' / 'Kell:' lines."""
+    lines = [line.strip() for line in event_text.split('\n') if line.strip()]
+    kept = []
+    for position, line in enumerate(lines):
+        if position == 1 and parse_date(line):
+            continue
+        label_match = LABEL_RE.match(line)
+        if label_match and label_match.group(1).strip().lower() in ("koht", "kell"):
+            continue
+        kept.append(line)
+    return '\n'.join(kept)
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Set of lowercase word n-grams (the whole text if it is shorter than `size` words)."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def extract_date_and_place(event_text: str) -> Optional[Dict[str, str]]:
+    """
+    Re-extract the per-performance fields of a duplicate: date (second line),
+    location ('Koht:') and time ('Kell:', optional). None if date or location is missing.
+    """
+    lines = [line.strip() for line in event_text.split('\n') if line.strip()]
+    if len(lines) < 2:
+        return None
+    fields = {"date": parse_date(lines[1]), "location": "", "time": ""}
+    for line in lines[2:]:
+        label_match = LABEL_RE.match(line)
+        if not label_match:
+            continue
+        label = label_match.group(1).strip().lower()
+        value = label_match.group(2).strip()
+        if label == "koht" and not fields["location"]:
+            fields["location"] = value
+        elif label == "kell" and not fields["time"]:
+            fields["time"] = parse_time(value) or ""
+    if not fields["date"] or not fields["location"]:
+        return None
+    return fields
+
+
+class MinHashDeduplicator:
+    """
+    Streaming near-duplicate finder.
+
+    find_or_add(key, text) returns the key of an earlier representative with
+    estimated Jaccard similarity >= threshold, or None after registering the
+    text as a new representative.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 3, window: int = 5000, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.window = window
+        # Fixed seed: the same permutations in every run
+        self._permutations = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(f"{seed}:{i}".encode(), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], 'big') % (MERSENNE_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], 'big') % MERSENNE_PRIME
+            self._permutations.append((a, b))
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+        self._order = deque()
+        self.checked = 0
+        self.duplicates = 0
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+                  for shingle in shingles(text, self.shingle_size)]
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self._permutations)
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+    def find_or_add(self, key: str, text: str) -> Optional[str]:
+        self.checked += 1
+        signature = self.signature(text)
+        best_key, best_similarity = None, 0.0
+        seen = set()
+        for band_key in self._band_keys(signature):
+            for candidate in self._buckets.get(band_key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                similarity = self.similarity(signature, self._signatures[candidate])
+                if similarity > best_similarity:
+                    best_key, best_similarity = candidate, similarity
+        if best_key is not None and best_similarity >= self.threshold:
+            self.duplicates += 1
+            return best_key
+        self._add(key, signature)
+        return None
+
+    def _add(self, key: str, signature: Tuple[int, ...]) -> None:
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(key)
+        self._order.append(key)
+        if len(self._order) > self.window:
+            self._remove(self._order.popleft())
+
+    def _remove(self, key: str) -> None:
+        signature = self._signatures.pop(key)
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets[band_key]
+            bucket.remove(key)
+            if not bucket:
+                del self._buckets[band_key]
+
+    def is_representative(self, key: str) -> bool:
+        return key in self._signatures
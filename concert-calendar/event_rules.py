@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Rule-based fast path for parsing scraped calendar events.
+
+Most events follow the layout produced by get_events.py:
+
+    Title
+    dd.mm.yyyy
+    Koht: ...
+    Kell: hh:mm
+    Esitajad: / Kava: / Pilet: / Vaata ka: sections, links as 'text (url)'
+
+parse_event() fills the same JSON fields as the Gemini SYSTEM_PROMPT (date
+as YYYY-MM-DD and time as HH:MM:SS, ready for MySQL) for events it fully
+recognizes and returns None for anything unusual or ambiguous, which is
+then left to the LLM.
+"""
+
+import datetime
+import re
+from typing import Dict, Optional, Tuple
+
+
+EVENT_FIELDS = ["title", "date", "time", "location", "performers", "program",
+                "description", "tickets", "link", "other_info"]
+
+# Section labels (lowercase, without the colon) -> target section
+SECTION_LABELS = {
+    "esitajad": "performers",
+    "esitaja": "performers",
+    "esinevad": "performers",
+    "esineb": "performers",
+    "osades": "performers",
+    "kaastegevad": "performers",
+    "kava": "program",
+    "kavas": "program",
+    "pilet": "tickets",
+    "piletid": "tickets",
+    "pilet ja lisainfo": "tickets_and_link",
+    "piletid ja lisainfo": "tickets_and_link",
+    "info ja piletid": "tickets_and_link",
+    "lisainfo": "link",
+    "vaata ka": "link",
+    "info": "link",
+}
+
+# Labels of single performer lines, kept as 'Label: value' in performers
+PERFORMER_ROLE_LABELS = {"dirigent", "dirigendid", "õhtujuht", "solist", "solistid"}
+
+DATE_RE = re.compile(r'^(\d{1,2})\.(\d{1,2})\.(\d{4})$')
+TIME_RE = re.compile(r'^(\d{1,2})[:.](\d{2})$')
+LABEL_RE = re.compile(r'^([^:()]{2,30}):\s*(.*)$')
+LINK_RE = re.compile(r'^(.*?)\s*\((https?://[^\s()]+)\)$')
+URL_RE = re.compile(r'^https?://\S+$')
+PERFORMER_WITH_ROLE_RE = re.compile(r'^[^()]{2,80}\s\([^()]{2,40}\)$')
+PERFORMER_COMMA_ROLE_RE = re.compile(r'^[^,()]{3,60}, [a-zõäöüšž][a-zõäöüšž ,-]{2,40}$')
+CONDUCTOR_RE = re.compile(r'^(dirigent|koormeister|kontsertmeister)\s+\S', re.IGNORECASE)
+ENSEMBLE_WORDS = ("orkester", "koor", "sinfonietta", "sinfoniker", "kvartett", "trio",
+                  "ansambel", "solistid", "kammerkoor", "orchestra", "choir", "ensemble")
+SENTENCE_END_RE = re.compile(r'[.!?…][“”"»]?$')
+
+
+def parse_date(value: str) -> Optional[str]:
+    """dd.mm.yyyy -> YYYY-MM-DD, or None if the value is not a valid date."""
+    match = DATE_RE.match(value)
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_time(value: str) -> Optional[str]:
+    """hh:mm or hh.mm -> HH:MM:SS, or None if the value is not a valid time."""
+    match = TIME_RE.match(value.strip())
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        return None
+    return f"{hours:02d}:{minutes:02d}:00"
+
+
+def split_link(line: str) -> Tuple[str, Optional[str]]:
+    """Split a 'text (url)' or bare url line into (text, url)."""
+    match = LINK_RE.match(line)
+    if match:
+        return match.group(1), match.group(2)
+    if URL_RE.match(line):
+        return "", line
+    return line, None
+
+
+def _is_performer_line(line: str) -> bool:
+    if PERFORMER_WITH_ROLE_RE.match(line) or PERFORMER_COMMA_ROLE_RE.match(line):
+        return True
+    if CONDUCTOR_RE.match(line):
+        return True
+    lowered = line.lower()
+    return len(line) <= 80 and any(word in lowered for word in ENSEMBLE_WORDS) and not SENTENCE_END_RE.search(line)
+
+
+def _is_description_line(line: str) -> bool:
+    return len(line) >= 100 or (len(line.split()) >= 10 and SENTENCE_END_RE.search(line) is not None)
+
+
+def parse_event(event_text: str) -> Optional[Dict[str, str]]:
+    """
+    Parse an event in the standard calendar layout.
+    Returns a dict with EVENT_FIELDS, or None if the event is not fully recognized.
+    """
+    lines = [line.strip() for line in event_text.split('\n') if line.strip()]
+    if len(lines) < 3:
+        return None
+
+    event = {field: "" for field in EVENT_FIELDS}
+    event["title"] = lines[0]
+    date = parse_date(lines[1])
+    if date is None:
+        return None
+    event["date"] = date
+
+    collected = {"performers": [], "program": [], "description": [], "tickets": [], "link": []}
+    other_info = []
+    section = None  # None = unlabeled lines before the first section
+
+    for position in range(2, len(lines)):
+        line = lines[position]
+        next_line = lines[position + 1] if position + 1 < len(lines) else ""
+        label_match = LABEL_RE.match(line)
+        label = label_match.group(1).strip().lower() if label_match else None
+        value = label_match.group(2).strip() if label_match else ""
+
+        if label == "koht" and not event["location"]:
+            if not value:
+                return None
+            event["location"] = value
+            continue
+        if label == "kell" and not event["time"]:
+            event["time"] = parse_time(value)
+            if event["time"] is None:
+                return None
+            continue
+        if label in SECTION_LABELS:
+            section = SECTION_LABELS[label]
+            if value:
+                collected.setdefault(section, []).append(value)
+            continue
+        if label in PERFORMER_ROLE_LABELS and value and section in (None, "performers"):
+            collected["performers"].append(f"{label_match.group(1).strip()}: {value}")
+            continue
+
+        first_word = line.split()[0].lower()
+        if first_word in SECTION_LABELS or first_word in ("kell", "koht"):
+            # 'Kavas Mozart ...' without a colon: label and value are ambiguous
+            return None
+
+        if section is None:
+            if line.startswith('(') and line.endswith(')') and collected["performers"] and not collected["description"]:
+                # Role on its own line: "Marta Paklar" / "(sopran)"
+                collected["performers"][-1] += f" {line}"
+            elif _is_description_line(line):
+                collected["description"].append(line)
+            elif _is_performer_line(line) and not collected["description"]:
+                collected["performers"].append(line)
+            elif not collected["description"] and next_line.startswith('(') and next_line.endswith(')'):
+                # Name whose role follows on the next line
+                collected["performers"].append(line)
+            else:
+                return None
+        elif section in ("tickets", "link", "tickets_and_link"):
+            collected.setdefault(section, []).append(line)
+        elif line.endswith(':') and section == "program":
+            # An unknown heading inside the programme
+            return None
+        elif _is_description_line(line):
+            # Prose after the performer list or the programme
+            collected["description"].append(line)
+        elif collected["description"] and section == "performers":
+            return None
+        else:
+            collected[section].append(line)
+
+    if not event["location"]:
+        return None
+
+    event["performers"] = "; ".join(collected["performers"])
+    event["program"] = "; ".join(collected["program"])
+    event["description"] = "\n".join(collected["description"])
+
+    # Links: 'Lisainfo' / 'Vaata ka' first, then the ticket sections
+    link_lines = collected["link"] + collected.get("tickets_and_link", [])
+    ticket_texts = list(collected["tickets"])
+    for line in collected.get("tickets_and_link", []):
+        text, _ = split_link(line)
+        if text:
+            ticket_texts.append(text)
+    for line in collected["link"]:
+        text, url = split_link(line)
+        if url is None:
+            return None
+        if text and not URL_RE.match(text) and text != url:
+            other_info.append(text)
+    urls = [split_link(line)[1] for line in link_lines + collected["tickets"]]
+    urls = [url for url in urls if url]
+
+    event["tickets"] = "; ".join(ticket_texts)
+    event["link"] = urls[0] if urls else ""
+    event["other_info"] = "; ".join(other_info)
+    return event
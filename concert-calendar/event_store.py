@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Reader, writer and byte-offset index for ####-delimited event files.
+
+The file format is the one written by get_events.py:
+
+    ---------------- 2014 ---------------------
+
+    first event text
+    ####
+    second event text
+
+Year header lines are optional (test-events.txt has none, events are then
+read with year None). Events are numbered from 1 within each year.
+
+A sidecar index (<file>.idx) stores the byte offset and length of every
+event, so single events or year ranges can be read with seek() without
+parsing the whole file.
+"""
+
+import json
+import os
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+
+DELIMITER = "####"
+INDEX_SUFFIX = ".idx"
+YEAR_HEADER_RE = re.compile(r'^-{4,} (\d{4}) -{4,}$')
+
+
+class EventRecord(NamedTuple):
+    year: Optional[int]
+    number: int
+    text: str
+
+
+class _Span(NamedTuple):
+    year: Optional[int]
+    number: int
+    offset: int
+    length: int
+
+
+def year_header(year: int) -> str:
+    """Return the year header block as written by get_events.py."""
+    return f"\n---------------- {year} ---------------------\n\n"
+
+
+def _scan_spans(f, offset: int = 0, year: Optional[int] = None, number: int = 0) -> Iterator[_Span]:
+    """
+    Scan a binary file object line by line and yield the byte span of every
+    non-empty event. Memory use is bounded by the longest line.
+    """
+    start = None  # offset of the first non-blank line of the current event
+    end = None  # offset right after its last non-blank line
+
+    def finish():
+        nonlocal start, end, number
+        if start is not None:
+            number += 1
+            span = _Span(year, number, start, end - start)
+            start = end = None
+            return span
+        return None
+
+    for line in iter(f.readline, b''):
+        stripped = line.strip()
+        header = YEAR_HEADER_RE.match(stripped.decode('utf-8', errors='replace')) if stripped.startswith(b'-') else None
+        if stripped == DELIMITER.encode() or header:
+            span = finish()
+            if span:
+                yield span
+            if header:
+                year = int(header.group(1))
+                number = 0
+        elif stripped:
+            if start is None:
+                start = offset
+            end = offset + len(line.rstrip())
+        offset += len(line)
+
+    span = finish()
+    if span:
+        yield span
+
+
+def iter_events(filename: str) -> Iterator[EventRecord]:
+    """Yield the events of a file one by one, without reading it all into memory."""
+    with open(filename, 'rb') as f:
+        for span in _scan_spans(f):
+            f_pos = f.tell()
+            f.seek(span.offset)
+            text = f.read(span.length).decode('utf-8').strip()
+            f.seek(f_pos)
+            yield EventRecord(span.year, span.number, text)
+
+
+def event_key(event: EventRecord) -> str:
+    """Stable key of an event: year and number within the year, e.g. '2014-00012'."""
+    return f"{event.year or 0:04d}-{event.number:05d}"
+
+
+def count_events(filename: str) -> int:
+    """Count the events of a file with a single streaming pass."""
+    with open(filename, 'rb') as f:
+        return sum(1 for _ in _scan_spans(f))
+
+
+def _index_path(filename: str) -> str:
+    return filename + INDEX_SUFFIX
+
+
+def build_index(filename: str) -> Dict:
+    """Scan the event file and write its sidecar byte-offset index."""
+    with open(filename, 'rb') as f:
+        spans = [list(span) for span in _scan_spans(f)]
+    stat = os.stat(filename)
+    index = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "events": spans}
+    _write_index(filename, index)
+    return index
+
+
+def _write_index(filename: str, index: Dict) -> None:
+    tmp_path = _index_path(filename) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, _index_path(filename))
+
+
+def _load_index_if_valid(filename: str) -> Optional[Dict]:
+    try:
+        with open(_index_path(filename), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        stat = os.stat(filename)
+    except (OSError, ValueError):
+        return None
+    if index.get("size") != stat.st_size or index.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return index
+
+
+def load_index(filename: str) -> Dict:
+    """Return the sidecar index, rebuilding it if missing or stale."""
+    index = _load_index_if_valid(filename)
+    if index is None:
+        index = build_index(filename)
+    return index
+
+
+def _read_spans(filename: str, spans: List[List]) -> Iterator[EventRecord]:
+    with open(filename, 'rb') as f:
+        for year, number, offset, length in spans:
+            f.seek(offset)
+            yield EventRecord(year, number, f.read(length).decode('utf-8').strip())
+
+
+def read_event(filename: str, year: Optional[int], number: int) -> Optional[EventRecord]:
+    """Read a single event by year and number (1-based), or None if it does not exist."""
+    spans = [s for s in load_index(filename)["events"] if s[0] == year and s[1] == number]
+    return next(_read_spans(filename, spans), None)
+
+
+def iter_year_range(filename: str, first_year: int, last_year: int) -> Iterator[EventRecord]:
+    """Yield the events of years first_year..last_year (inclusive) using the index."""
+    spans = [s for s in load_index(filename)["events"]
+             if s[0] is not None and first_year <= s[0] <= last_year]
+    return _read_spans(filename, spans)
+
+
+class EventWriter:
+    """
+    Append-only writer for ####-delimited event files.
+    Produces the same bytes as the old save_events_to_file() and keeps the
+    sidecar index up to date if it was valid when the writer was opened.
+
+    Usage:
+        with EventWriter("events.txt") as writer:
+            writer.write(2014, "event text")
+    """
+
+    def __init__(self, filename: str, mode: str = 'a'):
+        self.filename = filename
+        self._index = _load_index_if_valid(filename) if mode == 'a' else None
+        if mode == 'w' or not os.path.exists(filename):
+            self._index = {"events": []}
+        self._file = open(filename, mode + 'b')
+        self._file.seek(0, os.SEEK_END)
+        self._year = None
+        self._number = 0
+        self._year_open = False
+
+    def _write(self, text: str) -> None:
+        self._file.write(text.encode('utf-8'))
+
+    def _close_year(self) -> None:
+        if self._year_open:
+            self._write('\n')
+            self._year_open = False
+
+    def write(self, year: int, text: str) -> None:
+        """Append one event; a year header is written whenever the year changes."""
+        if not self._year_open or year != self._year:
+            self.start_year(year)
+        elif self._number:
+            self._write(f'\n{DELIMITER}\n')
+        data = text.encode('utf-8')
+        offset = self._file.tell()
+        self._file.write(data)
+        self._number += 1
+        if self._index is not None:
+            self._index["events"].append([year, self._number, offset, len(data)])
+
+    def start_year(self, year: int) -> None:
+        """Start a new year block, even if no events follow."""
+        self._close_year()
+        self._write(year_header(year))
+        self._year = year
+        self._number = 0
+        self._year_open = True
+
+    def close(self) -> None:
+        self._close_year()
+        self._file.close()
+        if self._index is not None:
+            stat = os.stat(self.filename)
+            self._index["size"] = stat.st_size
+            self._index["mtime_ns"] = stat.st_mtime_ns
+            _write_index(self.filename, self._index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Batch API pipeline for concert events.
+Mirrors the repertoire tooling (prepare_batch_file.py -> run_batch_process.py
+-> insert_batch_results_to_database.py) for the calendar:
+
+    1. write one keyed JSONL request per event (key = year-number)
+    2. upload the file, submit a Gemini batch job and poll until it is done
+    3. stream the results back into the events JSON and problems.txt
+
+Events recognized by the rule-based parser are not sent to the batch.
+Set USE_FAKE_CLIENT = True to run the whole pipeline offline.
+"""
+
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+from typing import BinaryIO, Callable, Dict, Optional
+
+from event_rules import parse_event
+from event_store import EventRecord, event_key, iter_events
+from events_to_json import (
+    SYSTEM_PROMPT,
+    RULES_FAST_PATH,
+    append_problem_to_file,
+    parse_gemini_response,
+)
+from resumable_output import ResumableOutput, checkpoint_path, compact_jsonl_to_json, jsonl_path
+
+
+# Configuration
+INPUT_FILE = "test-events.txt"
+BATCH_INPUT_FILE = "events_batch_input.jsonl"
+BATCH_OUTPUT_FILE = "events_batch_output.jsonl"
+OUTPUT_FILE = "test-events.json"
+PROBLEMS_FILE = "problems.txt"
+MODEL_ID = "gemini-2.5-flash-lite"
+POLL_INTERVAL = 60  # seconds, batch jobs are not instantaneous
+USE_FAKE_CLIENT = False
+
+
+def build_batch_request(event: EventRecord) -> Dict:
+    """Build one Batch API request line for an event."""
+    return {
+        "key": event_key(event),
+        "request": {
+            "system_instruction": {
+                "parts": [{"text": SYSTEM_PROMPT}]
+            },
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [{"text": f"Event text:\n{event.text}"}]
+                }
+            ],
+            "generationConfig": {
+                "response_mime_type": "application/json"
+            }
+        }
+    }
+
+
+def prepare_batch_file(input_file: str = INPUT_FILE, output_file: str = BATCH_INPUT_FILE) -> int:
+    """
+    Write the keyed JSONL request file, streaming the events one by one.
+    Returns the number of requests written.
+    """
+    count = 0
+    skipped = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for event in iter_events(input_file):
+            if RULES_FAST_PATH and parse_event(event.text) is not None:
+                skipped += 1
+                continue
+            f.write(json.dumps(build_batch_request(event), ensure_ascii=False) + '\n')
+            count += 1
+    print(f"Created {output_file} with {count} requests ({skipped} events parsed by rules)")
+    return count
+
+
+def submit_batch(client, input_file: str = BATCH_INPUT_FILE) -> str:
+    """Upload the request file and create the batch job. Returns the job name."""
+    print(f"Uploading {input_file}...")
+    uploaded_file = client.files.upload(
+        file=input_file,
+        config={'mime_type': 'application/jsonl'}
+    )
+    print(f"File uploaded successfully: {uploaded_file.name}")
+
+    batch_job = client.batches.create(
+        model=MODEL_ID,
+        src=uploaded_file.name,
+        config={'display_name': 'EMIC_Concert_Events'}
+    )
+    print(f"Batch job created. ID: {batch_job.name}")
+    return batch_job.name
+
+
+def wait_for_batch(client, job_name: str, poll_interval: float = POLL_INTERVAL):
+    """Poll the batch job until it finishes. Returns the job, or None if it failed."""
+    while True:
+        job = client.batches.get(name=job_name)
+        state = job.state.name
+        if state == 'JOB_STATE_SUCCEEDED':
+            print("Batch job completed!")
+            return job
+        if state in ('JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'):
+            print(f"Job failed or was cancelled. State: {state}")
+            if getattr(job, 'error', None):
+                print(f"Error details: {job.error}")
+            return None
+        print(f"Status: {state}... checking again in {poll_interval}s")
+        time.sleep(poll_interval)
+
+
+def download_results(client, job, output_file: str = BATCH_OUTPUT_FILE) -> None:
+    """Download the result JSONL of a finished job."""
+    print(f"Downloading results from {job.dest.file_name}...")
+    content_bytes = client.files.download(file=job.dest.file_name)
+    with open(output_file, 'wb') as f:
+        f.write(content_bytes)
+    print(f"Results saved to {output_file}")
+
+
+def _response_text(item: Dict) -> str:
+    """Response text of one result line; failed requests get a PROBLEMS FOUND text like analyze_event_with_gemini."""
+    try:
+        return item['response']['candidates'][0]['content']['parts'][0]['text'].strip()
+    except (KeyError, IndexError, TypeError):
+        return f"PROBLEMS FOUND:\nAPI Error: {item.get('error', 'no response')}"
+
+
+def index_batch_results(results_file: str) -> Dict[str, int]:
+    """
+    Map the key of every result line to its byte offset. Batch results do
+    not come back in request order, but only the offsets are kept in
+    memory; the responses are read from disk when they are merged.
+    """
+    offsets = {}
+    offset = 0
+    with open(results_file, 'rb') as f:
+        for line in iter(f.readline, b''):
+            if line.strip():
+                offsets[json.loads(line).get("key")] = offset
+            offset += len(line)
+    return offsets
+
+
+def read_batch_response(f: BinaryIO, offset: int) -> str:
+    """Read the response text of the result line at `offset`."""
+    f.seek(offset)
+    return _response_text(json.loads(f.readline()))
+
+
+def merge_results(input_file: str = INPUT_FILE, results_file: str = BATCH_OUTPUT_FILE,
+                  output_file: str = OUTPUT_FILE) -> None:
+    """
+    Combine rule-parsed events and batch responses into the events JSON,
+    in input order; problem events go to problems.txt. Events are streamed
+    to the JSONL file of events_to_json.py and compacted at the end.
+    """
+    offsets = index_batch_results(results_file)
+    output = ResumableOutput(
+        input_file,
+        jsonl_path(output_file),
+        checkpoint_path(output_file),
+        PROBLEMS_FILE,
+        resume=False,
+    )
+
+    missing_count = 0
+    with output, open(results_file, 'rb') as results:
+        for event in iter_events(input_file):
+            event_data = parse_event(event.text) if RULES_FAST_PATH else None
+            if event_data is None:
+                offset = offsets.get(event_key(event))
+                if offset is None:
+                    missing_count += 1
+                    response = f"PROBLEMS FOUND:\nNo batch result for {event_key(event)}\n\nOriginal event:\n{event.text}"
+                else:
+                    response = read_batch_response(results, offset)
+                event_data = parse_gemini_response(response)
+            if event_data:
+                output.add_event(event, event_data)
+            else:
+                if response.startswith("PROBLEMS FOUND:\nAPI Error:"):
+                    response += f"\n\nOriginal event:\n{event.text}"
+                append_problem_to_file(response, PROBLEMS_FILE)
+                output.add_problem(event)
+
+    print(f"  Successful: {output.written}")
+    print(f"  Problems: {output.problems} ({missing_count} without batch result)")
+    count = compact_jsonl_to_json(output.jsonl_file, output_file)
+    print(f"Successfully saved {count} events to {output_file}")
+
+
+class FakeBatchClient:
+    """
+    Offline stand-in for genai.Client with the files/batches calls used above.
+    Jobs finish after `polls_until_done` status checks; each request is
+    answered by `responder(user_text)`.
+    """
+
+    def __init__(self, responder: Optional[Callable[[str], str]] = None, polls_until_done: int = 1):
+        self.responder = responder or self.default_responder
+        self.polls_until_done = polls_until_done
+        self._files: Dict[str, bytes] = {}
+        self._jobs: Dict[str, Dict] = {}
+        self.files = SimpleNamespace(upload=self._upload, download=self._download)
+        self.batches = SimpleNamespace(create=self._create, get=self._get)
+
+    @staticmethod
+    def default_responder(user_text: str) -> str:
+        event_text = user_text.split("Event text:\n", 1)[-1]
+        event_data = parse_event(event_text)
+        if event_data is None:
+            return f"PROBLEMS FOUND:\nNot recognized by the fake client\n\n{event_text}"
+        return json.dumps(event_data, ensure_ascii=False)
+
+    def _upload(self, file: str, config: Optional[Dict] = None):
+        name = f"files/fake-{len(self._files) + 1}"
+        with open(file, 'rb') as f:
+            self._files[name] = f.read()
+        return SimpleNamespace(name=name)
+
+    def _download(self, file: str) -> bytes:
+        return self._files[file]
+
+    def _create(self, model: str, src: str, config: Optional[Dict] = None):
+        name = f"batches/fake-{len(self._jobs) + 1}"
+        self._jobs[name] = {"src": src, "polls": 0, "dest": None}
+        return SimpleNamespace(name=name)
+
+    def _get(self, name: str):
+        job = self._jobs[name]
+        job["polls"] += 1
+        if job["polls"] < self.polls_until_done:
+            return SimpleNamespace(name=name, state=SimpleNamespace(name='JOB_STATE_RUNNING'), dest=None, error=None)
+        if job["dest"] is None:
+            lines = []
+            for line in self._files[job["src"]].decode('utf-8').splitlines():
+                request = json.loads(line)
+                user_text = request["request"]["contents"][0]["parts"][0]["text"]
+                lines.append(json.dumps({
+                    "key": request["key"],
+                    "response": {"candidates": [{"content": {"parts": [{"text": self.responder(user_text)}]}}]}
+                }, ensure_ascii=False))
+            job["dest"] = f"files/fake-result-{name.rsplit('-', 1)[-1]}"
+            self._files[job["dest"]] = ('\n'.join(lines) + '\n').encode('utf-8')
+        return SimpleNamespace(
+            name=name,
+            state=SimpleNamespace(name='JOB_STATE_SUCCEEDED'),
+            dest=SimpleNamespace(file_name=job["dest"]),
+            error=None
+        )
+
+
+def make_client():
+    """Return a real genai.Client, or the fake one when USE_FAKE_CLIENT is set."""
+    if USE_FAKE_CLIENT:
+        return FakeBatchClient()
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        print("GEMINI_API_KEY not found.", file=sys.stderr)
+        sys.exit(1)
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+
+def main():
+    """Prepare, submit, wait for and merge an events batch job."""
+    if prepare_batch_file() == 0:
+        print("Nothing to send, all events were parsed by rules")
+        open(BATCH_OUTPUT_FILE, 'w').close()
+    else:
+        client = make_client()
+        job_name = submit_batch(client)
+        job = wait_for_batch(client, job_name, poll_interval=0 if USE_FAKE_CLIENT else POLL_INTERVAL)
+        if job is None:
+            sys.exit(1)
+        download_results(client, job)
+    merge_results()
+
+
+if __name__ == "__main__":
+    main()
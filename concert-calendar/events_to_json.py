@@ -5,19 +5,71 @@ Uses Gemini API for natural language processing of Estonian text.
 """
 
 import os
+import re
 import sys
 import json
+import random
+import threading
+from collections import OrderedDict, deque
+from itertools import tee
+from concurrent.futures import Future, ThreadPoolExecutor
 import google.generativeai as genai
-from typing import Dict, List, Optional
+from google.api_core import exceptions as google_exceptions
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import time
 
+from event_dedup import MinHashDeduplicator, comparable_text, extract_date_and_place
+from event_rules import parse_event
+from event_store import EventRecord, count_events, event_key, iter_events
+from llm_cache import LLMResponseCache
+from resumable_output import ResumableOutput, checkpoint_path, compact_jsonl_to_json, jsonl_path
+
 
 # Configuration
 INPUT_FILE = "test-events.txt"
 OUTPUT_FILE = "test-events.json"
 PROBLEMS_FILE = "problems.txt"
+MODEL_NAME = "gemini-2.5-flash-lite"
 DELAY_BETWEEN_REQUESTS = 1  # seconds, to avoid rate limiting
 
+# Parsed events are streamed to OUTPUT_FILE with .jsonl extension and the
+# finished input events recorded in a checkpoint, so an interrupted run
+# continues where it stopped. The JSON file is compacted from it at the end.
+RESUME = True  # False = start over, dropping earlier output and problems.txt
+CHECKPOINT_EVERY = 20  # events between checkpoints
+
+# Concurrent mode: a bounded worker pool sends several requests at once,
+# paced by request and token budgets instead of a fixed delay
+CONCURRENT_MODE = False
+MAX_WORKERS = 8
+REQUESTS_PER_MINUTE = 60
+TOKENS_PER_MINUTE = 250000
+CHARS_PER_TOKEN = 4  # rough estimate used to charge the token budget
+MAX_RETRIES = 5  # retries on 429 / 5xx responses
+BACKOFF_BASE = 1.0  # seconds, doubled on every retry
+BACKOFF_MAX = 60.0  # seconds
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# API errors without a code attribute still start with the HTTP status,
+# e.g. "429 Resource has been exhausted"
+STATUS_PREFIX_RE = re.compile(r'^\s*(\d{3})\b')
+
+# Rule-based fast path: events in the standard layout are parsed locally,
+# only the rest is sent to Gemini
+RULES_FAST_PATH = True
+
+# Near-duplicate events (repeat performances of the same concert) are sent
+# to Gemini once; the copies reuse the analysis with their own date and place
+DEDUP_ENABLED = True
+DEDUP_THRESHOLD = 0.85  # estimated Jaccard similarity of the texts without date/place lines
+DEDUP_WINDOW = 5000  # representatives kept for comparison
+
+# Response cache: unchanged events are not sent to Gemini again
+LLM_CACHE_ENABLED = True
+LLM_CACHE_FILE = "llm_cache.sqlite"
+LLM_CACHE_MAX_ENTRIES = 100000  # least recently used entries are evicted above this
+LLM_CACHE_BYPASS = False  # ignore cached responses (new responses are still stored)
+LLM_CACHE_INVALIDATE_PROMPT = False  # drop cached responses of the current SYSTEM_PROMPT at startup
+
 # Test mode
 TEST_MODE = True
 TEST_EVENT = """Neujahrskonzert
@@ -38,11 +90,6 @@ theater-kr-mg.de (https://theater-kr-mg.de/spielplan/neujahrskonzert/)"""
 
 # Gemini API configuration
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    print("Error: GEMINI_API_KEY environment variable not set", file=sys.stderr)
-    sys.exit(1)
-
-genai.configure(api_key=GEMINI_API_KEY)
 
 # System prompt for Gemini
 SYSTEM_PROMPT = """Analyse given musical event, that is mostly a concert, and return the information in json format:  
@@ -75,23 +122,9 @@ All fields do not need to be filled. If there is doubt, return string that start
 IMPORTANT: Return ONLY valid JSON or the PROBLEMS FOUND message. Do not include any markdown formatting, code blocks, or explanatory text."""
 
 
-def read_events_from_file(filename: str) -> List[str]:
-    """
-    Read events from text file, split by #### delimiter.
-    """
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Split by delimiter and filter out empty entries
-        events = [event.strip() for event in content.split('####') if event.strip()]
-        return events
-    except FileNotFoundError:
-        print(f"Error: File '{filename}' not found", file=sys.stderr)
-        sys.exit(1)
-    except IOError as e:
-        print(f"Error reading file '{filename}': {e}", file=sys.stderr)
-        sys.exit(1)
+def build_prompt(event_text: str) -> str:
+    """Build the full prompt sent to Gemini for one event."""
+    return f"{SYSTEM_PROMPT}\n\nEvent text:\n{event_text}"
 
 
 def analyze_event_with_gemini(event_text: str, model) -> str:
@@ -100,14 +133,169 @@ def analyze_event_with_gemini(event_text: str, model) -> str:
     Returns the response as string.
     """
     try:
-        prompt = f"{SYSTEM_PROMPT}\n\nEvent text:\n{event_text}"
-        response = model.generate_content(prompt)
+        response = model.generate_content(build_prompt(event_text))
         return response.text.strip()
     except Exception as e:
         print(f"Error calling Gemini API: {e}", file=sys.stderr)
         return f"PROBLEMS FOUND:\nAPI Error: {str(e)}\n\nOriginal event:\n{event_text}"
 
 
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `per_minute` tokens
+    per minute, holding at most one minute's worth of tokens.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> None:
+        """Block until `amount` tokens are available and take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Return True for rate limit (429) and server side (5xx) errors."""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    # Other exceptions may echo event text or ids, their messages are not
+    # searched for status codes
+    if not isinstance(error, google_exceptions.GoogleAPIError):
+        return False
+    message = str(error)
+    match = STATUS_PREFIX_RE.match(message)
+    if match:
+        return int(match.group(1)) in RETRYABLE_STATUS_CODES
+    return re.search(r'\bRESOURCE_EXHAUSTED\b', message) is not None
+
+
+def analyze_event_with_retry(event_text: str, model, request_bucket: TokenBucket,
+                             token_bucket: TokenBucket) -> str:
+    """
+    Like analyze_event_with_gemini, but waits for the request/token budget
+    and retries 429 / 5xx errors with jittered exponential backoff.
+    """
+    prompt = build_prompt(event_text)
+    estimated_tokens = len(prompt) / CHARS_PER_TOKEN
+    for attempt in range(MAX_RETRIES + 1):
+        request_bucket.acquire(1)
+        token_bucket.acquire(estimated_tokens)
+        try:
+            response = model.generate_content(prompt)
+            return response.text.strip()
+        except Exception as e:
+            if attempt < MAX_RETRIES and is_retryable_error(e):
+                # Full jitter: spreads the retries of all workers over the window
+                wait_time = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                print(f"  Retryable API error ({e}), retrying in {wait_time:.1f}s", file=sys.stderr)
+                time.sleep(wait_time)
+                continue
+            print(f"Error calling Gemini API: {e}", file=sys.stderr)
+            return f"PROBLEMS FOUND:\nAPI Error: {str(e)}\n\nOriginal event:\n{event_text}"
+
+
+def is_api_error(response: str) -> bool:
+    """Return True for the PROBLEMS FOUND text produced on API failures."""
+    return response.startswith("PROBLEMS FOUND:\nAPI Error:")
+
+
+def store_in_cache(cache: Optional[LLMResponseCache], event_text: str, response: str) -> str:
+    """Cache a model response (but not an API failure) and return it."""
+    if cache is not None and not is_api_error(response):
+        cache.put(event_text, response)
+    return response
+
+
+def analyze_events_sequentially(events: Iterable[str], model,
+                                cache: Optional[LLMResponseCache] = None) -> Iterator[str]:
+    """Yield Gemini responses one event at a time, pausing between requests."""
+    called_api = False
+    for event_text in events:
+        cached = cache.get(event_text) if cache is not None else None
+        if cached is not None:
+            yield cached
+            continue
+        if called_api:
+            time.sleep(DELAY_BETWEEN_REQUESTS)
+        called_api = True
+        yield store_in_cache(cache, event_text, analyze_event_with_gemini(event_text, model))
+
+
+def analyze_events_concurrently(events: Iterable[str], model,
+                                cache: Optional[LLMResponseCache] = None) -> Iterator[str]:
+    """
+    Yield Gemini responses in input order while up to MAX_WORKERS requests
+    run in parallel. At most 2 * MAX_WORKERS events are in flight, so memory
+    does not grow with the number of events.
+    """
+    request_bucket = TokenBucket(REQUESTS_PER_MINUTE)
+    token_bucket = TokenBucket(TOKENS_PER_MINUTE)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for event_text in events:
+            cached = cache.get(event_text) if cache is not None else None
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+            else:
+                future = executor.submit(
+                    lambda text: store_in_cache(
+                        cache, text, analyze_event_with_retry(text, model, request_bucket, token_bucket)
+                    ),
+                    event_text
+                )
+            pending.append(future)
+            if len(pending) >= 2 * MAX_WORKERS:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_events_with_rules(events: Iterable[EventRecord]) -> Iterator[Tuple[EventRecord, Optional[Dict]]]:
+    """
+    Run the rule-based parser over a stream of events.
+    Yields (event, parsed dict), or (event, None) for events left to Gemini.
+    """
+    for event in events:
+        yield event, parse_event(event.text) if RULES_FAST_PATH else None
+
+
+def mark_duplicates(stream: Iterable[Tuple[EventRecord, Optional[Dict]]],
+                    deduplicator: MinHashDeduplicator) -> Iterator[Tuple[EventRecord, Optional[Dict], Optional[str]]]:
+    """
+    Yields (event, rule data, key of the representative) for the rule parser
+    output. The representative key is set for near-duplicates of an earlier
+    event sent to Gemini; such events are not sent again.
+    """
+    for event, rule_data in stream:
+        duplicate_of = None
+        if rule_data is None and extract_date_and_place(event.text) is not None:
+            duplicate_of = deduplicator.find_or_add(event_key(event), comparable_text(event.text))
+        yield event, rule_data, duplicate_of
+
+
+def apply_representative(event_text: str, representative_data: Dict) -> Dict:
+    """Copy a representative's analysis, with date, time and place taken from the duplicate."""
+    event_data = dict(representative_data)
+    event_data.update(extract_date_and_place(event_text))
+    return event_data
+
+
 def parse_gemini_response(response: str) -> Optional[Dict]:
     """
     Parse Gemini response. 
@@ -139,12 +327,12 @@ def parse_gemini_response(response: str) -> Optional[Dict]:
         return None
 
 
-def append_problem_to_file(problem_text: str) -> None:
+def append_problem_to_file(problem_text: str, filename: str = PROBLEMS_FILE) -> None:
     """
     Append problem event to problems.txt file.
     """
     try:
-        with open(PROBLEMS_FILE, 'a', encoding='utf-8') as f:
+        with open(filename, 'a', encoding='utf-8') as f:
             f.write(problem_text)
             f.write('\n####\n')
     except IOError as e:
@@ -165,6 +353,149 @@ def save_events_to_json(events: List[Dict], filename: str) -> None:
         sys.exit(1)
 
 
+def create_model():
+    """Configure the Gemini API and return the model."""
+    if not GEMINI_API_KEY:
+        print("Error: GEMINI_API_KEY environment variable not set", file=sys.stderr)
+        sys.exit(1)
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(MODEL_NAME)
+
+
+def open_cache() -> Optional[LLMResponseCache]:
+    """Open the response cache, or return None if it is disabled."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    cache = LLMResponseCache(
+        LLM_CACHE_FILE,
+        SYSTEM_PROMPT,
+        MODEL_NAME,
+        max_entries=LLM_CACHE_MAX_ENTRIES,
+        bypass=LLM_CACHE_BYPASS,
+    )
+    if LLM_CACHE_INVALIDATE_PROMPT:
+        print(f"Invalidated {cache.invalidate_prompt()} cached responses for the current prompt")
+    return cache
+
+
+def open_output(input_file: str = INPUT_FILE) -> ResumableOutput:
+    """Open the resumable JSONL output of OUTPUT_FILE."""
+    output = ResumableOutput(
+        input_file,
+        jsonl_path(OUTPUT_FILE),
+        checkpoint_path(OUTPUT_FILE),
+        PROBLEMS_FILE,
+        resume=RESUME,
+        checkpoint_every=CHECKPOINT_EVERY,
+    )
+    if output.resumed_from:
+        print(f"Resuming after event {output.resumed_from} ({output.last_key})")
+    return output
+
+
+def process_events(events: Iterable[EventRecord], model, cache: Optional[LLMResponseCache],
+                   output: ResumableOutput, total: Optional[int] = None) -> None:
+    """
+    Analyze a stream of events in order and write the results to `output`.
+    `events` must not contain the events already done in an earlier run.
+    """
+    # The rule results are shared between this loop and the Gemini stream,
+    # which only sees the events rules missed
+    stream = parse_events_with_rules(events)
+    deduplicator = None
+    if DEDUP_ENABLED:
+        deduplicator = MinHashDeduplicator(threshold=DEDUP_THRESHOLD, window=DEDUP_WINDOW)
+        stream = mark_duplicates(stream, deduplicator)
+    else:
+        stream = ((event, rule_data, None) for event, rule_data in stream)
+    main_stream, llm_stream = tee(stream)
+    llm_events = (event.text for event, rule_data, duplicate_of in llm_stream
+                  if rule_data is None and duplicate_of is None)
+    
+    if CONCURRENT_MODE:
+        print(f"Concurrent mode: {MAX_WORKERS} workers, {REQUESTS_PER_MINUTE} requests/min, "
+              f"{TOKENS_PER_MINUTE} tokens/min")
+        responses = analyze_events_concurrently(llm_events, model, cache)
+    else:
+        responses = analyze_events_sequentially(llm_events, model, cache)
+    
+    rule_count = 0
+    duplicate_count = 0
+    representatives = OrderedDict()  # key -> analysis of events that may have duplicates
+    start_time = time.perf_counter()
+    
+    # Process each event; responses arrive in input order in both modes
+    with output:
+        for i, (event, rule_data, duplicate_of) in enumerate(main_stream, output.resumed_from + 1):
+            print(f"Processing event {i}/{total or '?'}...")
+            
+            if rule_data is not None:
+                rule_count += 1
+                output.add_event(event, rule_data)
+                print(f"  ✓ Parsed by rules")
+                continue
+            
+            if duplicate_of is not None:
+                duplicate_count += 1
+                representative_data = representatives.get(duplicate_of)
+                if representative_data:
+                    output.add_event(event, apply_representative(event.text, representative_data))
+                    print(f"  ✓ Duplicate of {duplicate_of}, reused its analysis")
+                else:
+                    append_problem_to_file(f"PROBLEMS FOUND:\nDuplicate of {duplicate_of}, "
+                                           f"which could not be analyzed\n\nOriginal event:\n{event.text}")
+                    output.add_problem(event)
+                    print(f"  ✗ Duplicate of a problem event, saved to {PROBLEMS_FILE}")
+                continue
+            
+            # Parse response
+            response = next(responses)
+            event_data = parse_gemini_response(response)
+            
+            if deduplicator is not None and deduplicator.is_representative(event_key(event)):
+                representatives[event_key(event)] = event_data
+                if len(representatives) > DEDUP_WINDOW:
+                    representatives.popitem(last=False)
+            
+            if event_data:
+                # Successfully parsed
+                output.add_event(event, event_data)
+                print(f"  ✓ Successfully analyzed")
+            else:
+                # Problem found
+                append_problem_to_file(response)
+                output.add_problem(event)
+                print(f"  ✗ Problem found, saved to {PROBLEMS_FILE}")
+    
+    processed = output.events_done - output.resumed_from
+    elapsed = time.perf_counter() - start_time
+    print()
+    print(f"Processing completed!")
+    print(f"  Successful: {output.written}")
+    print(f"  Problems: {output.problems}")
+    if RULES_FAST_PATH and processed:
+        print(f"  Rule-based parser: {rule_count}/{processed} events ({100.0 * rule_count / processed:.1f}%)")
+    if deduplicator is not None and deduplicator.checked:
+        print(f"  Near-duplicates: {duplicate_count}/{deduplicator.checked} events sent to analysis "
+              f"({100.0 * duplicate_count / deduplicator.checked:.1f}%), {duplicate_count} API calls saved")
+    if processed:
+        print(f"  {processed / elapsed:.1f} events/s")
+    if cache is not None:
+        print(f"  Cache: {cache.hits} hits, {cache.misses} misses (API calls)")
+
+
+def compact_output(output: ResumableOutput) -> None:
+    """Compact the JSONL output (this and earlier runs) into OUTPUT_FILE."""
+    if os.path.getsize(output.jsonl_file) > 0:
+        count = compact_jsonl_to_json(output.jsonl_file, OUTPUT_FILE)
+        print(f"Successfully saved {count} events to {OUTPUT_FILE}")
+    else:
+        print("No events to save to JSON file")
+    
+    if os.path.exists(PROBLEMS_FILE):
+        print(f"  Problem events saved to {PROBLEMS_FILE}")
+
+
 def main():
     """Main function to process events."""
     print("Starting event analysis with Gemini API...")
@@ -172,58 +503,28 @@ def main():
     print(f"Output file: {OUTPUT_FILE}")
     print()
     
-    # Initialize Gemini model
-    model = genai.GenerativeModel('gemini-2.5-flash-lite')
+    model = create_model()
+    cache = open_cache()
     
-    # Clear problems file if it exists
-    if os.path.exists(PROBLEMS_FILE):
-        os.remove(PROBLEMS_FILE)
-    
-    # Read events from file
-    events = read_events_from_file(INPUT_FILE)
-    print(f"Found {len(events)} events to process")
-    print()
-    
-    successful_events = []
-    problem_count = 0
-    
-    # Process each event
-    for i, event_text in enumerate(events, 1):
-        print(f"Processing event {i}/{len(events)}...")
-        
-        # Get analysis from Gemini
-        response = analyze_event_with_gemini(event_text, model)
-        
-        # Parse response
-        event_data = parse_gemini_response(response)
-        
-        if event_data:
-            # Successfully parsed
-            successful_events.append(event_data)
-            print(f"  ✓ Successfully analyzed")
-        else:
-            # Problem found
-            problem_count += 1
-            append_problem_to_file(response)
-            print(f"  ✗ Problem found, saved to {PROBLEMS_FILE}")
-        
-        # Delay between requests
-        if i < len(events):
-            time.sleep(DELAY_BETWEEN_REQUESTS)
+    if not os.path.exists(INPUT_FILE):
+        print(f"Error: File '{INPUT_FILE}' not found", file=sys.stderr)
+        sys.exit(1)
+    total = count_events(INPUT_FILE)
+    print(f"Found {total} events to process")
     
+    output = open_output()
     print()
-    print(f"Processing completed!")
-    print(f"  Successful: {len(successful_events)}")
-    print(f"  Problems: {problem_count}")
     
-    # Save successful events to JSON
-    if successful_events:
-        save_events_to_json(successful_events, OUTPUT_FILE)
-    else:
-        print("No events to save to JSON file")
+    # Events are streamed from the file; if it changed since the checkpoint
+    # the output was reset and all events are processed again
+    pending = output.resume(iter_events(INPUT_FILE))
+    if pending is None:
+        pending = iter_events(INPUT_FILE)
+    process_events(pending, model, cache, output, total)
+    if cache is not None:
+        cache.close()
     
-    if problem_count > 0:
-        print(f"  Problem events saved to {PROBLEMS_FILE}")
+    compact_output(output)
 
 
 if __name__ == "__main__":
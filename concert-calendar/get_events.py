@@ -8,7 +8,14 @@ import requests
 from bs4 import BeautifulSoup
 import time
 import sys
-from typing import List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import html_extract
+from event_store import EventWriter
+from page_cache import PageCache
 
 
 BASE_URL = "https://www.emic.ee/"
@@ -16,19 +23,147 @@ CALENDAR_URL = BASE_URL + "muusikasundmuste-kalender&year={year}"
 YEARS = range(2014, 2026)  # 2014 to 2025 inclusive
 DELAY_BETWEEN_REQUESTS = 0.25  # seconds, to be polite to the server
 
+# Concurrent crawler mode: fetch event pages in parallel over a pooled
+# keep-alive session instead of sleeping after every request
+CONCURRENT_MODE = False
+MAX_IN_FLIGHT_PER_HOST = 4  # max simultaneous requests to one host
+REQUESTS_PER_SECOND_PER_HOST = 4.0  # politeness budget per host
+PARALLEL_YEARS = 3  # how many calendar years are crawled at the same time
+
+# On-disk page cache with conditional GET (ETag / Last-Modified)
+CACHE_ENABLED = True
+CACHE_DIR = ".page_cache"
+CACHE_MAX_BYTES = 500 * 1024 * 1024  # least recently used pages are evicted above this
+CACHE_MAX_AGE = 0  # seconds a page of a recent year is used without revalidation
+CACHE_FROZEN_AFTER_YEARS = 1  # pages of years older than this are never revalidated
+
+# HTML extraction backend: 'bs4' (BeautifulSoup tree) or 'stream'
+# (single-pass tokenizer in html_extract.py, same output, less CPU)
+EXTRACTION_BACKEND = "stream"
+
+
+class HostThrottle:
+    """
+    Per-host politeness budget: limits the number of requests in flight
+    and spaces request starts to at most `requests_per_second`.
+    Used as a context manager around a single request.
+    """
+
+    def __init__(self, max_in_flight: int, requests_per_second: float):
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start)
+            self._next_start = start_at + self._interval
+        wait = start_at - now
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._slots.release()
+        return False
+
+
+_session = None
+_session_lock = threading.Lock()
+_throttles: Dict[str, HostThrottle] = {}
+_throttles_lock = threading.Lock()
+
+
+_page_cache = None
+
+
+def get_page_cache() -> Optional[PageCache]:
+    """Return the shared page cache, or None if caching is disabled."""
+    global _page_cache
+    if not CACHE_ENABLED:
+        return None
+    with _session_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(
+                CACHE_DIR,
+                max_bytes=CACHE_MAX_BYTES,
+                max_age=CACHE_MAX_AGE,
+                frozen_after_years=CACHE_FROZEN_AFTER_YEARS,
+            )
+        return _page_cache
+
+
+def is_cached_fresh(url: str, year: int = None) -> bool:
+    """Return True if the page can be served from the cache without any network traffic."""
+    cache = get_page_cache()
+    return cache is not None and cache.is_fresh(cache.lookup(url), year)
+
+
+def get_session() -> requests.Session:
+    """Return the shared keep-alive session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=MAX_IN_FLIGHT_PER_HOST,
+                pool_maxsize=MAX_IN_FLIGHT_PER_HOST,
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
 
-def get_page_content(url: str) -> str:
-    """Fetch page content from URL."""
+def get_host_throttle(url: str) -> HostThrottle:
+    """Return the politeness throttle shared by all requests to the host of `url`."""
+    host = urlsplit(url).netloc
+    with _throttles_lock:
+        throttle = _throttles.get(host)
+        if throttle is None:
+            throttle = HostThrottle(MAX_IN_FLIGHT_PER_HOST, REQUESTS_PER_SECOND_PER_HOST)
+            _throttles[host] = throttle
+        return throttle
+
+
+def get_page_content(url: str, session: Optional[requests.Session] = None, year: int = None) -> str:
+    """
+    Fetch page content from URL.
+    If a session is given, the request reuses its pooled connections.
+    With the page cache enabled, fresh pages are served from disk and
+    stale ones are revalidated with a conditional GET; `year` selects
+    the freshness policy of the page.
+    """
+    cache = get_page_cache()
+    entry = cache.lookup(url) if cache else None
+    if entry and cache.is_fresh(entry, year):
+        return cache.read(entry)
+    headers = cache.conditional_headers(entry) if cache else {}
+    
     try:
-        response = requests.get(url, timeout=10)
+        if session is not None:
+            response = session.get(url, timeout=10, headers=headers)
+        else:
+            response = requests.get(url, timeout=10, headers=headers)
+        if response.status_code == 304 and entry:
+            return cache.read(entry, revalidated=True)
         response.raise_for_status()
+        if cache:
+            cache.store(
+                url,
+                response.text,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+            )
         return response.text
     except requests.RequestException as e:
         print(f"Error fetching {url}: {e}", file=sys.stderr)
         return ""
 
 
-def extract_event_links(html_content: str) -> List[Tuple[str, str]]:
+def extract_event_links_bs4(html_content: str) -> List[Tuple[str, str]]:
     """
     Extract event links from calendar page.
     Returns list of tuples: (event_url, event_title)
@@ -52,7 +187,7 @@ def extract_event_links(html_content: str) -> List[Tuple[str, str]]:
     return event_links
 
 
-def extract_event_content(html_content: str) -> str:
+def extract_event_content_bs4(html_content: str) -> str:
     """
     Extract event content from individual event page.
     Returns the text content from main-content div, excluding h1 and 'Tagasi' link.
@@ -89,6 +224,30 @@ def extract_event_content(html_content: str) -> str:
     return content.strip()
 
 
+def extract_event_links_stream(html_content: str) -> List[Tuple[str, str]]:
+    """Streaming version of extract_event_links_bs4, see html_extract.py."""
+    return html_extract.extract_event_links(html_content, BASE_URL)
+
+
+EXTRACTION_BACKENDS = {
+    "bs4": (extract_event_links_bs4, extract_event_content_bs4),
+    "stream": (extract_event_links_stream, html_extract.extract_event_content),
+}
+
+
+def extract_event_links(html_content: str) -> List[Tuple[str, str]]:
+    """
+    Extract event links from calendar page with the configured backend.
+    Returns list of tuples: (event_url, event_title)
+    """
+    return EXTRACTION_BACKENDS[EXTRACTION_BACKEND][0](html_content)
+
+
+def extract_event_content(html_content: str) -> str:
+    """Extract event content from event page with the configured backend."""
+    return EXTRACTION_BACKENDS[EXTRACTION_BACKEND][1](html_content)
+
+
 def scrape_year(year: int, limit: int = None) -> List[str]:
     """
     Scrape all events for a given year.
@@ -102,7 +261,7 @@ def scrape_year(year: int, limit: int = None) -> List[str]:
     
     # Get calendar page for the year
     calendar_url = CALENDAR_URL.format(year=year)
-    html_content = get_page_content(calendar_url)
+    html_content = get_page_content(calendar_url, year=year)
     
     if not html_content:
         print(f"  Failed to fetch calendar for {year}")
@@ -123,18 +282,88 @@ def scrape_year(year: int, limit: int = None) -> List[str]:
     for i, (event_url, event_title) in enumerate(event_links, 1):
         print(f"  Fetching event {i}/{len(event_links)}: {event_title}")
         
-        event_html = get_page_content(event_url)
+        from_cache = is_cached_fresh(event_url, year)
+        event_html = get_page_content(event_url, year=year)
         if event_html:
             content = extract_event_content(event_html)
             if content:
                 events_content.append(content)
         
-        # Be polite to the server
-        time.sleep(DELAY_BETWEEN_REQUESTS)
+        # Be polite to the server (pages served from the cache cost it nothing)
+        if not from_cache:
+            time.sleep(DELAY_BETWEEN_REQUESTS)
+    
+    return events_content
+
+
+def fetch_page_throttled(url: str, year: int = None) -> str:
+    """Fetch a page over the shared session, respecting the per-host budget."""
+    if is_cached_fresh(url, year):
+        return get_page_content(url, year=year)
+    with get_host_throttle(url):
+        return get_page_content(url, session=get_session(), year=year)
+
+
+def scrape_year_concurrent(year: int, executor: ThreadPoolExecutor, limit: int = None) -> List[str]:
+    """
+    Scrape all events for a given year, fetching event pages concurrently.
+    Returns list of event contents in the same order as scrape_year().
+    
+    Args:
+        year: The year to scrape
+        executor: Thread pool used for fetching the event pages
+        limit: Maximum number of events to scrape (for testing)
+    """
+    print(f"Scraping events for year {year}...")
+    
+    calendar_url = CALENDAR_URL.format(year=year)
+    html_content = fetch_page_throttled(calendar_url, year)
+    
+    if not html_content:
+        print(f"  Failed to fetch calendar for {year}")
+        return []
+    
+    event_links = extract_event_links(html_content)
+    print(f"  Found {len(event_links)} events")
+    
+    if limit:
+        event_links = event_links[:limit]
+        print(f"  Processing only first {limit} events (test mode)")
+    
+    # executor.map yields results in submission order, so the output
+    # order does not depend on which request finishes first
+    event_urls = [event_url for event_url, _ in event_links]
+    events_content = []
+    years = [year] * len(event_urls)
+    for event_html in executor.map(fetch_page_throttled, event_urls, years):
+        if event_html:
+            content = extract_event_content(event_html)
+            if content:
+                events_content.append(content)
+    print(f"  Fetched {len(event_urls)} event pages for {year}")
     
     return events_content
 
 
+def crawl_concurrent(years=YEARS, limit: int = None,
+                     parallel_years: int = PARALLEL_YEARS) -> Dict[int, List[str]]:
+    """
+    Crawl several years in parallel.
+    Returns dict {year: [event contents]}; the per-host throttle keeps the
+    total request rate within the politeness budget regardless of how many
+    years are in progress.
+    """
+    # Page fetches get their own pool, so year workers waiting on their
+    # pages can never starve the fetchers
+    with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT_PER_HOST) as page_executor, \
+            ThreadPoolExecutor(max_workers=max(1, parallel_years)) as year_executor:
+        futures = {
+            year: year_executor.submit(scrape_year_concurrent, year, page_executor, limit)
+            for year in years
+        }
+        return {year: future.result() for year, future in futures.items()}
+
+
 def save_events_to_file(year: int, events: List[str], filename: str = "events.txt", mode: str = 'a') -> None:
     """
     Save events to a text file.
@@ -146,19 +375,26 @@ def save_events_to_file(year: int, events: List[str], filename: str = "events.tx
         mode: File open mode ('w' for write, 'a' for append)
     """
     try:
-        with open(filename, mode, encoding='utf-8') as f:
-            # Add year header
-            f.write(f"\n---------------- {year} ---------------------\n\n")
-            # Join events with delimiter
-            content = '\n####\n'.join(events)
-            f.write(content)
-            f.write('\n')
+        # The writer adds the year header and #### delimiters event by event
+        with EventWriter(filename, mode) as writer:
+            writer.start_year(year)
+            for event in events:
+                writer.write(year, event)
         
         print(f"  Saved {len(events)} events for year {year}")
     except IOError as e:
         print(f"  Error saving to file {filename}: {e}", file=sys.stderr)
 
 
+def print_cache_stats() -> None:
+    """Print page cache hit/revalidation/miss counters."""
+    cache = get_page_cache()
+    if cache:
+        stats = cache.stats
+        print(f"Page cache: {stats['hits']} hits, {stats['revalidated']} revalidated (304), "
+              f"{stats['misses']} downloaded, {stats['evicted']} evicted")
+
+
 def main():
     """Main function to scrape all years and save to a single file."""
     print("Starting EMIC concert events scraper...")
@@ -176,6 +412,24 @@ def main():
     except Exception:
         pass
     
+    if CONCURRENT_MODE:
+        print(f"Concurrent mode: {MAX_IN_FLIGHT_PER_HOST} in flight, "
+              f"{REQUESTS_PER_SECOND_PER_HOST} requests/s per host, {PARALLEL_YEARS} years in parallel")
+        start_time = time.perf_counter()
+        events_by_year = crawl_concurrent(YEARS)
+        print()
+        # Write in year order so events.txt is identical to the sequential run
+        for year in YEARS:
+            events = events_by_year[year]
+            if events:
+                save_events_to_file(year, events, filename=output_file, mode='a')
+            else:
+                print(f"  No events found for {year}")
+        print(f"Total runtime: {time.perf_counter() - start_time:.2f}s")
+        print_cache_stats()
+        print(f"Scraping completed! All events saved to {output_file}")
+        return
+    
     for year in YEARS:
         events = scrape_year(year)
         
@@ -190,6 +444,7 @@ def main():
         if year != YEARS.stop - 1:
             time.sleep(DELAY_BETWEEN_REQUESTS)
     
+    print_cache_stats()
     print(f"Scraping completed! All events saved to {output_file}")
 
 
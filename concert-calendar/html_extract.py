@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Streaming extraction backend for EMIC calendar and event pages.
+
+Produces the same output as the BeautifulSoup based extract_event_links /
+extract_event_content in get_events.py, but in a single pass over the
+html.parser token stream, without building or mutating a document tree.
+
+To stay byte-identical with BeautifulSoup's 'html.parser' tree builder,
+the scanner mirrors its rules:
+    - text is split into separate strings at every tag, comment or declaration
+    - end tags close the most recent open tag with the same name (and every
+      tag opened after it); end tags without an open tag are ignored
+    - empty-element tags (br, img, ...) are closed immediately
+    - text inside script/style/template/rt/rp and comments is not text content
+"""
+
+import re
+from collections import Counter
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution
+
+
+EMPTY_ELEMENT_TAGS = HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+STRING_CONTAINER_TAGS = set(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+
+_DECIMAL_REFERENCE_WITH_FOLLOWING_DATA = re.compile(r"^([0-9]+)(.*)")
+_HEX_REFERENCE_WITH_FOLLOWING_DATA = re.compile(r"^([0-9a-f]+)(.*)")
+
+
+def _dereference_charref(name: str) -> Tuple[str, str]:
+    """
+    Decode the number of a numeric character reference as BeautifulSoup
+    does: returns (character, data after the number that is plain text).
+    Unresolvable numbers become U+FFFD and C1 control numbers are read as
+    windows-1252, like the HTML spec's numeric character reference rules.
+    """
+    base, pattern = 10, _DECIMAL_REFERENCE_WITH_FOLLOWING_DATA
+    if name.startswith(("x", "X")):
+        name, base, pattern = name[1:], 16, _HEX_REFERENCE_WITH_FOLLOWING_DATA
+    extra_data = ""
+    try:
+        number = int(name, base)
+    except ValueError:
+        # A reference without ';' followed by ordinary text
+        match = pattern.search(name)
+        if match is None:
+            return "", name
+        number, extra_data = int(match.group(1), base), match.group(2)
+
+    if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+        return "\ufffd", extra_data
+    if 0x80 <= number <= 0x9F:
+        try:
+            return bytes([number]).decode("windows-1252"), extra_data
+        except UnicodeDecodeError:
+            pass
+    return chr(number), extra_data
+
+
+def _has_class(attrs: Dict[str, str], class_name: str) -> bool:
+    """Match a class the way BeautifulSoup's class_= filter does."""
+    value = attrs.get('class')
+    if value is None:
+        return False
+    return value == class_name or class_name in value.split()
+
+
+class _OpenTag:
+    """An element currently open on the scanner's tag stack."""
+    __slots__ = ('name', 'attrs')
+
+    def __init__(self, name: str, attrs: Dict[str, str]):
+        self.name = name
+        self.attrs = attrs
+
+
+class _TreeEventScanner(HTMLParser):
+    """
+    Base scanner that replays BeautifulSoup's tree building as events:
+    on_push / on_pop for elements, handle_string for text strings.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self._stack: List[_OpenTag] = []
+        self._open_counts = Counter()
+        self._containers = 0
+        self._data: List[str] = []
+        self._already_closed_empty: List[str] = []
+
+    # --- hooks for subclasses ---
+
+    def on_push(self, tag: _OpenTag) -> None:
+        pass
+
+    def on_pop(self, tag: _OpenTag) -> None:
+        pass
+
+    def handle_string(self, text: str) -> None:
+        pass
+
+    # --- tree building ---
+
+    def _flush(self) -> None:
+        if self._data:
+            text = ''.join(self._data)
+            self._data = []
+            if not self._containers:
+                self.handle_string(text)
+
+    def _pop_to(self, name: str) -> None:
+        while self._stack and self._open_counts[name]:
+            tag = self._stack.pop()
+            self._open_counts[tag.name] -= 1
+            if tag.name in STRING_CONTAINER_TAGS:
+                self._containers -= 1
+            self.on_pop(tag)
+            if tag.name == name:
+                break
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+        self._flush()
+        open_tag = _OpenTag(tag, attr_dict)
+        self._stack.append(open_tag)
+        self._open_counts[tag] += 1
+        if tag in STRING_CONTAINER_TAGS:
+            self._containers += 1
+        self.on_push(open_tag)
+        if handle_empty_element and tag in EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self._already_closed_empty.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self._already_closed_empty:
+            self._already_closed_empty.remove(tag)
+            return
+        self._flush()
+        self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        dereferenced, extra_data = _dereference_charref(name)
+        self.handle_data(dereferenced)
+        self.handle_data(extra_data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith("CDATA["):
+            # CDATA sections are text content, even inside script/style
+            self.handle_string(data[len("CDATA["):])
+
+    def close(self):
+        super().close()
+        self._flush()
+        while self._stack:
+            self._pop_to(self._stack[-1].name)
+
+
+class _EventLinkScanner(_TreeEventScanner):
+    """Collects (href, link text) of the first <a> in each excerpt's h2.post-title."""
+
+    def __init__(self):
+        super().__init__()
+        self.excerpts: List[Dict] = []
+        self._waiting_excerpts: List[Dict] = []
+        self._open_titles: List[Dict] = []
+        self._open_links: List[Dict] = []
+
+    def on_push(self, tag):
+        if tag.name == 'div' and _has_class(tag.attrs, 'post-item-excerpt'):
+            excerpt = {'tag': tag, 'title': None}
+            self.excerpts.append(excerpt)
+            self._waiting_excerpts.append(excerpt)
+        if tag.name == 'h2' and _has_class(tag.attrs, 'post-title') and self._waiting_excerpts:
+            title = {'tag': tag, 'link': None}
+            for excerpt in self._waiting_excerpts:
+                excerpt['title'] = title
+            self._waiting_excerpts = []
+            self._open_titles.append(title)
+        if tag.name == 'a':
+            for title in self._open_titles:
+                if title['link'] is None:
+                    link = {'tag': tag, 'href': tag.attrs.get('href'), 'text': []}
+                    title['link'] = link
+                    self._open_links.append(link)
+
+    def on_pop(self, tag):
+        self._waiting_excerpts = [e for e in self._waiting_excerpts if e['tag'] is not tag]
+        self._open_titles = [t for t in self._open_titles if t['tag'] is not tag]
+        self._open_links = [l for l in self._open_links if l['tag'] is not tag]
+
+    def handle_string(self, text):
+        if self._open_links:
+            text = text.strip()
+            if text:
+                for link in self._open_links:
+                    link['text'].append(text)
+
+
+class _EventContentScanner(_TreeEventScanner):
+    """Collects the text of div#main-content, with links as 'text (url)'."""
+
+    def __init__(self):
+        super().__init__()
+        self.strings: List[str] = []
+        self.found_main = False
+        self._main: Optional[_OpenTag] = None
+        self._heading_removed = False
+        self._skipped: Optional[_OpenTag] = None
+        self._link: Optional[_OpenTag] = None
+        self._link_text: List[str] = []
+
+    def on_push(self, tag):
+        if self._main is None:
+            if not self.found_main and tag.name == 'div' and tag.attrs.get('id') == 'main-content':
+                self._main = tag
+                self.found_main = True
+            return
+        if self._skipped is not None:
+            return
+        if not self._heading_removed and tag.name == 'h1' and _has_class(tag.attrs, 'entry-title'):
+            # The "Muusikasündmuste kalender" heading is dropped with its contents
+            self._heading_removed = True
+            self._skipped = tag
+            return
+        if tag.name == 'a' and self._link is None:
+            self._link = tag
+            self._link_text = []
+
+    def on_pop(self, tag):
+        if tag is self._skipped:
+            self._skipped = None
+        elif tag is self._link:
+            self._link = None
+            link_text = ''.join(self._link_text)
+            if link_text != 'Tagasi':
+                href = tag.attrs.get('href', '')
+                text = f"{link_text} ({href})" if href else link_text
+                text = text.strip()
+                if text:
+                    self.strings.append(text)
+        if tag is self._main:
+            self._main = None
+
+    def handle_string(self, text):
+        if self._main is None or self._skipped is not None:
+            return
+        text = text.strip()
+        if not text:
+            return
+        if self._link is not None:
+            self._link_text.append(text)
+        else:
+            self.strings.append(text)
+
+
+def extract_event_links(html_content: str, base_url: str) -> List[Tuple[str, str]]:
+    """
+    Extract event links from calendar page.
+    Returns list of tuples: (event_url, event_title)
+    """
+    scanner = _EventLinkScanner()
+    scanner.feed(html_content)
+    scanner.close()
+
+    event_links = []
+    for excerpt in scanner.excerpts:
+        title = excerpt['title']
+        link = title['link'] if title else None
+        if link and link['href']:
+            event_links.append((base_url + link['href'], ''.join(link['text'])))
+    return event_links
+
+
+def extract_event_content(html_content: str) -> str:
+    """
+    Extract event content from individual event page.
+    Returns the text content from main-content div, excluding h1 and 'Tagasi' link.
+    Links are converted to format: link_text (url)
+    """
+    scanner = _EventContentScanner()
+    scanner.feed(html_content)
+    scanner.close()
+
+    if not scanner.found_main:
+        return ""
+    return '\n'.join(scanner.strings).strip()
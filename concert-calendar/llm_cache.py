@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Persistent SQLite cache for LLM responses.
+
+Entries are keyed by a hash of (system prompt, model name, normalized input
+text), so a changed prompt or model never returns stale answers. The prompt
+hash is stored separately, so all entries of one prompt version can be
+invalidated at once.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normalize input text so that whitespace-only differences share a cache entry."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Thread-safe response cache with hit/miss counters and LRU eviction
+    once more than `max_entries` responses are stored.
+
+    With bypass=True lookups always miss, but new responses are still
+    stored, which refreshes the cache.
+    """
+
+    def __init__(self, path: str, system_prompt: str, model_name: str,
+                 max_entries: int = 100000, bypass: bool = False):
+        self.model_name = model_name
+        self.prompt_hash = prompt_hash(system_prompt)
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_prompt ON responses (prompt_hash)")
+        self._conn.commit()
+
+    def key(self, text: str) -> str:
+        data = "\x00".join((self.prompt_hash, self.model_name, normalize_text(text)))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, text: str) -> Optional[str]:
+        """Return the cached response for `text`, or None."""
+        with self._lock:
+            row = None
+            if not self.bypass:
+                key = self.key(text)
+                row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, text: str, response: str) -> None:
+        """Store a response and evict the least recently used entries if over the limit."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, prompt_hash, model, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(text), self.prompt_hash, self.model_name, response, now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def invalidate_prompt(self, system_prompt: Optional[str] = None) -> int:
+        """Delete all entries of a prompt version (the current one by default)."""
+        target = prompt_hash(system_prompt) if system_prompt is not None else self.prompt_hash
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM responses WHERE prompt_hash = ?", (target,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def purge_other_prompts(self) -> int:
+        """Delete entries of every prompt version except the current one."""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM responses WHERE prompt_hash != ?", (self.prompt_hash,)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Load parsed concert events into MariaDB.
+
+Streams the events written by events_to_json.py (the .jsonl output if it
+exists, otherwise the {"events": [...]} file) into the events table with
+batched multi-row INSERTs. The free-form date and time strings from Gemini
+are normalized to DATE / TIME columns; the original strings are kept too.
+
+Rows are keyed by a SHA-256 hash of the event content, so loading the same
+file again changes nothing and an edited event becomes a new row.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import mysql.connector
+
+from event_rules import EVENT_FIELDS, parse_time
+from resumable_output import iter_jsonl_events, jsonl_path
+
+
+# Configuration
+INPUT_FILE = "test-events.json"
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'emic',
+    'password': 'tobias',
+    'database': 'emic'
+}
+TABLE_NAME = 'kontserdid'
+BATCH_SIZE = 1000  # rows per multi-row INSERT and transaction
+
+CREATE_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+    id INT UNSIGNED NOT NULL AUTO_INCREMENT,
+    content_hash CHAR(64) NOT NULL,
+    title VARCHAR(500) NOT NULL DEFAULT '',
+    event_date DATE NULL,
+    event_time TIME NULL,
+    date_text VARCHAR(100) NOT NULL DEFAULT '',
+    time_text VARCHAR(100) NOT NULL DEFAULT '',
+    location TEXT,
+    performers TEXT,
+    program TEXT,
+    description TEXT,
+    tickets TEXT,
+    link VARCHAR(1000) NOT NULL DEFAULT '',
+    other_info TEXT,
+    loaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    UNIQUE KEY content_hash (content_hash),
+    KEY event_date (event_date)
+) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+COLUMNS = ["content_hash", "title", "event_date", "event_time", "date_text", "time_text",
+           "location", "performers", "program", "description", "tickets", "link", "other_info"]
+
+ESTONIAN_MONTHS = {
+    "jaanuar": 1, "veebruar": 2, "märts": 3, "aprill": 4, "mai": 5, "juuni": 6,
+    "juuli": 7, "august": 8, "september": 9, "oktoober": 10, "november": 11, "detsember": 12,
+}
+
+ISO_DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+DOTTED_DATE_RE = re.compile(r'(\d{1,2})\.\s?(\d{1,2})\.\s?(\d{4})')
+WORD_DATE_RE = re.compile(r'(\d{1,2})\.?(?:\s*[–-]\s*\d{1,2}\.?)?\s+([a-zõäöü]+)\s+(\d{4})', re.IGNORECASE)
+CLOCK_RE = re.compile(r'(?<![\d.:-])(\d{1,2})[:.](\d{2})(?::(\d{2}))?(?![\d.:])')
+HOUR_ONLY_RE = re.compile(r'^(?:kell\s+)?(\d{1,2})(?:\s*[–-]\s*\d{1,2}(?:[:.]\d{2})?)?$', re.IGNORECASE)
+
+
+def _valid_date(year: int, month: int, day: int) -> Optional[str]:
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def normalize_date(value: str) -> Optional[str]:
+    """
+    Free-form date -> YYYY-MM-DD, or None.
+    Accepts ISO dates (optionally with a time), dd.mm.yyyy and '1. jaanuar 2025';
+    for date ranges the first date is used.
+    """
+    value = (value or "").strip()
+    candidates = []
+    for regex, order in ((ISO_DATE_RE, "ymd"), (DOTTED_DATE_RE, "dmy")):
+        match = regex.search(value)
+        if match:
+            parts = dict(zip(order, (int(part) for part in match.groups())))
+            candidates.append((match.start(), parts["y"], parts["m"], parts["d"]))
+    match = WORD_DATE_RE.search(value)
+    if match and match.group(2).lower() in ESTONIAN_MONTHS:
+        candidates.append((match.start(), int(match.group(3)),
+                           ESTONIAN_MONTHS[match.group(2).lower()], int(match.group(1))))
+    for _, year, month, day in sorted(candidates):
+        date = _valid_date(year, month, day)
+        if date:
+            return date
+    return None
+
+
+def normalize_time(value: str) -> Optional[str]:
+    """
+    Free-form time -> HH:MM:SS, or None.
+    Accepts hh:mm, hh.mm, hh:mm:ss, 'kell 19' and the time part of a
+    datetime; for time ranges ('19:00-21:00', 'kell 19-21') the start
+    time is used.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    simple = parse_time(value)
+    if simple:
+        return simple
+    match = HOUR_ONLY_RE.match(value)
+    if match:
+        return parse_time(f"{match.group(1)}:00")
+    # Dates contain dots too, drop them before looking for a clock time
+    value = DOTTED_DATE_RE.sub(' ', ISO_DATE_RE.sub(' ', value))
+    match = CLOCK_RE.search(value)
+    if match:
+        time_value = parse_time(f"{match.group(1)}:{match.group(2)}")
+        if time_value and match.group(3):
+            seconds = int(match.group(3))
+            time_value = time_value[:6] + f"{seconds:02d}" if seconds < 60 else None
+        return time_value
+    return None
+
+
+def _text(event: Dict, field: str) -> str:
+    value = event.get(field)
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value).strip()
+
+
+def content_hash(event: Dict) -> str:
+    """SHA-256 of the event fields, independent of key order and surrounding whitespace."""
+    canonical = json.dumps({field: _text(event, field) for field in EVENT_FIELDS},
+                           ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def event_to_row(event: Dict) -> Tuple:
+    """Build the row values (in COLUMNS order) of one event."""
+    date_text = _text(event, "date")
+    time_text = _text(event, "time")
+    event_time = normalize_time(time_text)
+    if event_time is None and not time_text:
+        # Gemini sometimes puts the time into the date field ('2022-01-01 17:00:00')
+        event_time = normalize_time(date_text)
+    return (
+        content_hash(event),
+        _text(event, "title")[:500],
+        normalize_date(date_text),
+        event_time,
+        date_text[:100],
+        time_text[:100],
+        _text(event, "location"),
+        _text(event, "performers"),
+        _text(event, "program"),
+        _text(event, "description"),
+        _text(event, "tickets"),
+        _text(event, "link")[:1000],
+        _text(event, "other_info"),
+    )
+
+
+def iter_json_events(filename: str, chunk_size: int = 1 << 20) -> Iterator[Dict]:
+    """
+    Stream the events of an {"events": [...]} file without loading it whole:
+    the array elements are decoded one by one from a sliding buffer.
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, 'r', encoding='utf-8') as f:
+        buffer = ""
+        position = -1
+        while position < 0:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            match = re.search(r'"events"\s*:\s*\[', buffer)
+            position = match.end() if match else -1
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if buffer.startswith(']', position):
+                return
+            try:
+                event, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Element cut off at the end of the buffer: read on
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield event
+
+
+def iter_input_events(input_file: str = INPUT_FILE) -> Iterator[Dict]:
+    """Events of the JSONL output if it exists, otherwise of the JSON file."""
+    streaming_file = jsonl_path(input_file)
+    if os.path.exists(streaming_file) and os.path.getsize(streaming_file) > 0:
+        print(f"Reading {streaming_file}")
+        return iter_jsonl_events(streaming_file)
+    print(f"Reading {input_file}")
+    return iter_json_events(input_file)
+
+
+def insert_rows(cursor, rows: List[Tuple]) -> int:
+    """
+    Upsert rows with one multi-row INSERT. Returns the affected row count
+    (1 per new row, 0 for rows that were already loaded).
+    """
+    placeholders = "(" + ", ".join(["%s"] * len(COLUMNS)) + ")"
+    query = (
+        f"INSERT INTO {TABLE_NAME} ({', '.join(COLUMNS)}) VALUES "
+        + ", ".join([placeholders] * len(rows))
+        # Same hash = same content, so the row is left unchanged
+        + " ON DUPLICATE KEY UPDATE content_hash = content_hash"
+    )
+    cursor.execute(query, [value for row in rows for value in row])
+    return cursor.rowcount
+
+
+def load_events(conn, events, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Stream events into the table in batches, one transaction per batch."""
+    cursor = conn.cursor()
+    cursor.execute(CREATE_TABLE_SQL)
+    stats = {"read": 0, "new": 0, "no_date": 0, "no_time": 0}
+    rows = []
+
+    def flush():
+        stats["new"] += insert_rows(cursor, rows)
+        conn.commit()
+        rows.clear()
+
+    try:
+        for event in events:
+            row = event_to_row(event)
+            stats["read"] += 1
+            stats["no_date"] += row[2] is None
+            stats["no_time"] += row[3] is None
+            rows.append(row)
+            if len(rows) >= batch_size:
+                flush()
+                print(f"  {stats['read']} events loaded...")
+        if rows:
+            flush()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return stats
+
+
+def main():
+    """Load the events file into the database."""
+    print("Loading concert events into MariaDB...")
+    print(f"Database: {DB_CONFIG['database']}, table: {TABLE_NAME}")
+
+    if not os.path.exists(INPUT_FILE) and not os.path.exists(jsonl_path(INPUT_FILE)):
+        print(f"Error: File '{INPUT_FILE}' not found", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+    except mysql.connector.Error as e:
+        print(f"Error connecting to MariaDB: {e}")
+        sys.exit(1)
+
+    start_time = time.perf_counter()
+    try:
+        stats = load_events(conn, iter_input_events(INPUT_FILE))
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start_time
+
+    print()
+    print("Loading completed!")
+    print(f"  Events read: {stats['read']}")
+    print(f"  New rows: {stats['new']} ({stats['read'] - stats['new']} already loaded)")
+    print(f"  Without a usable date: {stats['no_date']}, without a time: {stats['no_time']}")
+    print(f"  {elapsed:.2f}s ({stats['read'] / elapsed if elapsed > 0 else 0:.0f} events/s)")
+
+
+if __name__ == "__main__":
+    main()
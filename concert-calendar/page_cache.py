@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Persistent on-disk HTTP page cache for the EMIC scraper.
+Page bodies are stored content-addressed (by SHA-256) under the cache
+directory, the URL index with ETag/Last-Modified validators in SQLite.
+"""
+
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+INDEX_FILE = "index.sqlite"
+BLOB_DIR = "blobs"
+
+
+class PageCache:
+    """
+    URL-keyed page cache with conditional-GET validators.
+
+    Freshness policy:
+        - pages of years older than `frozen_after_years` are never revalidated
+        - other pages are served without revalidation for `max_age` seconds
+    Eviction:
+        - when the stored bodies exceed `max_bytes`, least recently used
+          entries are dropped until the cache fits again
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 500 * 1024 * 1024,
+                 max_age: float = 0, frozen_after_years: int = 1):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.frozen_after_years = frozen_after_years
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir, BLOB_DIR), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, INDEX_FILE), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                body_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                validated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+        self._conn.commit()
+
+    def _blob_path(self, body_hash: str) -> str:
+        return os.path.join(self.cache_dir, BLOB_DIR, body_hash[:2], body_hash)
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """Return the index entry for `url`, or None if not cached."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body_hash, size, etag, last_modified, validated_at FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self._blob_path(row[0])):
+            return None
+        return {
+            "url": url,
+            "body_hash": row[0],
+            "size": row[1],
+            "etag": row[2],
+            "last_modified": row[3],
+            "validated_at": row[4],
+        }
+
+    def is_fresh(self, entry: Optional[Dict], year: Optional[int] = None) -> bool:
+        """Return True if the cached entry may be used without revalidation."""
+        if entry is None:
+            return False
+        if year is not None and year < datetime.date.today().year - self.frozen_after_years:
+            return True
+        return time.time() - entry["validated_at"] < self.max_age
+
+    def conditional_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """Build If-None-Match / If-Modified-Since headers for revalidation."""
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read(self, entry: Dict, revalidated: bool = False) -> str:
+        """Return the cached body of `entry` and mark it as recently used."""
+        with open(self._blob_path(entry["body_hash"]), 'r', encoding='utf-8') as f:
+            body = f.read()
+        now = time.time()
+        with self._lock:
+            if revalidated:
+                self.stats["revalidated"] += 1
+                self._conn.execute(
+                    "UPDATE pages SET validated_at = ?, accessed_at = ? WHERE url = ?",
+                    (now, now, entry["url"])
+                )
+            else:
+                self.stats["hits"] += 1
+                self._conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (now, entry["url"]))
+            self._conn.commit()
+        return body
+
+    def store(self, url: str, body: str, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> None:
+        """Store a freshly downloaded page and evict old entries if needed."""
+        data = body.encode('utf-8')
+        body_hash = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock:
+            self.stats["misses"] += 1
+            old = self._conn.execute("SELECT body_hash FROM pages WHERE url = ?", (url,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(url, body_hash, size, etag, last_modified, validated_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body_hash, len(data), etag, last_modified, now, now)
+            )
+            if old and old[0] != body_hash:
+                self._drop_blob_if_unused(old[0])
+            self._evict()
+            self._conn.commit()
+
+    def _drop_blob_if_unused(self, body_hash: str) -> bool:
+        """Remove the blob once no page refers to it; return True if it went."""
+        in_use = self._conn.execute(
+            "SELECT 1 FROM pages WHERE body_hash = ? LIMIT 1", (body_hash,)
+        ).fetchone()
+        if in_use:
+            return False
+        try:
+            os.remove(self._blob_path(body_hash))
+        except OSError:
+            pass
+        return True
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        # Pages with identical bodies share one blob, so count each blob once.
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM "
+            "(SELECT body_hash, MAX(size) AS size FROM pages GROUP BY body_hash)"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT url, body_hash, size FROM pages ORDER BY accessed_at ASC").fetchall()
+        for url, body_hash, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            if self._drop_blob_if_unused(body_hash):
+                total -= size
+            self.stats["evicted"] += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
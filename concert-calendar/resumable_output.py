@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Resumable JSONL output for events_to_json.py.
+
+Every parsed event is appended to a JSONL file (one event per line) and
+flushed as soon as it is done. Events are finished in input order, so the
+finished events always form a prefix of the input and the checkpoint only
+needs to remember how many input events are done and how long the output
+files were at that moment:
+
+    {"input": "test-events.txt", "events_done": 900, "last_key": "2014-00412",
+     "input_digest": "3f2a...", "output_bytes": 812345, "problems_bytes": 10234}
+
+On restart the output and problems files are truncated back to the
+checkpointed sizes (dropping anything written after the last checkpoint)
+and the first `events_done` input events are skipped. `input_digest` is a
+running SHA-1 over the texts of the done events: the skipped events must
+reproduce it and end with `last_key`, otherwise the input was edited or
+re-scraped in the meantime and the run starts over instead of skipping
+events by position.
+
+compact_jsonl_to_json() streams the JSONL file into the usual
+{"events": [...]} file, byte-identical to save_events_to_json().
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Iterator, Optional
+
+from event_store import EventRecord, event_key
+
+
+def jsonl_path(output_file: str) -> str:
+    """test-events.json -> test-events.jsonl"""
+    return os.path.splitext(output_file)[0] + ".jsonl"
+
+
+def checkpoint_path(output_file: str) -> str:
+    """test-events.json -> test-events.checkpoint.json"""
+    return os.path.splitext(output_file)[0] + ".checkpoint.json"
+
+
+def _file_size(filename: str) -> int:
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+def _truncate(filename: str, size: int) -> None:
+    if os.path.exists(filename):
+        with open(filename, 'r+b') as f:
+            f.truncate(size)
+
+
+class ResumableOutput:
+    """
+    Append-only JSONL writer with a checkpoint of the finished input events.
+
+    Usage:
+        with ResumableOutput("events.txt", "events.jsonl", "events.checkpoint.json",
+                             "problems.txt") as output:
+            pending = output.resume(iter_events("events.txt"))
+            if pending is None:  # input changed, output was reset
+                pending = iter_events("events.txt")
+            for event in pending:
+                output.add_event(event, event_data)  # or add_problem(event)
+
+    Problem texts are written by the caller (append_problem_to_file); the
+    writer only records the size of the problems file in the checkpoint.
+    """
+
+    def __init__(self, input_file: str, jsonl_file: str, checkpoint_file: str,
+                 problems_file: str, resume: bool = True, checkpoint_every: int = 20):
+        self.input_file = input_file
+        self.jsonl_file = jsonl_file
+        self.checkpoint_file = checkpoint_file
+        self.problems_file = problems_file
+        self.checkpoint_every = checkpoint_every
+        self.events_done = 0
+        self.resumed_from = 0
+        self.last_key: Optional[str] = None
+        self.input_digest: Optional[str] = None
+        self._digest = hashlib.sha1()
+        self.written = 0
+        self.problems = 0
+
+        checkpoint = self._load_checkpoint() if resume else None
+        if checkpoint is None:
+            self._remove_output()
+        else:
+            _truncate(self.jsonl_file, checkpoint["output_bytes"])
+            _truncate(self.problems_file, checkpoint["problems_bytes"])
+            self.events_done = self.resumed_from = checkpoint["events_done"]
+            self.last_key = checkpoint.get("last_key")
+            self.input_digest = checkpoint.get("input_digest")
+
+        self._file = open(self.jsonl_file, 'a', encoding='utf-8')
+        self._since_checkpoint = 0
+
+    def _remove_output(self) -> None:
+        # Fresh start: nothing from an earlier run is kept
+        for filename in (self.jsonl_file, self.problems_file, self.checkpoint_file):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _load_checkpoint(self) -> Optional[Dict]:
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get("input") != os.path.basename(self.input_file):
+            print(f"Checkpoint {self.checkpoint_file} belongs to another input file, starting over")
+            return None
+        if _file_size(self.jsonl_file) < checkpoint.get("output_bytes", 0):
+            print(f"{self.jsonl_file} is shorter than checkpointed, starting over")
+            return None
+        return checkpoint
+
+    def resume(self, events: Iterable[EventRecord]) -> Optional[Iterator[EventRecord]]:
+        """
+        Skip the input events done in an earlier run and return an iterator
+        over the rest. The skipped events are checked against the
+        checkpoint's key and digest; if they differ (or the input is
+        shorter), the output is reset to a fresh start and None is
+        returned, and the caller has to process its input from the beginning.
+        """
+        iterator = iter(events)
+        if not self.resumed_from:
+            return iterator
+        last = None
+        for _ in range(self.resumed_from):
+            last = next(iterator, None)
+            if last is None:
+                break
+            self._update_digest(last)
+        # Checkpoints of older runs have no digest, the key must do then
+        if last is not None and event_key(last) == self.last_key and \
+                self.input_digest in (None, self._digest.hexdigest()):
+            return iterator
+        print(f"Input events changed since the checkpoint (event {self.resumed_from}, "
+              f"{self.last_key}), starting over")
+        self.restart()
+        return None
+
+    def restart(self) -> None:
+        """Drop all output of earlier runs and start from the first input event."""
+        self._file.close()
+        self._remove_output()
+        self.events_done = self.resumed_from = 0
+        self.last_key = self.input_digest = None
+        self._digest = hashlib.sha1()
+        self._file = open(self.jsonl_file, 'a', encoding='utf-8')
+        self._since_checkpoint = 0
+
+    def add_event(self, event: EventRecord, event_data: Dict) -> None:
+        """Append one parsed event and mark the input event as done."""
+        self._file.write(json.dumps(event_data, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self.written += 1
+        self._done(event)
+
+    def add_problem(self, event: EventRecord) -> None:
+        """Mark an input event as done after its problem text was appended to the problems file."""
+        self.problems += 1
+        self._done(event)
+
+    def _done(self, event: EventRecord) -> None:
+        self.events_done += 1
+        self.last_key = event_key(event)
+        self._update_digest(event)
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _update_digest(self, event: EventRecord) -> None:
+        self._digest.update(event.text.encode('utf-8') + b'\0')
+
+    def checkpoint(self) -> None:
+        """Write the checkpoint atomically, after syncing the output to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        checkpoint = {
+            "input": os.path.basename(self.input_file),
+            "events_done": self.events_done,
+            "last_key": self.last_key,
+            "input_digest": self._digest.hexdigest(),
+            "output_bytes": self._file.tell(),
+            "problems_bytes": _file_size(self.problems_file),
+        }
+        tmp_path = self.checkpoint_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_file)
+        self._since_checkpoint = 0
+
+    def close(self) -> None:
+        self.checkpoint()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # A checkpoint is written on errors and Ctrl-C too: everything
+        # before it has already been flushed in order
+        self.close()
+        return False
+
+
+def iter_jsonl_events(jsonl_file: str) -> Iterator[Dict]:
+    """Yield the events of a JSONL file one by one."""
+    with open(jsonl_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def compact_jsonl_to_json(jsonl_file: str, output_file: str) -> int:
+    """
+    Stream a JSONL file into {"events": [...]}, formatted exactly like
+    json.dump(..., ensure_ascii=False, indent=2). Returns the event count.
+    """
+    count = 0
+    tmp_path = output_file + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write('{\n  "events": [')
+        for event_data in iter_jsonl_events(jsonl_file):
+            text = json.dumps(event_data, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+            out.write((',\n    ' if count else '\n    ') + text)
+            count += 1
+        out.write('\n  ]\n}' if count else ']\n}')
+    os.replace(tmp_path, output_file)
+    return count
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Pipelined scrape -> analyze run for the EMIC concert calendar.
+
+Runs get_events.py and events_to_json.py as one job: a crawler thread
+fetches the calendar year by year and puts every extracted event into a
+bounded queue, while the main thread analyzes events as soon as they
+arrive. Network time and LLM time overlap instead of adding up. When the
+queue is full the crawler waits, so it never runs far ahead of the
+analysis.
+
+events.txt is still written (by the crawler, in the same format as
+get_events.py), and the analysis output, checkpoint and problems file are
+the same as for events_to_json.py with INPUT_FILE = events.txt.
+"""
+
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+import events_to_json
+from event_store import EventRecord, EventWriter
+from get_events import (
+    CALENDAR_URL,
+    MAX_IN_FLIGHT_PER_HOST,
+    YEARS,
+    extract_event_content,
+    extract_event_links,
+    fetch_page_throttled,
+    print_cache_stats,
+)
+
+
+# Configuration
+EVENTS_FILE = "events.txt"
+QUEUE_SIZE = 50  # scraped events waiting for analysis before the crawler pauses
+TEST_LIMIT = None  # events per year, for testing
+
+
+class StageCounter:
+    """Throughput counter of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.wait_time = 0.0  # seconds spent blocked on the queue
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def finish(self) -> None:
+        self.end_time = time.perf_counter()
+
+    def report(self, wait_label: str) -> str:
+        elapsed = (self.end_time or time.perf_counter()) - self.start_time
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        return (f"  {self.name}: {self.count} events in {elapsed:.1f}s ({rate:.2f} events/s), "
+                f"{self.wait_time:.1f}s {wait_label}")
+
+
+_DONE = object()  # end of stream marker
+
+
+class EventPipeline:
+    """Crawler thread feeding a bounded queue of EventRecords."""
+
+    def __init__(self, years=YEARS, events_file: str = EVENTS_FILE,
+                 queue_size: int = QUEUE_SIZE, limit: Optional[int] = None):
+        self.years = years
+        self.events_file = events_file
+        self.limit = limit
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.crawler = StageCounter("Crawler")
+        self.analysis = StageCounter("Analysis")
+        self.max_queue_depth = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._crawl, name="crawler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the crawler to stop (used when the analysis ends early)."""
+        self._stop.set()
+        self._thread.join()
+
+    def _put(self, item) -> bool:
+        """Put with backpressure; returns False if the pipeline was stopped meanwhile."""
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                self.crawler.wait_time += time.perf_counter() - start
+                self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _iter_year_contents(self, year: int, executor: ThreadPoolExecutor) -> Iterator[str]:
+        """Yield the event contents of a year in calendar order, fetching pages ahead."""
+        html_content = fetch_page_throttled(CALENDAR_URL.format(year=year), year)
+        if not html_content:
+            print(f"  Failed to fetch calendar for {year}")
+            return
+        event_links = extract_event_links(html_content)
+        if self.limit:
+            event_links = event_links[:self.limit]
+        print(f"  [crawler] {year}: {len(event_links)} events")
+
+        # At most 2 * MAX_IN_FLIGHT_PER_HOST pages are fetched ahead, so a
+        # full queue also pauses the fetching
+        pending = deque()
+        for position, (event_url, _) in enumerate(event_links, 1):
+            pending.append(executor.submit(fetch_page_throttled, event_url, year))
+            while pending and (len(pending) >= 2 * MAX_IN_FLIGHT_PER_HOST or position == len(event_links)):
+                event_html = pending.popleft().result()
+                if event_html:
+                    content = extract_event_content(event_html)
+                    if content:
+                        yield content
+
+    def _crawl(self) -> None:
+        try:
+            with EventWriter(self.events_file, 'w') as writer, \
+                    ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT_PER_HOST) as executor:
+                for year in self.years:
+                    number = 0
+                    for content in self._iter_year_contents(year, executor):
+                        # events.txt gets the event before the analysis does
+                        writer.write(year, content)
+                        number += 1
+                        self.crawler.count += 1
+                        if not self._put(EventRecord(year, number, content)):
+                            return
+                    if self._stop.is_set():
+                        return
+        except Exception as e:
+            self.error = e
+        finally:
+            self.crawler.finish()
+            self._put(_DONE)
+
+    def events(self) -> Iterator[EventRecord]:
+        """Yield the scraped events in order as they arrive."""
+        while True:
+            start = time.perf_counter()
+            item = self.queue.get()
+            self.analysis.wait_time += time.perf_counter() - start
+            if item is _DONE:
+                break
+            self.analysis.count += 1
+            yield item
+        self.analysis.finish()
+        if self.error is not None:
+            raise self.error
+
+    def print_stats(self) -> None:
+        print("Pipeline:")
+        print(self.crawler.report("waiting for the analysis (queue full)"))
+        print(self.analysis.report("waiting for the crawler (queue empty)"))
+        print(f"  Max queue depth: {self.max_queue_depth}/{self.queue.maxsize}")
+
+
+def main():
+    """Scrape all years and analyze the events while they are being scraped."""
+    print("Starting pipelined EMIC scrape and analysis...")
+    print(f"Scraping years: {YEARS.start} to {YEARS.stop - 1}")
+    print(f"Events file: {EVENTS_FILE}")
+    print(f"Output file: {events_to_json.OUTPUT_FILE}")
+    print()
+
+    model = events_to_json.create_model()
+    cache = events_to_json.open_cache()
+    output = events_to_json.open_output(EVENTS_FILE)
+    print()
+
+    pipeline = EventPipeline(limit=TEST_LIMIT)
+    start_time = time.perf_counter()
+    pipeline.start()
+    try:
+        # Events finished in an earlier run are crawled again (from the page
+        # cache) to keep events.txt complete, but not analyzed again
+        pending = output.resume(pipeline.events())
+        if pending is None:
+            # The calendar changed since the checkpoint: the output was
+            # reset, crawl again from the start
+            pipeline.stop()
+            pipeline = EventPipeline(limit=TEST_LIMIT)
+            pipeline.start()
+            pending = pipeline.events()
+        events_to_json.process_events(pending, model, cache, output)
+    finally:
+        pipeline.stop()
+        if cache is not None:
+            cache.close()
+
+    print()
+    pipeline.print_stats()
+    print_cache_stats()
+    print(f"Total runtime: {time.perf_counter() - start_time:.2f}s")
+    print(f"All events saved to {EVENTS_FILE}")
+    events_to_json.compact_output(output)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Interrupted, run again to resume", file=sys.stderr)
+        sys.exit(130)
@@ -0,0 +1,241 @@
+"""
+Multi-job Batch API orchestrator.
+
+Submits every shard listed in the shard manifest (gemini_batch_shards.json,
+written by prepare_batch_file.py) as its own batch job, with at most
+`max_active_jobs` jobs running at once. It polls them all, and streams the
+output of each finished job straight to disk (files.download(destination=...)).
+
+The state of every shard is kept in a local JSON file that is rewritten
+atomically after every change:
+
+    {"gemini_batch_input-00000.jsonl": {"uploaded_file": "files/...",
+        "job": "batches/...", "state": "JOB_STATE_RUNNING", "attempts": 1,
+        "output": null, "error": null}, ...}
+
+After a restart, uploaded files and running jobs are picked up again
+instead of being resubmitted. Every entry records the fingerprint of its
+shard (requests, bytes, first and last key from the shard manifest): when
+prepare_batch_file.py has rewritten a shard since, the entry starts over
+and its old output is deleted. Entries and outputs of shards that are no
+longer in the manifest are removed as well. Shards whose job failed are resubmitted
+until `max_attempts` is used up.
+
+Polling backs off while nothing changes: the interval grows by
+`poll_factor` up to `poll_max` and drops back to `poll_min` as soon as a
+job changes state. `on_output(path)` is called for every downloaded
+output, so results can be inserted while other jobs are still running.
+
+The client only needs files.upload / files.download and batches.create /
+batches.get, so fake_genai_client.FakeClient can stand in for
+genai.Client to run the whole flow offline.
+"""
+
+import json
+import os
+import time
+
+from batch_shards import load_shard_manifest
+
+
+SUCCEEDED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+FAILED_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+DONE = "DOWNLOADED"  # local state after the output is on disk
+FINGERPRINT_FIELDS = ("requests", "bytes", "first_key", "last_key")
+
+
+def shard_fingerprint(shard):
+    return {field: shard.get(field) for field in FINGERPRINT_FIELDS}
+
+
+def load_job_outputs(state_file):
+    """Output files of the shards whose results are downloaded, in shard order."""
+    with open(state_file, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    return [s["output"] for s in state.values() if s["state"] == DONE and s["output"]]
+
+
+def _state_name(job):
+    state = getattr(job, 'state', None)
+    return getattr(state, 'name', None) or str(state)
+
+
+class BatchOrchestrator:
+    def __init__(self, client, model, shard_manifest_file, state_file, output_pattern,
+                 max_active_jobs=10, max_attempts=3, poll_min=30.0, poll_max=600.0, poll_factor=1.5,
+                 on_output=None, sleep=time.sleep):
+        self.client = client
+        self.model = model
+        self.shard_manifest_file = shard_manifest_file
+        self.state_file = state_file
+        self.output_pattern = output_pattern  # e.g. "gemini_results-{index:05d}.jsonl"
+        self.max_active_jobs = max_active_jobs
+        self.max_attempts = max_attempts
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.poll_factor = poll_factor
+        self.on_output = on_output
+        self.sleep = sleep
+
+        self.base_dir = os.path.dirname(os.path.abspath(shard_manifest_file))
+        self.shards = load_shard_manifest(shard_manifest_file)
+        self.shard_index = {shard["file"]: index for index, shard in enumerate(self.shards)}
+        self.state = self._load_state()
+        self.polls = 0
+
+    # --- State file ---
+
+    def _output_path(self, index):
+        return os.path.join(self.base_dir, self.output_pattern.format(index=index))
+
+    def _remove_output(self, path):
+        if path and os.path.exists(path):
+            print(f"Removing stale output {path}")
+            os.remove(path)
+
+    def _load_state(self):
+        saved = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        state = {}
+        for index, shard in enumerate(self.shards):
+            fingerprint = shard_fingerprint(shard)
+            entry = saved.pop(shard["file"], None)
+            if entry is not None and entry.get("fingerprint") != fingerprint:
+                # Same file name, different requests: the old job and output do not apply
+                print(f"{shard['file']} was rewritten since the last run, starting it over")
+                self._remove_output(entry.get("output"))
+                entry = None
+            if entry is None:
+                entry = {
+                    "fingerprint": fingerprint, "uploaded_file": None, "job": None, "state": None,
+                    "attempts": 0, "output": None, "error": None
+                }
+            if entry["state"] != DONE:
+                # A file at the output path is left over from an earlier run
+                self._remove_output(self._output_path(index))
+            state[shard["file"]] = entry
+        # Shards of an earlier run that are no longer in the manifest
+        for name, entry in saved.items():
+            print(f"Dropping {name}, which is no longer in {self.shard_manifest_file}")
+            self._remove_output(entry.get("output"))
+        index = len(self.shards)
+        while os.path.exists(self._output_path(index)):
+            self._remove_output(self._output_path(index))
+            index += 1
+        self.state = state
+        self._save_state()
+        return state
+
+    def _save_state(self):
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_file)
+
+    # --- Steps ---
+
+    def _active(self):
+        return [name for name, s in self.state.items()
+                if s["job"] and s["state"] not in SUCCEEDED_STATES | FAILED_STATES | {DONE}]
+
+    def _finished_not_downloaded(self):
+        return [name for name, s in self.state.items() if s["state"] in SUCCEEDED_STATES]
+
+    def _submittable(self):
+        names = []
+        for shard in self.shards:
+            s = self.state[shard["file"]]
+            if s["job"] is None and s["attempts"] < self.max_attempts:
+                names.append(shard["file"])
+            elif s["state"] in FAILED_STATES and s["attempts"] < self.max_attempts:
+                names.append(shard["file"])
+        return names
+
+    def submit_pending(self):
+        """Upload and submit shards until max_active_jobs are running."""
+        free = self.max_active_jobs - len(self._active())
+        for name in self._submittable()[:max(0, free)]:
+            s = self.state[name]
+            if s["uploaded_file"] is None or s["state"] in FAILED_STATES:
+                print(f"Uploading {name}...")
+                uploaded = self.client.files.upload(
+                    file=os.path.join(self.base_dir, name),
+                    config={'mime_type': 'application/jsonl'}
+                )
+                s["uploaded_file"] = uploaded.name
+                self._save_state()
+            job = self.client.batches.create(
+                model=self.model,
+                src=s["uploaded_file"],
+                config={'display_name': f"Musicology_Data_Analysis {name}"}
+            )
+            s.update(job=job.name, state=_state_name(job), attempts=s["attempts"] + 1, error=None)
+            self._save_state()
+            print(f"Submitted {name} as {job.name} (attempt {s['attempts']})")
+
+    def poll(self):
+        """Check every active job once; download finished outputs. Returns True if anything changed."""
+        self.polls += 1
+        changed = False
+        for name in self._active():
+            s = self.state[name]
+            job = self.client.batches.get(name=s["job"])
+            state = _state_name(job)
+            if state != s["state"]:
+                changed = True
+                print(f"{name}: {s['state']} -> {state}")
+                s["state"] = state
+                if state in FAILED_STATES:
+                    s["error"] = str(getattr(job, 'error', None) or state)
+                self._save_state()
+            if state in SUCCEEDED_STATES:
+                self._download(name, job)
+                changed = True
+        # Jobs that finished before a restart but were not downloaded and handed on
+        for name in self._finished_not_downloaded():
+            self._download(name, self.client.batches.get(name=self.state[name]["job"]))
+            changed = True
+        return changed
+
+    def _download(self, name, job):
+        s = self.state[name]
+        output_path = self._output_path(self.shard_index[name])
+        tmp_path = output_path + ".part"
+        print(f"Downloading results of {name} to {output_path}...")
+        # Streamed to disk in chunks; renamed only when complete
+        self.client.files.download(file=job.dest.file_name, destination=tmp_path)
+        os.replace(tmp_path, output_path)
+        # Marked done only after on_output, so a crash in between repeats the
+        # (idempotent) hand-over instead of skipping it
+        if self.on_output:
+            self.on_output(output_path)
+        s["output"] = output_path
+        s["state"] = DONE
+        self._save_state()
+
+    def run(self):
+        """Submit, poll and download until every shard is done or out of attempts."""
+        interval = self.poll_min
+        self.submit_pending()
+        while self._active() or self._submittable() or self._finished_not_downloaded():
+            if self.poll():
+                interval = self.poll_min
+            else:
+                interval = min(self.poll_max, interval * self.poll_factor)
+            self.submit_pending()
+            if self._active():
+                print(f"{len(self._active())} jobs running, next check in {interval:.0f}s")
+                self.sleep(interval)
+        self.print_summary()
+
+    def print_summary(self):
+        done = [n for n, s in self.state.items() if s["state"] == DONE]
+        failed = [n for n, s in self.state.items() if s["state"] != DONE]
+        print(f"Shards done: {len(done)}/{len(self.state)}, polls: {self.polls}")
+        for name in failed:
+            s = self.state[name]
+            print(f"  not done: {name} ({s['state']}, {s['attempts']} attempts, error: {s['error']})")
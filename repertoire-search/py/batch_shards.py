@@ -0,0 +1,114 @@
+"""
+Sharded JSONL writer for Batch API input files.
+
+Lines are streamed into shards named <base>-00000.jsonl, <base>-00001.jsonl,
+... (with .gz when compressed). A new shard is started when the current
+one would exceed `max_requests` lines or `max_bytes` bytes. The byte limit
+counts uncompressed bytes, so a shard stays under it however well it
+compresses.
+
+close() removes shards left over from an earlier run (compressed or not)
+and writes the shard manifest, a JSON list with one entry per shard:
+
+    {"file": "gemini_batch_input-00000.jsonl.gz", "requests": 50000,
+     "bytes": 123456789, "first_key": "t3f2a...", "last_key": "t9c01..."}
+
+Shards are independent, so they can be uploaded and submitted in parallel.
+If writing is aborted by an exception, no manifest is written and the one
+of an earlier run is removed, so a partial set of shards is never taken
+for a complete one.
+"""
+
+import gzip
+import json
+import os
+
+
+def shard_path(base_path, index, compress=False):
+    root, ext = os.path.splitext(base_path)
+    return f"{root}-{index:05d}{ext or '.jsonl'}" + (".gz" if compress else "")
+
+
+def load_shard_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ShardedJsonlWriter:
+    def __init__(self, base_path, manifest_path, max_requests=50000, max_bytes=1_900_000_000, compress=False):
+        self.base_path = base_path
+        self.manifest_path = manifest_path
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.shards = []
+        self._file = None
+        self._current = None
+
+    def _open_shard(self):
+        self._close_shard()
+        path = shard_path(self.base_path, len(self.shards), self.compress)
+        # Uncompressed lines already are UTF-8 bytes; gzip level 6 is a good size/speed trade-off
+        self._file = gzip.open(path, 'wb', compresslevel=6) if self.compress else open(path, 'wb')
+        self._current = {"file": os.path.basename(path), "requests": 0, "bytes": 0,
+                         "first_key": None, "last_key": None}
+        self.shards.append(self._current)
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, key, record):
+        """Append one request line; record is the full line object (with "key")."""
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        current = self._current
+        if (current is None or current["requests"] >= self.max_requests
+                or (current["requests"] and current["bytes"] + len(line) > self.max_bytes)):
+            self._open_shard()
+            current = self._current
+        self._file.write(line)
+        current["requests"] += 1
+        current["bytes"] += len(line)
+        if current["first_key"] is None:
+            current["first_key"] = key
+        current["last_key"] = key
+
+    def _remove_stale_shards(self):
+        """Remove shards of an earlier run: a larger one, or one with the other COMPRESS setting."""
+        for compress in (False, True):
+            index = 0 if compress != self.compress else len(self.shards)
+            while True:
+                path = shard_path(self.base_path, index, compress)
+                if not os.path.exists(path):
+                    # The other suffix may have gaps only below the current shard count
+                    if index >= len(self.shards):
+                        break
+                else:
+                    os.remove(path)
+                index += 1
+
+    def close(self):
+        self._close_shard()
+        self._remove_stale_shards()
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.shards, f, ensure_ascii=False, indent=2)
+
+    def abort(self):
+        """Stop after a failure: close the current shard but write no manifest."""
+        self._close_shard()
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    @property
+    def requests(self):
+        return sum(shard["requests"] for shard in self.shards)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,210 @@
+"""
+Benchmark of the model-JSON parsers on json_repair_corpus.jsonl.
+
+For every strategy it reports parses per second and the repair success
+rate: a case counts as a success if the result equals "expected", or for
+cases without a parseable answer ("expected": null) if the parser gives up.
+Cases collected from real batch output have no "expected" key; for those
+any parse counts as a success.
+
+Strategies:
+  legacy_insert   the old insert_batch_results_to_database parser
+  legacy_extract  the old process_instrumentation.extract_json
+  shared          json_repair.parse_model_json
+
+Usage:
+  python benchmark_json_repair.py                     run the benchmark
+  python benchmark_json_repair.py results.jsonl       first add the responses of a
+                                                      batch output file that are not
+                                                      strict JSON to the corpus
+"""
+
+import json
+import re
+import sys
+import time
+
+from json_repair import parse_model_json
+
+
+CORPUS_FILE = "json_repair_corpus.jsonl"
+REPEAT = 200  # passes over the corpus for the timing
+
+
+# --- Legacy parsers, kept for comparison ---
+
+def _legacy_extract_json_candidates(raw_text):
+    text = (raw_text or "").strip()
+    if not text:
+        return []
+
+    fenced = re.findall(r"```(?:json)?\s*(.*?)\s*```", text, flags=re.DOTALL | re.IGNORECASE)
+    if fenced:
+        return [block.strip() for block in fenced if block and block.strip()]
+    return [text]
+
+
+def _legacy_repair_json_text(text):
+    repaired = []
+    in_string = False
+    escaped = False
+    length = len(text)
+
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                repaired.append(char)
+                escaped = False
+                continue
+
+            if char == "\\":
+                repaired.append(char)
+                escaped = True
+                continue
+
+            if char == "\n":
+                repaired.append("\\n")
+                continue
+
+            if char == '"':
+                lookahead = index + 1
+                while lookahead < length and text[lookahead] in " \t\r\n":
+                    lookahead += 1
+                next_char = text[lookahead] if lookahead < length else ""
+
+                if next_char in {",", "}", "]", ":", ""}:
+                    repaired.append('"')
+                    in_string = False
+                else:
+                    repaired.append('\\"')
+                continue
+
+            repaired.append(char)
+            continue
+
+        repaired.append(char)
+        if char == '"':
+            in_string = True
+
+    return "".join(repaired)
+
+
+def legacy_insert(raw_text):
+    decoder = json.JSONDecoder()
+
+    for candidate in _legacy_extract_json_candidates(raw_text):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+
+        try:
+            parsed, _ = decoder.raw_decode(candidate)
+            return parsed
+        except json.JSONDecodeError:
+            pass
+
+        repaired = _legacy_repair_json_text(candidate)
+        try:
+            return json.loads(repaired)
+        except json.JSONDecodeError:
+            pass
+
+        try:
+            parsed, _ = decoder.raw_decode(repaired)
+            return parsed
+        except json.JSONDecodeError:
+            pass
+
+    raise json.JSONDecodeError("Could not parse model JSON", raw_text or "", 0)
+
+
+def legacy_extract(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = re.sub(r'^```(?:json)?\n?', '', text)
+        text = re.sub(r'\n?```$', '', text)
+
+    text = text.strip()
+
+    try:
+        decoder = json.JSONDecoder()
+        obj, _ = decoder.raw_decode(text)
+        return obj
+    except json.JSONDecodeError:
+        match = re.search(r'(\{.*\})', text, re.DOTALL)
+        if match:
+            return json.loads(match.group(1))
+        raise
+
+
+STRATEGIES = {
+    "legacy_insert": legacy_insert,
+    "legacy_extract": legacy_extract,
+    "shared": parse_model_json,
+}
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def collect_from_batch_output(results_file, corpus_file=CORPUS_FILE):
+    """Append the responses that are not strict JSON to the corpus. Returns the count."""
+    known = {case["text"] for case in load_corpus(corpus_file)}
+    added = 0
+    with open(results_file, 'r', encoding='utf-8') as f, open(corpus_file, 'a', encoding='utf-8') as out:
+        for line in f:
+            item = json.loads(line)
+            try:
+                text = item['response']['candidates'][0]['content']['parts'][0]['text']
+            except (KeyError, IndexError, TypeError):
+                continue
+            try:
+                json.loads(text)
+                continue
+            except json.JSONDecodeError:
+                pass
+            if text in known:
+                continue
+            known.add(text)
+            out.write(json.dumps({"case": f"batch:{item.get('key')}", "text": text}, ensure_ascii=False) + '\n')
+            added += 1
+    return added
+
+
+def is_success(case, parse):
+    try:
+        result = parse(case["text"])
+    except Exception:
+        return "expected" in case and case["expected"] is None
+    if "expected" not in case:
+        return True
+    return result == case["expected"]
+
+
+def benchmark(corpus):
+    print(f"Corpus: {len(corpus)} cases, timing {REPEAT} passes")
+    print(f"{'strategy':<16} {'parses/s':>10} {'success':>12}  failed cases")
+    for name, parse in STRATEGIES.items():
+        failed = [case["case"] for case in corpus if not is_success(case, parse)]
+
+        started = time.perf_counter()
+        for _ in range(REPEAT):
+            for case in corpus:
+                try:
+                    parse(case["text"])
+                except Exception:
+                    pass
+        elapsed = time.perf_counter() - started
+        rate = REPEAT * len(corpus) / elapsed
+        success = len(corpus) - len(failed)
+        print(f"{name:<16} {rate:>10.0f} {success:>5}/{len(corpus):<3} "
+              f"({100.0 * success / len(corpus):.0f}%)  {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(f"Added {collect_from_batch_output(sys.argv[1])} cases from {sys.argv[1]}")
+    benchmark(load_corpus())
@@ -5,7 +5,13 @@ Script to clean HTML tags and whitespace from a MySQL/MariaDB database field.
 
 import mysql.connector
 import re
+import sys
+import time
+from collections import deque
 from html.parser import HTMLParser
+from multiprocessing import Pool, cpu_count
+
+from fingerprint_store import FingerprintStore, value_hash
 
 
 # Configuration
@@ -23,6 +29,32 @@ ID_FIELD = 'id'  # Primary key field name
 # Test mode: if True, only display changes without updating database
 TEST_MODE = False
 
+# Streaming mode: rows are read in id-ordered chunks through an unbuffered
+# cursor, cleaned in a process pool and written back with one executemany
+# and one commit per chunk. Table and field can also be given on the
+# command line: python clean_database_field.py [table field [id_field]]
+STREAMING_MODE = True
+CHUNK_SIZE = 5000  # rows per id-range chunk
+WORKERS = cpu_count()
+CHUNKS_AHEAD = 2 * WORKERS  # chunks being cleaned while others are written
+PRINT_CHANGES_LIMIT = 20  # changed rows shown in streaming mode
+
+# Incremental mode: FINGERPRINT_FILE keeps the MD5 of every value after
+# cleaning, and each run compares it with MD5(field) computed by the
+# server, so only new and changed rows are fetched and cleaned.
+# CHANGE_DETECTION "hash" compares every row (only hashes are transferred);
+# "watermark" only looks at rows with a higher id than the last run, for
+# tables that are only appended to.
+INCREMENTAL = True
+FINGERPRINT_FILE = "clean_fingerprints.sqlite"
+CHANGE_DETECTION = "hash"
+# In TEST_MODE the incremental run writes every change it would make here
+DIFF_REPORT_FILE = "clean_diff_{table}_{field}.txt"
+
+_IDENTIFIER_RE = re.compile(r'\w+')
+_WHITESPACE_RE = re.compile(r'[\t\n\r]+')
+_SPACES_RE = re.compile(r'\s+')
+
 
 class HTMLTextExtractor(HTMLParser):
     """Extract text content from HTML."""
@@ -50,25 +82,274 @@ def clean_html(text):
     if not text or not isinstance(text, str):
         return text
     
-    # Parse HTML and extract text
-    parser = HTMLTextExtractor()
-    try:
-        parser.feed(text)
-        cleaned = parser.get_text()
-    except Exception as e:
-        print(f"Warning: Failed to parse HTML: {e}")
+    if '<' not in text and '&' not in text:
+        # No tags or entities: the HTML parser would return the text as is
         cleaned = text
+    else:
+        # Parse HTML and extract text
+        parser = HTMLTextExtractor()
+        try:
+            parser.feed(text)
+            cleaned = parser.get_text()
+        except Exception as e:
+            print(f"Warning: Failed to parse HTML: {e}")
+            cleaned = text
     
     # Clean whitespace characters
-    cleaned = re.sub(r'[\t\n\r]+', ' ', cleaned)
+    cleaned = _WHITESPACE_RE.sub(' ', cleaned)
     cleaned = cleaned.strip()
     
     # Collapse multiple spaces
-    cleaned = re.sub(r'\s+', ' ', cleaned)
+    cleaned = _SPACES_RE.sub(' ', cleaned)
     
     return cleaned
 
 
+def _clean_chunk(rows):
+    """Clean one chunk -> (rows seen, [(cleaned value, id)] for the changed rows)."""
+    changes = []
+    for record_id, original_value in rows:
+        if original_value is None:
+            continue
+        cleaned_value = clean_html(original_value)
+        if cleaned_value != original_value:
+            changes.append((cleaned_value, record_id))
+    return len(rows), changes
+
+
+def iter_chunks(conn, table, field, id_field, chunk_size, after=None):
+    """Yield lists of (id, value) in id order, one id range at a time (ids > after)."""
+    cursor = conn.cursor(buffered=False)
+    query = f"SELECT {id_field}, {field} FROM {table} WHERE {id_field} > %s ORDER BY {id_field} LIMIT %s"
+    last_id = after
+    try:
+        while True:
+            if last_id is None:
+                cursor.execute(f"SELECT {id_field}, {field} FROM {table} ORDER BY {id_field} LIMIT %s",
+                               (chunk_size,))
+            else:
+                cursor.execute(query, (last_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+            if len(rows) < chunk_size:
+                return
+    finally:
+        cursor.close()
+
+
+def _run_cleaning(chunks, handle):
+    """
+    Clean (context, rows) chunks in the pool, with at most CHUNKS_AHEAD in
+    flight; handle(context, result) is called in this process in chunk order.
+    """
+    if WORKERS <= 1:
+        # A single core gains nothing from a pool, only pickling overhead
+        for context, rows in chunks:
+            handle(context, _clean_chunk(rows))
+        return
+    with Pool(WORKERS) as pool:
+        pending = deque()
+        for context, rows in chunks:
+            pending.append((context, pool.apply_async(_clean_chunk, (rows,))))
+            if len(pending) >= CHUNKS_AHEAD:
+                context, result = pending.popleft()
+                handle(context, result.get())
+        while pending:
+            context, result = pending.popleft()
+            handle(context, result.get())
+
+
+def clean_field_streaming(table=TABLE_NAME, field=FIELD_NAME, id_field=ID_FIELD):
+    """Stream, clean in parallel and write back in batches; reports rows/second."""
+    print("=" * 60)
+    print("Database Field Cleaner (streaming)")
+    print("=" * 60)
+    print(f"Database: {DB_CONFIG['database']}")
+    print(f"Table: {table}")
+    print(f"Field: {field}")
+    print(f"Chunk size: {CHUNK_SIZE}, workers: {WORKERS}")
+    print(f"Mode: {'TEST (no changes will be made)' if TEST_MODE else 'LIVE (database will be updated)'}")
+    print("=" * 60)
+    print()
+
+    try:
+        # Reads and writes on separate connections, so the unbuffered
+        # reads never wait for pending updates
+        read_conn = mysql.connector.connect(**DB_CONFIG)
+        write_conn = mysql.connector.connect(**DB_CONFIG)
+        write_cursor = write_conn.cursor()
+        print("✓ Connected to database")
+        print()
+    except mysql.connector.Error as e:
+        print(f"✗ Error connecting to database: {e}")
+        return
+
+    update_query = f"UPDATE {table} SET {field} = %s WHERE {id_field} = %s"
+    stats = {"rows": 0, "updated": 0, "shown": 0}
+    start_time = time.perf_counter()
+
+    def write_changes(rows, result):
+        seen, changes = result
+        stats["rows"] += seen
+        stats["updated"] += len(changes)
+        shown = changes[:max(0, PRINT_CHANGES_LIMIT - stats["shown"])]
+        originals = dict(rows) if shown else {}
+        for cleaned_value, record_id in shown:
+            stats["shown"] += 1
+            original_value = originals[record_id]
+            print(f"Record ID: {record_id}")
+            print(f"  Original: {original_value[:100]}{'...' if len(original_value) > 100 else ''}")
+            print(f"  Cleaned:  {cleaned_value[:100]}{'...' if len(cleaned_value) > 100 else ''}")
+            print()
+        if changes and not TEST_MODE:
+            write_cursor.executemany(update_query, changes)
+            write_conn.commit()
+        elapsed = time.perf_counter() - start_time
+        print(f"  {stats['rows']} rows, {stats['updated']} changed "
+              f"({stats['rows'] / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+
+    # The chunk's rows are its context, for showing the original values
+    chunks = ((rows, rows) for rows in iter_chunks(read_conn, table, field, id_field, CHUNK_SIZE))
+    try:
+        _run_cleaning(chunks, write_changes)
+    except mysql.connector.Error as e:
+        print(f"✗ Database error: {e}")
+        write_conn.rollback()
+    finally:
+        write_cursor.close()
+        write_conn.close()
+        read_conn.close()
+
+    elapsed = time.perf_counter() - start_time
+    print()
+    print("=" * 60)
+    print("Summary:")
+    print(f"  Total records: {stats['rows']}")
+    print(f"  Updated: {stats['updated']}")
+    print(f"  Unchanged: {stats['rows'] - stats['updated']}")
+    print(f"  Runtime: {elapsed:.2f}s ({stats['rows'] / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+    if TEST_MODE:
+        print()
+        print("NOTE: Test mode was enabled - no changes were made to the database.")
+        print("      Set TEST_MODE = False to apply changes.")
+    print("=" * 60)
+
+
+def clean_field_incremental(table=TABLE_NAME, field=FIELD_NAME, id_field=ID_FIELD):
+    """Clean only the rows that are new or changed since the last run."""
+    if CHANGE_DETECTION not in ("hash", "watermark"):
+        raise ValueError(f"Unknown CHANGE_DETECTION {CHANGE_DETECTION!r}, use 'hash' or 'watermark'")
+    print("=" * 60)
+    print("Database Field Cleaner (incremental)")
+    print("=" * 60)
+    print(f"Database: {DB_CONFIG['database']}")
+    print(f"Table: {table}")
+    print(f"Field: {field}")
+    print(f"Change detection: {CHANGE_DETECTION}, fingerprints: {FINGERPRINT_FILE}")
+    print(f"Mode: {'TEST (no changes will be made)' if TEST_MODE else 'LIVE (database will be updated)'}")
+    print("=" * 60)
+    print()
+
+    try:
+        read_conn = mysql.connector.connect(**DB_CONFIG)
+        write_conn = mysql.connector.connect(**DB_CONFIG)
+        write_cursor = write_conn.cursor()
+        print("✓ Connected to database")
+        print()
+    except mysql.connector.Error as e:
+        print(f"✗ Error connecting to database: {e}")
+        return
+
+    store = FingerprintStore(FINGERPRINT_FILE)
+    after = store.watermark(table, field) if CHANGE_DETECTION == "watermark" else None
+    diff_path = DIFF_REPORT_FILE.format(table=table, field=field)
+    diff_file = open(diff_path, 'w', encoding='utf-8') if TEST_MODE else None
+    update_query = f"UPDATE {table} SET {field} = %s WHERE {id_field} = %s"
+    stats = {"scanned": 0, "skipped": 0, "cleaned": 0, "updated": 0, "shown": 0}
+    start_time = time.perf_counter()
+
+    def candidate_chunks():
+        """(server hashes, rows) for the rows whose hash differs from the store."""
+        for hashes in iter_chunks(read_conn, table, f"MD5({field})", id_field, CHUNK_SIZE, after):
+            stats["scanned"] += len(hashes)
+            known = store.get_many(table, field, [record_id for record_id, _ in hashes])
+            changed = {record_id: digest for record_id, digest in hashes if known.get(str(record_id)) != digest}
+            stats["skipped"] += len(hashes) - len(changed)
+            if not changed:
+                # Still goes through the pool, so the watermark advances in order
+                yield ({}, [], hashes[-1][0]), []
+                continue
+            cursor = read_conn.cursor()
+            ids = list(changed)
+            cursor.execute(f"SELECT {id_field}, {field} FROM {table} WHERE {id_field} IN "
+                           f"({', '.join(['%s'] * len(ids))})", ids)
+            rows = cursor.fetchall()
+            cursor.close()
+            yield (changed, rows, hashes[-1][0]), rows
+
+    def handle(context, result):
+        server_hashes, rows, last_id = context
+        seen, changes = result
+        stats["cleaned"] += seen
+        stats["updated"] += len(changes)
+        cleaned_by_id = {record_id: cleaned_value for cleaned_value, record_id in changes}
+
+        if TEST_MODE:
+            originals = dict(rows)
+            for cleaned_value, record_id in changes:
+                diff_file.write(f"{id_field} {record_id}\n- {originals[record_id]!r}\n+ {cleaned_value!r}\n\n")
+                if stats["shown"] < PRINT_CHANGES_LIMIT:
+                    stats["shown"] += 1
+                    original_value = originals[record_id]
+                    print(f"Record ID: {record_id}")
+                    print(f"  Original: {original_value[:100]}{'...' if len(original_value) > 100 else ''}")
+                    print(f"  Cleaned:  {cleaned_value[:100]}{'...' if len(cleaned_value) > 100 else ''}")
+                    print()
+            return
+
+        if changes:
+            write_cursor.executemany(update_query, changes)
+            write_conn.commit()
+        # Fingerprint of the value as it is now in the database
+        store.put_many(table, field, {
+            record_id: value_hash(cleaned_by_id[record_id]) if record_id in cleaned_by_id else digest
+            for record_id, digest in server_hashes.items()
+        })
+        store.set_watermark(table, field, last_id)
+        store.commit()
+
+    try:
+        _run_cleaning(candidate_chunks(), handle)
+    except mysql.connector.Error as e:
+        print(f"✗ Database error: {e}")
+        write_conn.rollback()
+    finally:
+        write_cursor.close()
+        write_conn.close()
+        read_conn.close()
+        store.close()
+        if diff_file:
+            diff_file.close()
+
+    elapsed = time.perf_counter() - start_time
+    print()
+    print("=" * 60)
+    print("Summary:")
+    print(f"  Rows checked: {stats['scanned']}")
+    print(f"  Unchanged since last run (skipped): {stats['skipped']}")
+    print(f"  New or changed (cleaned): {stats['cleaned']}")
+    print(f"  Updated: {stats['updated']}")
+    print(f"  Runtime: {elapsed:.2f}s ({stats['scanned'] / elapsed if elapsed > 0 else 0:.0f} rows/s checked)")
+    if TEST_MODE:
+        print()
+        print(f"NOTE: Test mode was enabled - no changes were made; they are listed in {diff_path}.")
+        print("      Set TEST_MODE = False to apply changes.")
+    print("=" * 60)
+
+
 def main():
     """Main function to clean database field."""
     print("=" * 60)
@@ -159,4 +440,17 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 2:
+        TABLE_NAME, FIELD_NAME = sys.argv[1], sys.argv[2]
+        ID_FIELD = sys.argv[3] if len(sys.argv) > 3 else ID_FIELD
+        # They are put into the SQL as they are, so only plain identifiers
+        for name in (TABLE_NAME, FIELD_NAME, ID_FIELD):
+            if not _IDENTIFIER_RE.fullmatch(name):
+                print(f"✗ Invalid table or field name: {name!r}")
+                sys.exit(1)
+    if INCREMENTAL:
+        clean_field_incremental(TABLE_NAME, FIELD_NAME, ID_FIELD)
+    elif STREAMING_MODE:
+        clean_field_streaming(TABLE_NAME, FIELD_NAME, ID_FIELD)
+    else:
+        main()
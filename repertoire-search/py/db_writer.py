@@ -0,0 +1,114 @@
+"""
+Batched, transactional upsert writer for MariaDB.
+
+Rows are buffered and written with one executemany() call (which
+mysql.connector turns into a single multi-row INSERT ... ON DUPLICATE KEY
+UPDATE) every `batch_size` rows or `flush_interval` seconds, whichever
+comes first, and committed per flush. A crash can only lose the rows
+added since the last flush.
+
+Every row can carry a payload; `on_commit(payloads)` is called after a
+successful commit, so callers can mark work as done only once it is
+really in the database. If a batch fails it is rolled back and retried
+row by row, so one bad row does not take the whole batch down;
+`on_error(payload, error)` is called for the rows that still fail.
+"""
+
+import time
+
+import mysql.connector
+
+
+TEOSED_KOOSSEISUD_COLUMNS = ["teosed_id", "pealkiri", "koosseis_tekst", "intrumentatsioon"]
+
+
+def upsert_query(table, columns, key_columns=1):
+    """INSERT ... ON DUPLICATE KEY UPDATE for all columns after the first `key_columns`."""
+    placeholders = ", ".join(["%s"] * len(columns))
+    updates = ", ".join(f"{column} = VALUES({column})" for column in columns[key_columns:])
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({placeholders}) "
+        f"ON DUPLICATE KEY UPDATE {updates}"
+    )
+
+
+class BatchedUpsertWriter:
+    def __init__(self, conn, table, columns, key_columns=1, batch_size=500, flush_interval=5.0,
+                 on_commit=None, on_error=None):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.query = upsert_query(table, columns, key_columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self.on_error = on_error
+        self._rows = []
+        self._payloads = []
+        self._last_flush = time.monotonic()
+
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.flush_count = 0
+        self.flush_latencies = []
+
+    def add(self, row, payload=None):
+        """Buffer one row; flushes when the batch is full or the interval has passed."""
+        self._rows.append(row)
+        self._payloads.append(payload)
+        if len(self._rows) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write and commit the buffered rows."""
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        rows, payloads = self._rows, self._payloads
+        self._rows, self._payloads = [], []
+
+        started = time.perf_counter()
+        try:
+            self.cursor.executemany(self.query, rows)
+            self.conn.commit()
+            committed = payloads
+        except mysql.connector.Error as e:
+            print(f"  -> Batch of {len(rows)} rows failed ({e}), retrying row by row")
+            self.conn.rollback()
+            committed = self._write_one_by_one(rows, payloads)
+        self.flush_latencies.append(time.perf_counter() - started)
+        self.flush_count += 1
+        self.rows_written += len(committed)
+
+        if self.on_commit:
+            self.on_commit(committed)
+
+    def _write_one_by_one(self, rows, payloads):
+        committed = []
+        for row, payload in zip(rows, payloads):
+            try:
+                self.cursor.execute(self.query, row)
+                committed.append(payload)
+            except mysql.connector.Error as e:
+                self.rows_failed += 1
+                if self.on_error:
+                    self.on_error(payload, e)
+                else:
+                    print(f"  -> DB Error: {e}")
+        self.conn.commit()
+        return committed
+
+    def close(self):
+        self.flush()
+        self.cursor.close()
+
+    def print_stats(self):
+        latencies = sorted(self.flush_latencies)
+        if not latencies:
+            print("DB writer: nothing written")
+            return
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        print(f"DB writer: {self.rows_written} rows in {self.flush_count} flushes "
+              f"({self.rows_failed} failed), flush latency p50 {p50 * 1000:.1f}ms, "
+              f"p95 {p95 * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms")
@@ -0,0 +1,122 @@
+"""
+Offline stand-in for genai.Client, covering the part of the Batch API the
+batch scripts use: files.upload / files.download and batches.create /
+batches.get.
+
+A job moves PENDING -> RUNNING -> SUCCEEDED, one step every `steps_per_state`
+calls of batches.get. Every `fail_every`-th job fails instead. The output
+of a job has one result line per request line of the uploaded file (plain
+or gzipped JSONL). The response text is the local parser's result for the
+koosseis, or a minimal instrumentation object if the parser does not
+understand the string.
+
+Uploads, jobs and outputs are kept in `state_dir`, so a restarted script
+finds the jobs it submitted before, as it would with the real API.
+"""
+
+import gzip
+import json
+import os
+import shutil
+from types import SimpleNamespace
+
+from koosseis_parser import KoosseisParser
+from prepare_batch_file import QUERY_PREFIX
+
+
+STATES = ["JOB_STATE_PENDING", "JOB_STATE_RUNNING", "JOB_STATE_SUCCEEDED"]
+
+
+def _job_state(name):
+    return SimpleNamespace(name=name)
+
+
+class _Files:
+    def __init__(self, client):
+        self.client = client
+
+    def upload(self, file, config=None):
+        name = f"files/fake-upload-{len(self.client.uploads)}"
+        self.client.uploads[name] = os.path.abspath(str(file))
+        self.client.save()
+        return SimpleNamespace(name=name)
+
+    def download(self, file, destination=None, config=None):
+        with open(self.client.outputs[file], 'rb') as src:
+            if destination is None:
+                return src.read()
+            with open(destination, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        return None
+
+
+class _Batches:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, model, src, config=None):
+        index = len(self.client.jobs)
+        name = f"batches/fake-job-{index}"
+        failing = self.client.fail_every and (index + 1) % self.client.fail_every == 0
+        self.client.jobs[name] = {"src": src, "polls": 0, "failing": failing}
+        self.client.save()
+        return SimpleNamespace(name=name, state=_job_state(STATES[0]), dest=None, error=None)
+
+    def get(self, name):
+        job = self.client.jobs[name]
+        job["polls"] += 1
+        self.client.save()
+        step = min(len(STATES) - 1, job["polls"] // self.client.steps_per_state)
+        state = STATES[step]
+        if state == "JOB_STATE_SUCCEEDED" and job["failing"]:
+            return SimpleNamespace(name=name, state=_job_state("JOB_STATE_FAILED"), dest=None,
+                                   error="fake failure")
+        dest = None
+        if state == "JOB_STATE_SUCCEEDED":
+            dest = SimpleNamespace(file_name=self.client.write_output(name, job["src"]))
+        return SimpleNamespace(name=name, state=_job_state(state), dest=dest, error=None)
+
+
+class FakeClient:
+    def __init__(self, state_dir=".fake_genai", steps_per_state=2, fail_every=0):
+        self.state_dir = state_dir
+        self.steps_per_state = steps_per_state
+        self.fail_every = fail_every
+        self.uploads = {}  # uploaded file name -> local path
+        self.jobs = {}
+        self.outputs = {}  # output file name -> local path
+        self.files = _Files(self)
+        self.batches = _Batches(self)
+        self._parser = KoosseisParser()
+        os.makedirs(state_dir, exist_ok=True)
+        self._state_path = os.path.join(state_dir, "state.json")
+        if os.path.exists(self._state_path):
+            with open(self._state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.uploads, self.jobs, self.outputs = state["uploads"], state["jobs"], state["outputs"]
+
+    def save(self):
+        with open(self._state_path, 'w', encoding='utf-8') as f:
+            json.dump({"uploads": self.uploads, "jobs": self.jobs, "outputs": self.outputs}, f)
+
+    def write_output(self, job_name, src):
+        output_name = f"files/fake-output-{job_name.rsplit('-', 1)[-1]}"
+        if output_name in self.outputs:
+            return output_name
+        path = os.path.join(os.path.abspath(self.state_dir), output_name.rsplit('/', 1)[-1] + ".jsonl")
+        local_path = self.uploads[src]
+        opener = gzip.open if local_path.endswith(".gz") else open
+        with opener(local_path, 'rt', encoding='utf-8') as f, open(path, 'w', encoding='utf-8') as out:
+            for line in f:
+                request = json.loads(line)
+                text = request["request"]["contents"][0]["parts"][0]["text"].removeprefix(QUERY_PREFIX)
+                instrumentation = self._parser.parse(text) or {"parts": [], "note": text}
+                out.write(json.dumps({
+                    "key": request["key"],
+                    "response": {"candidates": [{"content": {"parts": [
+                        {"text": json.dumps({"instrumentation": instrumentation}, ensure_ascii=False)}
+                    ]}}]}
+                }, ensure_ascii=False) + '\n')
+        self.outputs[output_name] = path
+        self.save()
+        return output_name
@@ -0,0 +1,68 @@
+"""
+Local store of fingerprints of cleaned database values.
+
+For every (table, field, id) it keeps the MD5 of the value as it was after
+the last cleaning run, plus a watermark (highest id seen) per (table,
+field). A cleaning run compares them with MD5(field) computed by the
+database server, so only new and changed rows are fetched and cleaned.
+
+The store is a SQLite file (clean_fingerprints.sqlite by default).
+"""
+
+import hashlib
+import sqlite3
+
+
+def value_hash(value):
+    """MD5 hex digest of a value, as MySQL's MD5() computes it for UTF-8 text."""
+    if value is None:
+        return None
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+class FingerprintStore:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "tbl TEXT, field TEXT, id TEXT, hash TEXT, PRIMARY KEY (tbl, field, id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks (tbl TEXT, field TEXT, max_id TEXT, PRIMARY KEY (tbl, field))"
+        )
+
+    def get_many(self, table, field, ids):
+        """{id: hash} for the ids that have a fingerprint (ids as str)."""
+        found = {}
+        ids = [str(record_id) for record_id in ids]
+        # SQLite limits the number of host parameters per statement
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            query = (f"SELECT id, hash FROM fingerprints WHERE tbl = ? AND field = ? "
+                     f"AND id IN ({', '.join('?' * len(part))})")
+            found.update(self.conn.execute(query, [table, field, *part]))
+        return found
+
+    def put_many(self, table, field, hashes):
+        """Record {id: hash}; committed together with the watermark in commit()."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+            [(table, field, str(record_id), digest) for record_id, digest in hashes.items()]
+        )
+
+    def watermark(self, table, field):
+        row = self.conn.execute(
+            "SELECT max_id FROM watermarks WHERE tbl = ? AND field = ?", (table, field)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, table, field, max_id):
+        self.conn.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)", (table, field, str(max_id)))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -1,104 +1,185 @@
+import glob
 import json
-mport re
+import os
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
 import mysql.connector
 
+from batch_orchestrator import load_job_outputs
+from db_writer import TEOSED_KOOSSEISUD_COLUMNS, BatchedUpsertWriter
+from json_repair import parse_model_json
+from koosseis_dedup import load_manifest
+from work_index import WorkIndex
+
 # --- Configuration ---
 ORIGINAL_DATA_FILE = "teosed_koik.json"
 BATCH_RESULTS_FILE = "gemini_results_final.jsonl"
+BATCH_RESULTS_PATTERN = "gemini_results-*.jsonl"  # per-shard outputs of run_batch_process.py
+# Job state of run_batch_process.py; when present, the outputs listed in it
+# are used instead of BATCH_RESULTS_PATTERN
+JOB_STATE_FILE = "gemini_batch_jobs.json"
+# Results of the local parser (prepare_batch_file.py), loaded after the batch results if present
+LOCAL_RESULTS_FILE = "local_parser_results.jsonl"
+# Written by the prepare scripts when identical strings were sent once;
+# a result whose key is in the manifest is inserted for all its works
+MANIFEST_FILE = "gemini_batch_manifest.json"
 DB_CONFIG = {
     "host": "localhost",
     "user": "emic",
     "password": "tobias",
     "database": "emic"
 }
+DB_TABLE = "teosed_koosseisud"
+DB_BATCH_SIZE = 1000  # rows per multi-row upsert and commit
+DB_FLUSH_INTERVAL = 5.0  # seconds
 
-
-def _extract_json_candidates(raw_text):
-    text = (raw_text or "").strip()
-    if not text:
-        return []
-
-    fenced = re.findall(r"```(?:json)?\s*(.*?)\s*```", text, flags=re.DOTALL | re.IGNORECASE)
-    if fenced:
-        return [block.strip() for block in fenced if block and block.strip()]
-    return [text]
+# Streaming mode: works are looked up in an on-disk index of
+# ORIGINAL_DATA_FILE and result lines are parsed (and repaired) by a pool
+# of worker processes, so memory does not depend on the corpus size
+STREAMING_MODE = True
+PARSE_WORKERS = cpu_count()
+PARSE_CHUNK_LINES = 2000  # result lines per worker task
+PARSE_CHUNKS_AHEAD = 2 * PARSE_WORKERS  # chunks being parsed while rows are written
 
 
-def _repair_json_text(text):
-    repaired = []
-    in_string = False
-    escaped = False
-    length = len(text)
-
-    for index, char in enumerate(text):
-        if in_string:
-            if escaped:
-                repaired.append(char)
-                escaped = False
-                continue
-
-            if char == "\\":
-                repaired.append(char)
-                escaped = True
-                continue
+def _parse_result_line(line):
+    """Parse one batch result line -> (work_id, instrumentation JSON text, error)."""
+    try:
+        batch_item = json.loads(line)
+    except json.JSONDecodeError as e:
+        return None, None, f"invalid result line: {e}"
+    work_id = batch_item.get("key")
+    if "instrumentation" in batch_item:
+        return work_id, json.dumps(batch_item["instrumentation"], ensure_ascii=False), None
+    try:
+        raw_response = batch_item['response']['candidates'][0]['content']['parts'][0]['text']
+        instrumentation_json = parse_model_json(raw_response)
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+        return work_id, None, str(e)
+    return work_id, json.dumps(instrumentation_json, ensure_ascii=False), None
+
+
+def result_files():
+    files = [BATCH_RESULTS_FILE] if os.path.exists(BATCH_RESULTS_FILE) else []
+    if os.path.exists(JOB_STATE_FILE):
+        # Only the outputs the orchestrator downloaded for the current shards
+        files.extend(path for path in load_job_outputs(JOB_STATE_FILE) if os.path.exists(path))
+    else:
+        files.extend(sorted(glob.glob(BATCH_RESULTS_PATTERN)))
+    if LOCAL_RESULTS_FILE and os.path.exists(LOCAL_RESULTS_FILE):
+        files.append(LOCAL_RESULTS_FILE)
+    return files
+
+
+def load_work_ids():
+    """{request key: [work ids]} from MANIFEST_FILE, or {} (keys are work ids)."""
+    if MANIFEST_FILE and os.path.exists(MANIFEST_FILE):
+        manifest = load_manifest(MANIFEST_FILE)
+        print(f"Manifest {MANIFEST_FILE}: {len(manifest)} request keys for "
+              f"{sum(len(ids) for ids in manifest.values())} works")
+        return manifest
+    return {}
+
+
+def _parse_result_chunk(lines):
+    return [_parse_result_line(line) for line in lines if line.strip()]
+
+
+def _parse_in_pool(f, pool, write_rows):
+    """
+    Parse the result file in chunks in the pool. A bounded number of chunks
+    is in the pool at any time; the rows of finished chunks are written in
+    file order by the calling process. Returns the number of parsed lines.
+    """
+    parsed_count = 0
+    pending = deque()
+    while True:
+        lines = list(islice(f, PARSE_CHUNK_LINES))
+        if lines:
+            pending.append(pool.apply_async(_parse_result_chunk, (lines,)))
+        if pending and (len(pending) >= PARSE_CHUNKS_AHEAD or not lines):
+            results = pending.popleft().get()
+            parsed_count += len(results)
+            write_rows(results)
+        elif not lines:
+            return parsed_count
+
+
+def insert_results_streaming(results_files=None):
+    """Insert the given result files (default: result_files())."""
+    start_time = time.perf_counter()
+    index = WorkIndex(ORIGINAL_DATA_FILE)
+
+    def report_db_error(work_id, e):
+        print(f"DB Error for ID {work_id}: {e}")
 
-            if char == "\n":
-                repaired.append("\\n")
-                continue
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+        writer = BatchedUpsertWriter(
+            conn, DB_TABLE, TEOSED_KOOSSEISUD_COLUMNS,
+            batch_size=DB_BATCH_SIZE,
+            flush_interval=DB_FLUSH_INTERVAL,
+            on_error=report_db_error
+        )
+    except mysql.connector.Error as e:
+        print(f"Error connecting to MariaDB: {e}")
+        index.close()
+        return
 
-            if char == '"':
-                lookahead = index + 1
-                while lookahead < length and text[lookahead] in " \t\r\n":
-                    lookahead += 1
-                next_char = text[lookahead] if lookahead < length else ""
-
-                if next_char in {",", "}", "]", ":", ""}:
-                    repaired.append('"')
-                    in_string = False
-                else:
-                    repaired.append('\\"')
+    work_ids = load_work_ids()
+    print(f"Processing batch results with {PARSE_WORKERS} parser processes...")
+    parsed_count = 0
+    parse_errors = 0
+    missing = 0
+
+    def write_rows(results):
+        nonlocal parse_errors, missing
+        originals = index.get_many([work_id for key, _, error in results if error is None
+                                    for work_id in work_ids.get(key, [key])])
+        for key, instrumentation_text, error in results:
+            if error is not None:
+                parse_errors += 1
+                print(f"Error parsing Gemini response for ID {key}: {error}")
                 continue
+            for work_id in work_ids.get(key, [key]):
+                original_work = originals.get(str(work_id))
+                if not original_work:
+                    missing += 1
+                    print(f"Warning: ID {work_id} not found in original JSON.")
+                    continue
+                writer.add((
+                    work_id,
+                    original_work['pealkiri'],
+                    original_work['koosseis'],
+                    instrumentation_text
+                ), work_id)
+
+    for results_file in results_files or result_files():
+        with open(results_file, 'r', encoding='utf-8') as f:
+            if PARSE_WORKERS <= 1:
+                # A single core gains nothing from a pool, only pickling overhead
+                for lines in iter(lambda: list(islice(f, PARSE_CHUNK_LINES)), []):
+                    results = _parse_result_chunk(lines)
+                    parsed_count += len(results)
+                    write_rows(results)
+            else:
+                with Pool(PARSE_WORKERS) as pool:
+                    parsed_count += _parse_in_pool(f, pool, write_rows)
+
+    writer.close()
+    conn.close()
+    index.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"Finished! Successfully updated {writer.rows_written} rows in '{DB_TABLE}'.")
+    print(f"Result lines: {parsed_count}, parse errors: {parse_errors}, missing from original data: {missing}")
+    print(f"Total runtime: {elapsed:.2f}s ({parsed_count / elapsed if elapsed > 0 else 0:.0f} lines/s)")
+    writer.print_stats()
 
-            repaired.append(char)
-            continue
-
-        repaired.append(char)
-        if char == '"':
-            in_string = True
-
-    return "".join(repaired)
-
-
-def _parse_instrumentation_response(raw_text):
-    decoder = json.JSONDecoder()
-
-    for candidate in _extract_json_candidates(raw_text):
-        try:
-            return json.loads(candidate)
-        except json.JSONDecodeError:
-            pass
-
-        try:
-            parsed, _ = decoder.raw_decode(candidate)
-            return parsed
-        except json.JSONDecodeError:
-            pass
-
-        repaired = _repair_json_text(candidate)
-        try:
-            return json.loads(repaired)
-        except json.JSONDecodeError:
-            pass
-
-        try:
-            parsed, _ = decoder.raw_decode(repaired)
-            return parsed
-        except json.JSONDecodeError:
-            pass
-
-    raise json.JSONDecodeError("Could not parse model JSON", raw_text or "", 0)
 
-def insert_results():
+def insert_results(results_files=None):
     # 1. Load original data into a lookup dictionary {id: {pealkiri, koosseis}}
     print("Loading original data for lookup...")
     with open(ORIGINAL_DATA_FILE, 'r', encoding='utf-8') as f:
@@ -107,65 +188,68 @@ def insert_results():
         lookup = {str(item['id']): item for item in original_list}
 
     # 2. Connect to Database
+    def report_db_error(work_id, e):
+        print(f"DB Error for ID {work_id}: {e}")
+
     try:
         conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+        writer = BatchedUpsertWriter(
+            conn, DB_TABLE, TEOSED_KOOSSEISUD_COLUMNS,
+            batch_size=DB_BATCH_SIZE,
+            flush_interval=DB_FLUSH_INTERVAL,
+            on_error=report_db_error
+        )
     except mysql.connector.Error as e:
         print(f"Error connecting to MariaDB: {e}")
         return
 
     # 3. Process Batch Results
-    inserted_count = 0
+    work_ids = load_work_ids()
     print("Processing batch results and inserting to DB...")
     
-    with open(BATCH_RESULTS_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            batch_item = json.loads(line)
-            work_id = batch_item.get("key") # This is our ID
-            
-            # Get the raw string response from Gemini
-            try:
-                raw_response = batch_item['response']['candidates'][0]['content']['parts'][0]['text']
-                instrumentation_json = _parse_instrumentation_response(raw_response)
-            except (KeyError, json.JSONDecodeError) as e:
-                print(f"Error parsing Gemini response for ID {work_id}: {e}")
-                continue
-
-            # Look up missing info from our original data
-            original_work = lookup.get(work_id)
-            if not original_work:
-                print(f"Warning: ID {work_id} not found in original JSON.")
-                continue
-
-            title = original_work.get('pealkiri')
-            original_text = original_work.get('koosseis')
-
-            # 4. Insert into MariaDB
-            query = """
-                INSERT INTO teosed_koosseisud 
-                (teosed_id, pealkiri, koosseis_tekst, intrumentatsioon)
-                VALUES (%s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                pealkiri = VALUES(pealkiri),
-                koosseis_tekst = VALUES(koosseis_tekst),
-                intrumentatsioon = VALUES(intrumentatsioon)
-            """
+    for results_file in results_files or result_files():
+        with open(results_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                batch_item = json.loads(line)
+                work_id = batch_item.get("key") # This is our ID
             
-            try:
-                cursor.execute(query, (
-                    work_id, 
-                    title, 
-                    original_text, 
-                    json.dumps(instrumentation_json, ensure_ascii=False)
-                ))
-                inserted_count += 1
-            except mysql.connector.Error as e:
-                print(f"DB Error for ID {work_id}: {e}")
-
-    conn.commit()
-    cursor.close()
+                # Get the raw string response from Gemini
+                try:
+                    if "instrumentation" in batch_item:
+                        instrumentation_json = batch_item["instrumentation"]
+                    else:
+                        raw_response = batch_item['response']['candidates'][0]['content']['parts'][0]['text']
+                        instrumentation_json = parse_model_json(raw_response)
+                except (KeyError, json.JSONDecodeError) as e:
+                    print(f"Error parsing Gemini response for ID {work_id}: {e}")
+                    continue
+
+                # A deduplicated result goes to every work with that string
+                for original_id in work_ids.get(work_id, [work_id]):
+                    # Look up missing info from our original data
+                    original_work = lookup.get(original_id)
+                    if not original_work:
+                        print(f"Warning: ID {original_id} not found in original JSON.")
+                        continue
+
+                    title = original_work.get('pealkiri')
+                    original_text = original_work.get('koosseis')
+
+                    # 4. Queue for MariaDB (written in batches)
+                    writer.add((
+                        original_id,
+                        title,
+                        original_text,
+                        json.dumps(instrumentation_json, ensure_ascii=False)
+                    ), original_id)
+
+    writer.close()
     conn.close()
-    print(f"Finished! Successfully updated {inserted_count} rows in 'teosed_koosseisud'.")
+    print(f"Finished! Successfully updated {writer.rows_written} rows in '{DB_TABLE}'.")
+    writer.print_stats()
 
 if __name__ == "__main__":
-    insert_results()
\ No newline at end of file
+    if STREAMING_MODE:
+        insert_results_streaming()
+    else:
+        insert_results()
\ No newline at end of file
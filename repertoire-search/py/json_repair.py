@@ -0,0 +1,119 @@
+"""
+Shared parser for JSON returned by the model.
+
+parse_model_json() works on the contents of ```json fenced blocks if there
+are any, otherwise on the whole text, and tries in order:
+
+  1. strict json.loads (the common case); text before the first '{' is
+     skipped, and raw_decode is used only if the error is trailing text
+  2. one repair pass, then the same decoding of the result
+  3. the text between the first '{' and the last '}', when prose after
+     the JSON got in the way of the repair
+
+The repair pass fixes the two typical mistakes of the model: raw newlines
+(and tabs) inside strings, and unescaped double quotes inside strings. A
+quote closes a string only if the next non-blank character is one of
+, } ] : or the end of the text; any other quote is escaped. The scanner
+jumps from one quote / backslash / control character to the next with a
+regex instead of looking at every character in Python.
+"""
+
+import json
+import re
+
+
+_FENCED_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_SPECIAL_RE = re.compile(r'["\\\n\r\t]')
+_NEXT_NONBLANK_RE = re.compile(r'[ \t\r\n]*(.?)', re.DOTALL)
+_QUOTE_CLOSERS = {",", "}", "]", ":", ""}
+_ESCAPED_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+_decoder = json.JSONDecoder()
+
+
+def repair_json_text(text):
+    """Escape raw control characters and stray quotes inside JSON strings (single pass)."""
+    parts = []
+    in_string = False
+    position = 0
+    search = _SPECIAL_RE.search
+    while True:
+        match = search(text, position)
+        if match is None:
+            parts.append(text[position:])
+            break
+        index = match.start()
+        char = text[index]
+        parts.append(text[position:index])
+        position = index + 1
+        if not in_string:
+            parts.append(char)
+            if char == '"':
+                in_string = True
+        elif char == "\\":
+            # Keep the escape sequence as it is
+            parts.append(text[index:index + 2])
+            position = index + 2
+        elif char == '"':
+            next_char = _NEXT_NONBLANK_RE.match(text, position).group(1)
+            if next_char in _QUOTE_CLOSERS:
+                parts.append('"')
+                in_string = False
+            else:
+                parts.append('\\"')
+        else:
+            parts.append(_ESCAPED_CONTROL[char])
+    return "".join(parts)
+
+
+def _candidates(text):
+    if "```" in text:
+        fenced = [block.strip() for block in _FENCED_RE.findall(text) if block.strip()]
+        if fenced:
+            return fenced
+        # Unclosed fence: drop the opening line
+        return [re.sub(r"^```(?:json)?\s*", "", text, flags=re.IGNORECASE).rstrip("`").strip()]
+    return [text]
+
+
+def _decode(text):
+    """loads; raw_decode only when the JSON is followed by other text. Raises JSONDecodeError."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        if e.msg != "Extra data":
+            raise
+        return _decoder.raw_decode(text)[0]
+
+
+def _parse_candidate(text):
+    if text[:1] not in ("{", "["):
+        # Prose before the JSON
+        start = text.find("{")
+        if start < 0:
+            raise json.JSONDecodeError("No JSON object found", text, 0)
+        text = text[start:]
+    try:
+        return _decode(text)
+    except json.JSONDecodeError:
+        return _decode(repair_json_text(text))
+
+
+def parse_model_json(raw_text):
+    """Parse model output into a Python object; raises json.JSONDecodeError if nothing works."""
+    text = (raw_text or "").strip()
+    for candidate in _candidates(text):
+        try:
+            return _parse_candidate(candidate)
+        except json.JSONDecodeError:
+            pass
+
+    # Prose with quotes after the JSON can derail the repair: cut at the last '}'
+    start, end = text.find("{"), text.rfind("}")
+    if 0 <= start < end and end < len(text) - 1:
+        try:
+            return _parse_candidate(text[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+
+    raise json.JSONDecodeError("Could not parse model JSON", raw_text or "", 0)
@@ -0,0 +1,91 @@
+"""
+Deduplication of koosseis strings before batching.
+
+Many works share the same instrumentation text ("klaver", "segakoor a
+cappella"), often differing only in case, spacing or a trailing period.
+The batch scripts send each distinct normalized string once, under a key
+derived from the normalized string ("t" + 16 hex digits of its SHA-1),
+with the text of the first work of the group. A manifest maps every key
+to its work ids:
+
+    {"t3f2a...": {"text": "Segakoor a cappella", "ids": ["12", "40", ...]}, ...}
+
+insert_batch_results_to_database.py expands a result with such a key to
+all the works in the manifest; keys that are not in the manifest are
+work ids, as before.
+"""
+
+import hashlib
+import json
+import re
+
+
+CHARS_PER_TOKEN = 4  # rough estimate for the token report
+
+_SPACE_RE = re.compile(r"\s+")
+_PUNCT_SPACE_RE = re.compile(r"\s*([,;:/])\s*")
+
+
+def normalize_koosseis(text):
+    """Case, whitespace and trailing punctuation do not change the meaning."""
+    text = _SPACE_RE.sub(" ", (text or "").strip()).casefold()
+    text = _PUNCT_SPACE_RE.sub(lambda m: m.group(1) + ("" if m.group(1) == "/" else " "), text)
+    return text.rstrip(" .;,")
+
+
+def request_key(normalized_text):
+    return "t" + hashlib.sha1(normalized_text.encode("utf-8")).hexdigest()[:16]
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class KoosseisGroups:
+    """Works grouped by normalized koosseis, in order of first appearance."""
+
+    def __init__(self):
+        self.groups = {}  # key -> {"text": text of the first work, "ids": [work ids]}
+        self.total = 0
+        self.total_chars = 0
+
+    def add(self, work_id, text):
+        """Add a work; returns its request key."""
+        normalized = normalize_koosseis(text)
+        key = request_key(normalized)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {"text": (text or "").strip(), "ids": []}
+        group["ids"].append(str(work_id))
+        self.total += 1
+        self.total_chars += len(text or "")
+        return key
+
+    def __iter__(self):
+        """(key, text, work ids) per distinct string."""
+        for key, group in self.groups.items():
+            yield key, group["text"], group["ids"]
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.groups, f, ensure_ascii=False)
+
+    def print_stats(self, prompt_tokens_per_request=0):
+        """Unique/total ratio and the estimated input tokens saved."""
+        unique = len(self.groups)
+        if not self.total:
+            print("Dedup: no works")
+            return
+        unique_chars = sum(len(group["text"]) for group in self.groups.values())
+        saved_requests = self.total - unique
+        saved_tokens = (saved_requests * prompt_tokens_per_request
+                        + max(0, self.total_chars - unique_chars) // CHARS_PER_TOKEN)
+        print(f"Dedup: {unique} distinct strings for {self.total} works "
+              f"(unique/total {unique / self.total:.3f}), {saved_requests} requests saved, "
+              f"~{saved_tokens} input tokens saved")
+
+
+def load_manifest(path):
+    """{request key: [work ids]} from a manifest written by KoosseisGroups.save()."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {key: group["ids"] for key, group in json.load(f).items()}
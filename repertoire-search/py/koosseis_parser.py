@@ -0,0 +1,357 @@
+"""
+Deterministic parser for simple instrumentation (koosseis) strings.
+
+Most koosseis strings are short lists such as "fl, ob, 2 vn, vc",
+"viiul, klaver" or "segakoor". Their names and abbreviations come
+straight from instruments.json and ensembles.json, so they can be turned
+into the system_prompt.txt structure without a Gemini call.
+
+parse() returns the instrumentation dict (parts, ensembles,
+total_player_count, has_vocal, ...) only if it understands every part of
+the string, otherwise None; those strings (the residue) go to the model
+as before. Anything unusual is left to the model: orchestral shorthand
+("2222, 4231"), parentheses, "4 hands", unknown words.
+
+Understood segments, separated by "," ";" " ja " " and " "&":
+  [count] name [solo]     "2 vn", "viiul", "3x fl", "tp solo"
+  name/name               doubles, one player: "fl/pic"
+  name või name           alternatives: "fl or ob"
+  ensemble name           "segakoor", "string quartet"
+
+Names are matched case-insensitively against abbreviation, name, name_est
+and other_names (ensembles: ensemble_id, name, name_est). Estonian
+partitive and plural endings after a count ("2 viiulit") and English
+plurals ("2 violins") are stripped when the full word is not known.
+
+Usage:
+  python koosseis_parser.py                  coverage, throughput and agreement
+                                             with the teosed_koosseisud rows
+  python koosseis_parser.py teosed_koik.json coverage and throughput on a works file
+"""
+
+import json
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+
+INSTRUMENTS_FILE = Path(__file__).with_name("instruments.json")
+ENSEMBLES_FILE = Path(__file__).with_name("ensembles.json")
+
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "emic",
+    "password": "tobias",
+    "database": "emic"
+}
+DB_TABLE = "teosed_koosseisud"
+DISAGREEMENTS_FILE = "koosseis_parser_disagreements.json"  # written by the agreement benchmark
+DISAGREEMENTS_KEEP = 200
+
+# Generic parts used by the prompt examples that are not in instruments.json
+EXTRA_ALIASES = {
+    "voice": "voice", "hääl": "voice",
+    "accompaniment": "accompaniment", "saade": "accompaniment",
+}
+VOICE_IDS = {"voice", "S", "Ms", "A", "Ca", "CT", "T", "Bar", "Bs", "Bs-Bar", "Treb"}
+
+CHOIR_TYPES = {
+    "mixed_choir": "mixed",
+    "male_choir": "male",
+    "female_choir": "female",
+    "children_choir": "children",
+    "boys_choir": "boys",
+    "youth_choir": "other",
+    "joint_choir": "other",
+}
+VOCAL_ENSEMBLES = {"voice_and_accompaniment", "vocal_ensemble", "female_ensemble", "male_ensemble"}
+# Ensembles with a fixed number of players; all others count as 0 (scalable or unknown)
+FIXED_ENSEMBLE_PLAYERS = {"string_quartet": 4, "saxophone_quartet": 4, "wind_quintet": 5}
+
+_SEGMENT_SPLIT_RE = re.compile(r"\s*(?:[,;&]|\s(?:ja|and)\s)\s*", re.IGNORECASE)
+_ALTERNATIVE_SPLIT_RE = re.compile(r"\s+(?:või|or)\s+", re.IGNORECASE)
+_SEGMENT_RE = re.compile(
+    r"^(?:(?P<count>\d{1,2})\s*[x×]?\s+|(?P<count_x>\d{1,2})\s*[x×])?"
+    r"(?P<name>[^\d()\[\]:+=]+?)"
+    r"(?:\s*[x×]\s*(?P<count_after>\d{1,2}))?"
+    r"(?:\s+(?P<solo>solo|soolo))?$",
+    re.IGNORECASE
+)
+_PLURAL_ENDINGS = ("it", "id", "t", "d", "i", "e", "es", "s")
+
+
+def _normalize(name):
+    return " ".join(name.lower().replace("(hääl)", "").replace("(voice)", "").split())
+
+
+class KoosseisParser:
+    def __init__(self, instruments_file=INSTRUMENTS_FILE, ensembles_file=ENSEMBLES_FILE):
+        with open(instruments_file, 'r', encoding='utf-8') as f:
+            instruments = json.load(f)
+        with open(ensembles_file, 'r', encoding='utf-8') as f:
+            ensembles = json.load(f)
+
+        # alias -> ("instrument" | "ensemble", id); built once, looked up per segment
+        self.index = {}
+        for alias, instrument_id in EXTRA_ALIASES.items():
+            self.index[alias] = ("instrument", instrument_id)
+        for item in instruments:
+            for alias in [item["abbreviation"], item["name"], item["name_est"], *item.get("other_names", [])]:
+                self.index.setdefault(_normalize(alias), ("instrument", item["abbreviation"]))
+        for item in ensembles:
+            ensemble_id = item["ensemble_id"]
+            for alias in [ensemble_id, ensemble_id.replace("_", " "), item["name"], item["name_est"]]:
+                self.index.setdefault(_normalize(alias), ("ensemble", ensemble_id))
+
+        self.parsed = 0
+        self.residue = 0
+        self.unknown_segments = Counter()
+
+    def lookup(self, name, plural=False):
+        """(kind, id) for a name, or None."""
+        key = _normalize(name)
+        found = self.index.get(key)
+        if found is None and plural:
+            for ending in _PLURAL_ENDINGS:
+                if key.endswith(ending) and len(key) > len(ending) + 2:
+                    found = self.index.get(key[:-len(ending)])
+                    if found is not None:
+                        break
+        return found
+
+    def _instrument(self, name, plural):
+        found = self.lookup(name, plural)
+        return found[1] if found and found[0] == "instrument" else None
+
+    def _parse_segment(self, segment):
+        """-> ("ensemble", id) | ("part", part_dict) | None"""
+        match = _SEGMENT_RE.match(segment)
+        if not match:
+            return None
+        count = int(match.group("count") or match.group("count_x") or match.group("count_after") or 1)
+        if count < 1:
+            return None
+        plural = count > 1
+        name = match.group("name").strip()
+
+        alternatives = _ALTERNATIVE_SPLIT_RE.split(name)
+        doubles = alternatives[-1].split("/")
+        if len(alternatives) > 1 and len(doubles) > 1:
+            return None
+        names = alternatives if len(alternatives) > 1 else doubles
+
+        if len(names) == 1:
+            found = self.lookup(name, plural)
+            if found is None:
+                return None
+            if found[0] == "ensemble":
+                return None if match.group("count") or match.group("count_x") or match.group("solo") else found
+        ids = [self._instrument(n, plural) for n in names]
+        if None in ids:
+            return None
+        return ("part", {
+            "instrument_id": ids[0],
+            "alternative_instruments": ids[1:] if len(alternatives) > 1 else [],
+            "doubles": ids[1:] if len(alternatives) == 1 else [],
+            "count": count,
+            "role": "soloist" if match.group("solo") else "normal",
+        })
+
+    def parse(self, text):
+        """Instrumentation dict in the system_prompt.txt structure, or None if not fully understood."""
+        segments = [s for s in _SEGMENT_SPLIT_RE.split((text or "").strip().rstrip(".")) if s]
+        if not segments:
+            self.residue += 1
+            return None
+
+        results = []
+        for segment in segments:
+            result = self._parse_segment(segment)
+            if result is None:
+                self.unknown_segments[_normalize(segment)] += 1
+                self.residue += 1
+                return None
+            results.append(result)
+
+        # Instruments named before an orchestra are its soloists
+        first_orchestra = next((i for i, (kind, value) in enumerate(results)
+                                if kind == "ensemble" and value.endswith("_orchestra")), -1)
+        parts = []
+        ensemble_ids = []
+        for position, (kind, value) in enumerate(results):
+            if kind == "ensemble":
+                if value not in ensemble_ids:
+                    ensemble_ids.append(value)
+                continue
+            if position < first_orchestra:
+                value["role"] = "soloist"
+            parts.append(value)
+
+        self.parsed += 1
+        return self._build(parts, ensemble_ids)
+
+    def _build(self, parts, ensemble_ids):
+        voices = [p for p in parts if p["instrument_id"] in VOICE_IDS]
+        choirs = [e for e in ensemble_ids if e in CHOIR_TYPES]
+        scalable = any(e not in FIXED_ENSEMBLE_PLAYERS for e in ensemble_ids)
+        part_players = sum(p["count"] for p in parts)
+        total = 0 if scalable else part_players + sum(FIXED_ENSEMBLE_PLAYERS.get(e, 0) for e in ensemble_ids)
+
+        ensembles = [{
+            "ensemble_id": ensemble_id,
+            "player_count": FIXED_ENSEMBLE_PLAYERS.get(ensemble_id, 0),
+            "standard": True,
+            "note": "",
+            "note_est": ""
+        } for ensemble_id in ensemble_ids]
+        if not ensembles and part_players > 1:
+            if len(voices) == 1 and voices[0]["count"] == 1 and part_players == 2:
+                ensemble_id, standard = "voice_and_accompaniment", True
+                voices[0]["role"] = "soloist"
+            else:
+                ensemble_id, standard = "chamber_ensemble", False
+            ensembles.append({
+                "ensemble_id": ensemble_id,
+                "player_count": part_players,
+                "standard": standard,
+                "note": "",
+                "note_est": ""
+            })
+
+        instrumentation = {
+            "total_player_count": total,
+            "electronics": None,
+            "has_vocal": bool(voices or choirs or set(ensemble_ids) & VOCAL_ENSEMBLES),
+            "ensembles": ensembles,
+            "parts": parts,
+        }
+        if choirs:
+            instrumentation["vocal_details"] = {
+                "is_choir": True,
+                "choir_type": CHOIR_TYPES[choirs[0]],
+                "voices": 0,
+                "voice_distribution": [],
+                "soloists": [p["instrument_id"] for p in voices],
+                "other": ""
+            }
+        elif voices:
+            distribution = [p["instrument_id"] for p in voices for _ in range(p["count"])]
+            instrumentation["vocal_details"] = {
+                "is_choir": False,
+                "choir_type": "none",
+                "voices": len(distribution),
+                "voice_distribution": distribution,
+                "soloists": [],
+                "other": ""
+            }
+        return instrumentation
+
+    def print_stats(self, elapsed=None):
+        total = self.parsed + self.residue
+        if not total:
+            print("Local parser: nothing parsed")
+            return
+        line = (f"Local parser: {self.parsed}/{total} strings parsed locally "
+                f"({100.0 * self.parsed / total:.1f}% coverage), {self.residue} left for the model")
+        if elapsed:
+            line += f", {total / elapsed:.0f} strings/s"
+        print(line)
+
+
+# --- Benchmarks ---
+
+def _unwrap(instrumentation):
+    if isinstance(instrumentation, dict) and isinstance(instrumentation.get("instrumentation"), dict):
+        return instrumentation["instrumentation"]
+    return instrumentation
+
+
+def comparable_fields(instrumentation):
+    """The fields the search uses, in a form that can be compared."""
+    instrumentation = _unwrap(instrumentation) or {}
+    return {
+        "parts": sorted((str(p.get("instrument_id")), p.get("count") or 1)
+                        for p in instrumentation.get("parts") or [] if isinstance(p, dict)),
+        "ensembles": sorted(str(e.get("ensemble_id")) for e in instrumentation.get("ensembles") or []
+                            if isinstance(e, dict)),
+        "total_player_count": instrumentation.get("total_player_count") or 0,
+        "has_vocal": bool(instrumentation.get("has_vocal")),
+    }
+
+
+def report_coverage(parser, texts):
+    started = time.perf_counter()
+    for text in texts:
+        parser.parse(text)
+    parser.print_stats(time.perf_counter() - started)
+    print("Most common segments left for the model:")
+    for segment, count in parser.unknown_segments.most_common(20):
+        print(f"  {count:>6}  {segment}")
+
+
+def benchmark_works_file(path):
+    from work_index import iter_json_array
+
+    texts = [work.get("koosseis") for work in iter_json_array(path) if work.get("koosseis")]
+    report_coverage(KoosseisParser(), texts)
+
+
+def benchmark_database():
+    """Coverage and throughput on the stored rows, and field agreement with the model's results."""
+    import mysql.connector
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT teosed_id, koosseis_tekst, intrumentatsioon FROM {DB_TABLE}")
+    rows = [row for row in cursor.fetchall() if row[1]]
+    cursor.close()
+    conn.close()
+
+    parser = KoosseisParser()
+    report_coverage(parser, [row[1] for row in rows])
+
+    parser = KoosseisParser()
+    agree = Counter()
+    compared = 0
+    disagreements = []
+    for work_id, text, stored_json in rows:
+        local = parser.parse(text)
+        if local is None:
+            continue
+        try:
+            stored = comparable_fields(json.loads(stored_json))
+        except (TypeError, ValueError):
+            continue
+        compared += 1
+        ours = comparable_fields(local)
+        differing = [field for field in ours if ours[field] != stored[field]]
+        for field in ours:
+            agree[field] += field not in differing
+        agree["all"] += not differing
+        if differing and len(disagreements) < DISAGREEMENTS_KEEP:
+            disagreements.append({
+                "id": work_id,
+                "text": text,
+                "fields": differing,
+                "local": {field: ours[field] for field in differing},
+                "stored": {field: stored[field] for field in differing},
+            })
+
+    if not compared:
+        print("No locally parsed rows with stored instrumentation to compare.")
+        return
+    print(f"Agreement with {DB_TABLE} on {compared} locally parsed rows:")
+    for field in ["parts", "ensembles", "total_player_count", "has_vocal", "all"]:
+        print(f"  {field:<20} {agree[field]:>7}  ({100.0 * agree[field] / compared:.1f}%)")
+    with open(DISAGREEMENTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(disagreements, f, ensure_ascii=False, indent=2)
+    print(f"First {len(disagreements)} disagreements written to {DISAGREEMENTS_FILE}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark_works_file(sys.argv[1])
+    else:
+        benchmark_database()
@@ -1,53 +1,116 @@
 import json
+import os
+
+from batch_shards import ShardedJsonlWriter
+from koosseis_dedup import KoosseisGroups, estimate_tokens
+from koosseis_parser import KoosseisParser
+from work_index import iter_json_array
 
 # Configuration
 INPUT_FILE = 'teosed_koik.json'
 SYSTEM_PROMPT_FILE = 'system_prompt.txt'
+# Shards are written as gemini_batch_input-00000.jsonl, -00001.jsonl, ...
 OUTPUT_FILE = 'gemini_batch_input.jsonl'
+SHARD_MANIFEST_FILE = 'gemini_batch_shards.json'  # shard -> requests, bytes, key range
+SHARD_MAX_REQUESTS = 50000
+SHARD_MAX_BYTES = 1_900_000_000  # uncompressed; the Batch API takes input files up to 2 GB
+COMPRESS = False  # gzip the shards (.jsonl.gz)
+# "inline": the system prompt is repeated in every request
+# "cached": requests refer to the context cache made by upload_context.py
+PROMPT_MODE = "inline"
+CACHE_NAME = "cachedContents/ayo8l0lus1c89w5ppl0ypr1284n9gsuzz7fxvhxa"  # printed by upload_context.py
+MODEL_NAME = "models/gemini-2.5-flash-lite"  # cached mode names the model per request
+# Strings the local parser understands are not sent to the batch; their
+# results go to LOCAL_RESULTS_FILE, which insert_batch_results_to_database.py
+# loads together with the batch results
+LOCAL_PARSER = True
+LOCAL_RESULTS_FILE = 'local_parser_results.jsonl'
+# Works with the same normalized koosseis share one request; MANIFEST_FILE
+# maps each request key to its work ids for the insert script
+DEDUP = True
+MANIFEST_FILE = 'gemini_batch_manifest.json'
+QUERY_PREFIX = "Parse the following instrumentation: "
+
+
+def build_request(instrumentation_text, system_instructions):
+    if PROMPT_MODE == "cached":
+        # Each request is tiny because the instructions are in the cache
+        return {
+            "model": MODEL_NAME,
+            "cached_content": CACHE_NAME,
+            "contents": [
+                {"parts": [{"text": instrumentation_text}]}
+            ]
+        }
+    return {
+        "system_instruction": {
+            "parts": [{"text": system_instructions}]
+        },
+        "contents": [
+            {
+                "role": "user",
+                "parts": [{"text": f"{QUERY_PREFIX}{instrumentation_text}"}]
+            }
+        ],
+        "generationConfig": {
+            "response_mime_type": "application/json"
+        }
+    }
+
 
 def prepare_batch_file():
+    if PROMPT_MODE not in ("inline", "cached"):
+        raise ValueError(f"Unknown PROMPT_MODE {PROMPT_MODE!r}, use 'inline' or 'cached'")
+
     # 1. Load your system prompt
     with open(SYSTEM_PROMPT_FILE, 'r', encoding='utf-8') as f:
         system_instructions = f.read().strip()
 
-    # 2. Load your dataset
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        for entry in data:
-            # We use the 'id' from your JSON as the unique 'key'
-            # This allows you to match the results back to your database later
-            request_id = str(entry.get('id'))
-            
-            # Construct the specific input for the model
+    # 2. Stream your dataset; only the grouped strings are kept in memory
+    if DEDUP:
+        groups = KoosseisGroups()
+        for entry in iter_json_array(INPUT_FILE):
+            groups.add(entry.get('id'), entry.get('koosseis', ''))
+        groups.save(MANIFEST_FILE)
+        # One request per distinct string, keyed by the manifest key
+        requests_to_write = ((key, text) for key, text, _ in groups)
+    else:
+        # We use the 'id' from your JSON as the unique 'key'
+        # This allows you to match the results back to your database later
+        requests_to_write = ((str(entry.get('id')), entry.get('koosseis', ''))
+                             for entry in iter_json_array(INPUT_FILE))
+
+    local_parser = KoosseisParser() if LOCAL_PARSER else None
+    writer = ShardedJsonlWriter(OUTPUT_FILE, SHARD_MANIFEST_FILE, SHARD_MAX_REQUESTS, SHARD_MAX_BYTES, COMPRESS)
+
+    with writer, open(LOCAL_RESULTS_FILE if LOCAL_PARSER else os.devnull, 'w', encoding='utf-8') as local_out:
+        for request_id, instrumentation_text in requests_to_write:
             # We provide the instrumentation string (koosseis) as the primary task
-            instrumentation_text = entry.get('koosseis', '')
-            user_query = f"Parse the following instrumentation: {instrumentation_text}"
+            if local_parser and instrumentation_text:
+                instrumentation = local_parser.parse(instrumentation_text)
+                if instrumentation is not None:
+                    local_out.write(json.dumps({"key": request_id, "instrumentation": instrumentation},
+                                               ensure_ascii=False) + '\n')
+                    continue
 
-            # Create the Batch API structure
-            batch_line = {
+            # Write as a single line of the current shard
+            writer.write(request_id, {
                 "key": request_id,
-                "request": {
-                    "system_instruction": {
-                        "parts": [{"text": system_instructions}]
-                    },
-                    "contents": [
-                        {
-                            "role": "user",
-                            "parts": [{"text": user_query}]
-                        }
-                    ],
-                    "generationConfig": {
-                        "response_mime_type": "application/json"
-                    }
-                }
-            }
-            
-            # Write as a single line in the JSONL file
-            f.write(json.dumps(batch_line) + '\n')
+                "request": build_request(instrumentation_text, system_instructions)
+            })
 
-    print(f"Success! Created {OUTPUT_FILE} with {len(data)} requests.")
+    print(f"Success! Created {len(writer.shards)} shards of {OUTPUT_FILE} with {writer.requests} requests "
+          f"({PROMPT_MODE} prompt), listed in {SHARD_MANIFEST_FILE}.")
+    for shard in writer.shards:
+        print(f"  {shard['file']}: {shard['requests']} requests, {shard['bytes'] / 1e6:.1f} MB uncompressed")
+    if DEDUP:
+        print(f"Manifest written to {MANIFEST_FILE}.")
+        # With the cached prompt a saved request saves little more than its text
+        prompt_tokens = 0 if PROMPT_MODE == "cached" else estimate_tokens(system_instructions + QUERY_PREFIX)
+        groups.print_stats(prompt_tokens)
+    if local_parser:
+        print(f"Locally parsed works written to {LOCAL_RESULTS_FILE}.")
+        local_parser.print_stats()
 
 if __name__ == "__main__":
-    prepare_batch_file()
\ No newline at end of file
+    prepare_batch_file()
@@ -2,16 +2,27 @@ import os
 import sys
 import json
 import time
-import re
-import random
 from pathlib import Path
 import google.generativeai as genai
 import mysql.connector
 
+from db_writer import TEOSED_KOOSSEISUD_COLUMNS, BatchedUpsertWriter
+from json_repair import parse_model_json
+from koosseis_parser import KoosseisParser
+from request_engine import AdaptiveRequestEngine
+from work_journal import WorkJournal, snapshot
+
 # Configuration
 INPUT_FILE = "teosed2.json"
 OUTPUT_FILE = "koosseisud2.json"
 FAILED_FILE = "vead2.json"
+# Every processed work is appended to the journal; works already done are
+# skipped on restart. OUTPUT_FILE / FAILED_FILE are snapshots of the journal.
+JOURNAL_FILE = "koosseisud2.journal.jsonl"
+JOURNAL_FSYNC_EVERY = 50  # records
+JOURNAL_FSYNC_INTERVAL = 5.0  # seconds
+SNAPSHOT_ON_FINISH = True  # write OUTPUT_FILE / FAILED_FILE at the end of a run
+SNAPSHOT_ONLY = False  # only write the snapshot from the journal and exit
 # Database configuration
 DB_CONFIG = {
     "host": "localhost",
@@ -20,51 +31,44 @@ DB_CONFIG = {
     "database": "emic"
 }
 DB_TABLE = "teosed_koosseisud"
-# Free tier limit is often 15 RPM (1.5 Flash) or 5 RPM (newer models). 
-# 15s delay = 4 RPM, which is safe for the 5 RPM limit.
-DELAY_BETWEEN_REQUESTS = 0.5 #15
+# Rows are upserted and committed in batches; works are journaled as done
+# only after their batch is committed
+DB_BATCH_SIZE = 200  # rows
+DB_FLUSH_INTERVAL = 5.0  # seconds
+# Requests run concurrently; the number in flight grows while calls succeed
+# and is halved on 429 / RESOURCE_EXHAUSTED. Free tier limits are low
+# (5-15 RPM), use MAX_CONCURRENCY = 1 there.
+INITIAL_CONCURRENCY = 2
+MAX_CONCURRENCY = 16
+MAX_RETRIES = 5  # on rate limits and 5xx errors
+BACKOFF_BASE = 2.0  # seconds, when the API gives no retry delay
+BACKOFF_MAX = 60.0
+DEAD_LETTER_FILE = "dead_letter2.json"  # works that failed permanently in the last run
+# Simple strings ("fl, ob, 2 vn", "segakoor") are parsed locally from
+# instruments.json / ensembles.json; only the rest goes to the API
+LOCAL_PARSER = True
 
 # Test mode: if True, only process first 10 items
 TEST_MODE = False
 TEST_LIMIT = 3
-START_FROM = 1
+START_FROM = 0  # index of the first work to consider; completed works are skipped anyway
 
 # System prompt
 SYSTEM_PROMPT = Path(__file__).with_name("system_prompt.txt").read_text(encoding="utf-8")
 
-def save_intermediate(results, failed):
-    """Save results to file immediately."""
+def save_snapshot():
+    """Write OUTPUT_FILE and FAILED_FILE from the journal."""
     try:
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        with open(FAILED_FILE, 'w', encoding='utf-8') as f:
-            json.dump(failed, f, ensure_ascii=False, indent=2)
+        successes, failures = snapshot(JOURNAL_FILE, OUTPUT_FILE, FAILED_FILE)
+        print(f"Saved {successes} successes to {OUTPUT_FILE} and {failures} failures to {FAILED_FILE}.")
     except Exception as e:
-        print(f"Warning: Could not save intermediate results: {e}")
-
-def extract_json(text):
-    # 1. Clean up Markdown backticks if present
-    text = text.strip()
-    if text.startswith("```"):
-        text = re.sub(r'^```(?:json)?\n?', '', text)
-        text = re.sub(r'\n?```$', '', text)
-    
-    text = text.strip()
-    
-    # 2. Use raw_decode to grab ONLY the first valid JSON object
-    try:
-        decoder = json.JSONDecoder()
-        # This returns (dict, index_where_it_ended)
-        obj, _ = decoder.raw_decode(text)
-        return obj
-    except json.JSONDecodeError:
-        # Fallback: Try to find anything between the first { and last }
-        match = re.search(r'(\{.*\})', text, re.DOTALL)
-        if match:
-            return json.loads(match.group(1))
-        raise
+        print(f"Warning: Could not save snapshot: {e}")
 
 def main():
+    if SNAPSHOT_ONLY:
+        save_snapshot()
+        return
+
     start_time = time.perf_counter()
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
@@ -87,154 +91,170 @@ def main():
         print(f"Error reading {INPUT_FILE}: {e}")
         sys.exit(1)
         
-    results = []
-    failed = []
+    journal = WorkJournal(JOURNAL_FILE, JOURNAL_FSYNC_EVERY, JOURNAL_FSYNC_INTERVAL)
+    if journal.completed:
+        print(f"Journal {JOURNAL_FILE}: {len(journal.completed)} works already done, skipping them")
+
+    def journal_committed(entries):
+        for entry in entries:
+            journal.success(entry)
+            print(f"  -> Success: id={entry['id']}")
+
+    def journal_db_error(entry, e):
+        # Journaled as failed, so the work is retried on the next run
+        print(f"  -> Database insert error for id={entry['id']}: {e}")
+        journal.failure({
+            "id": entry["id"],
+            "title": entry["title"],
+            "original_text": entry["original_text"],
+            "error": f"Database insert error: {e}"
+        })
 
     try:
         db_conn = mysql.connector.connect(**DB_CONFIG)
-        db_cursor = db_conn.cursor()
+        db_writer = BatchedUpsertWriter(
+            db_conn, DB_TABLE, TEOSED_KOOSSEISUD_COLUMNS,
+            batch_size=DB_BATCH_SIZE,
+            flush_interval=DB_FLUSH_INTERVAL,
+            on_commit=journal_committed,
+            on_error=journal_db_error
+        )
     except mysql.connector.Error as e:
         print(f"Database connection error: {e}")
         sys.exit(1)
 
     def finalize_db():
         try:
-            db_conn.commit()
-            db_cursor.close()
+            db_writer.close()
             db_conn.close()
         except mysql.connector.Error as e:
             print(f"Database commit/close error: {e}")
-    
-    # Load existing results if valid to resume?
-    # User didn't explicitly ask for resume, but "output was not saved" implies fresh start or overwrite.
-    # We will overwrite for now as per "Save the succeeded results".
+        journal.close()
     
     print(f"Total works: {len(data)}")
-    
-    # We iterate composers, ignore category grouping for total count, but iterate carefully
-    processed_count = 0 
-    attempt_count = 0
-    
-    for work in data:
-        current_work_index = processed_count
-        processed_count += 1
-
-        if current_work_index < START_FROM:
-            continue
-
-        if TEST_MODE and attempt_count >= TEST_LIMIT:
-            print(f"\nTest limit ({TEST_LIMIT}) reached. Stopping.")
-            save_intermediate(results, failed)
-            finalize_db()
-            elapsed = time.perf_counter() - start_time
-            print(f"Total runtime: {elapsed:.2f}s")
-            sys.exit(0)
 
-        attempt_count += 1
+    stats = {"attempted": 0}
+    local_parser = KoosseisParser() if LOCAL_PARSER else None
 
+    def add_result(work, instrumentation):
         work_id = work.get('id')
         title = work.get('pealkiri')
         instr_text = work.get('koosseis')
+        result_entry = {
+            "id": work_id,
+            "title": title,
+            "original_text": instr_text,
+            "instrumentation": instrumentation
+        }
 
-        print(f"Processing {current_work_index}: id={work_id}")
+        try:
+            db_writer.add(
+                (work_id, title, instr_text, json.dumps(instrumentation, ensure_ascii=False)),
+                result_entry
+            )
+        except mysql.connector.Error as e:
+            print(f"  -> Database error: {e}")
+            finalize_db()
+            sys.exit(1)
 
-        if not instr_text:
-            print("  -> No instrumentation text found. Skipping API call.")
-            failed.append({
-                "id": work_id,
-                "title": title,
-                "error": "No instrumentation text provided"
-            })
-            save_intermediate(results, failed)
-            continue
+    def works_to_process():
+        """Works that need an API call; works without text are journaled as skipped here."""
+        for current_work_index, work in enumerate(data):
+            if current_work_index < START_FROM or journal.is_completed(work.get('id')):
+                continue
 
-        print(f"  -> Input text: {instr_text[:50]}...")
+            if TEST_MODE and stats["attempted"] >= TEST_LIMIT:
+                print(f"\nTest limit ({TEST_LIMIT}) reached. Stopping.")
+                return
 
-        try:
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = model.generate_content(
-                        f"Input: {instr_text}",
-                        generation_config={"response_mime_type": "application/json"}
-                    )
-                    break
-                except Exception as e:
-                    if "429" in str(e) and attempt < max_retries - 1:
-                        # Exponential backoff: 2, 4, 8 seconds...
-                        wait_time = (2 ** attempt) + random.random()
-                        print(f"  -> Rate limit hit. Waiting {wait_time:.2f}s...")
-                        time.sleep(wait_time)
-                    else:
-                        raise e
-   
-            
-            resp_text = response.text
-    
-            try:
-                parsed = extract_json(resp_text)
-            except Exception as parse_err:
-                raise ValueError(f"Failed to extract JSON. Raw response: {resp_text[:100]}...") from parse_err
+            stats["attempted"] += 1
 
-            instrumentation = parsed.get("instrumentation", parsed)
+            print(f"Processing {current_work_index}: id={work.get('id')}")
 
-            # Prepare entry
-            result_entry = {
-                "id": work_id,
-                "title": title,
-                "original_text": instr_text,
-                "instrumentation": instrumentation
-            }
-            results.append(result_entry)
-
-            try:
-                insert_query = (
-                    f"INSERT INTO {DB_TABLE} (teosed_id, pealkiri, koosseis_tekst, intrumentatsioon) "
-                    "VALUES (%s, %s, %s, %s) "
-                    "ON DUPLICATE KEY UPDATE "
-                    "pealkiri = VALUES(pealkiri), "
-                    "koosseis_tekst = VALUES(koosseis_tekst), "
-                    "intrumentatsioon = VALUES(intrumentatsioon)"
-                )
-                db_cursor.execute(
-                    insert_query,
-                    (work_id, title, instr_text, json.dumps(instrumentation, ensure_ascii=False))
-                )
-            except mysql.connector.Error as e:
-                print(f"  -> Database insert error: {e}")
-                failed.append({
-                    "id": work_id,
-                    "title": title,
-                    "original_text": instr_text,
-                    "error": f"Database insert error: {e}"
+            if not work.get('koosseis'):
+                print("  -> No instrumentation text found. Skipping API call.")
+                journal.skipped({
+                    "id": work.get('id'),
+                    "title": work.get('pealkiri'),
+                    "error": "No instrumentation text provided"
                 })
-                save_intermediate(results, failed)
-            print("  -> Success")
-            save_intermediate(results, failed)
+                continue
+
+            if local_parser:
+                instrumentation = local_parser.parse(work['koosseis'])
+                if instrumentation is not None:
+                    print("  -> Parsed locally")
+                    add_result(work, instrumentation)
+                    continue
+
+            yield work
+
+    def analyze(work):
+        """API call and JSON extraction for one work (runs in a worker thread)."""
+        response = model.generate_content(
+            f"Input: {work.get('koosseis')}",
+            generation_config={"response_mime_type": "application/json"}
+        )
+        resp_text = response.text
+
+        try:
+            parsed = parse_model_json(resp_text)
+        except Exception as parse_err:
+            raise ValueError(f"Failed to extract JSON. Raw response: {resp_text[:100]}...") from parse_err
+
+        return parsed.get("instrumentation", parsed)
+
+    engine = AdaptiveRequestEngine(
+        initial_concurrency=INITIAL_CONCURRENCY,
+        max_concurrency=MAX_CONCURRENCY,
+        max_retries=MAX_RETRIES,
+        backoff_base=BACKOFF_BASE,
+        backoff_max=BACKOFF_MAX
+    )
+
+    # Results arrive as calls complete; database writes and the journal stay
+    # in this thread
+    for work, instrumentation, error in engine.run(works_to_process(), analyze):
+        work_id = work.get('id')
+        title = work.get('pealkiri')
+        instr_text = work.get('koosseis')
 
-        except Exception as e:
-            print(f"  -> API/Parse Error: {e}")
-            failed.append({
+        if error is not None:
+            print(f"  -> API/Parse Error for id={work_id}: {error}")
+            journal.failure({
                 "id": work_id,
                 "title": title,
                 "original_text": instr_text,
-                "error": str(e)
+                "error": str(error)
             })
-            save_intermediate(results, failed)
-
-        time.sleep(DELAY_BETWEEN_REQUESTS)
+            continue
 
-    # Save results
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-        
-    with open(FAILED_FILE, 'w', encoding='utf-8') as f:
-        json.dump(failed, f, ensure_ascii=False, indent=2)
+        add_result(work, instrumentation)
 
     finalize_db()
-        
+
+    if engine.dead_letters:
+        dead_letters = [{
+            "id": letter["item"].get('id'),
+            "title": letter["item"].get('pealkiri'),
+            "original_text": letter["item"].get('koosseis'),
+            "error": letter["error"],
+            "attempts": letter["attempts"]
+        } for letter in engine.dead_letters]
+        with open(DEAD_LETTER_FILE, 'w', encoding='utf-8') as f:
+            json.dump(dead_letters, f, ensure_ascii=False, indent=2)
+
     elapsed = time.perf_counter() - start_time
-    print(f"\nDone. Saved {len(results)} successes to {OUTPUT_FILE} and {len(failed)} failures to {FAILED_FILE}.")
+    print(f"\nDone. {journal.success_count} successes and {journal.failed_count} failures "
+          f"in this run, journaled to {JOURNAL_FILE}.")
+    if engine.dead_letters:
+        print(f"{len(engine.dead_letters)} works failed permanently, listed in {DEAD_LETTER_FILE}.")
+    if SNAPSHOT_ON_FINISH:
+        save_snapshot()
+    if local_parser:
+        local_parser.print_stats()
+    engine.print_stats()
+    db_writer.print_stats()
     print(f"Total runtime: {elapsed:.2f}s")
 
 if __name__ == "__main__":
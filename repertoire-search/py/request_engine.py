@@ -0,0 +1,224 @@
+"""
+Adaptive-concurrency request engine (AIMD).
+
+Runs a function over many items with a thread pool whose number of
+requests in flight adapts to the API: it grows by one for every `limit`
+successful calls (additive increase) and is halved on 429 /
+RESOURCE_EXHAUSTED (multiplicative decrease). A throttled call also
+pauses all workers for the retry delay suggested by the API, or for a
+jittered exponential backoff when there is none.
+
+Items that fail permanently (non-retryable error or retries used up) are
+kept in a dead-letter list. Statistics (RPM, latency percentiles, retries)
+are printed by print_stats().
+"""
+
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from google.api_core.exceptions import GoogleAPIError
+
+
+# Network errors below the API client
+TRANSIENT_ERROR_TYPES = (TimeoutError, ConnectionError,
+                         requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+# Only API errors are classified by their message, other exceptions (e.g. a
+# ValueError quoting the model output) may contain any text. The HTTP
+# status comes first in their message: "429 Resource has been exhausted"
+STATUS_PREFIX_RE = re.compile(r'^\s*(\d{3})\b')
+THROTTLE_MARKERS_RE = re.compile(r'\b(?:RESOURCE_EXHAUSTED|Resource has been exhausted|Too Many Requests)\b')
+TRANSIENT_MARKERS_RE = re.compile(r'\b(?:UNAVAILABLE|DEADLINE_EXCEEDED)\b')
+RETRY_AFTER_PATTERNS = (
+    re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE),
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)', re.IGNORECASE),
+    re.compile(r'"retryDelay"\s*:\s*"([\d.]+)s"'),
+)
+
+
+_END = object()
+
+
+def _status_code(error):
+    """HTTP status of an API error, from its code attribute or its message; None if unknown."""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    if isinstance(error, GoogleAPIError):
+        match = STATUS_PREFIX_RE.match(str(error))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def is_throttle_error(error):
+    code = _status_code(error)
+    if code is not None:
+        return code == 429
+    return isinstance(error, GoogleAPIError) and THROTTLE_MARKERS_RE.search(str(error)) is not None
+
+
+def is_transient_error(error):
+    if isinstance(error, TRANSIENT_ERROR_TYPES):
+        return True
+    code = _status_code(error)
+    if code is not None:
+        return 500 <= code < 600
+    return isinstance(error, GoogleAPIError) and TRANSIENT_MARKERS_RE.search(str(error)) is not None
+
+
+def retry_after_seconds(error):
+    """Retry delay suggested by the API (Retry-After header or RetryInfo), or None."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After') if hasattr(headers, 'get') else None
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    message = str(error)
+    for pattern in RETRY_AFTER_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class AdaptiveRequestEngine:
+    def __init__(self, initial_concurrency=2, min_concurrency=1, max_concurrency=16,
+                 max_retries=5, backoff_base=2.0, backoff_max=60.0, decrease_factor=0.5):
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.decrease_factor = decrease_factor
+        self.dead_letters = []  # {"item": ..., "error": ..., "attempts": ...}
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.attempts = 0
+        self.successes = 0
+        self.retries = 0
+        self.throttled = 0
+        self.latencies = []
+        self.peak_limit = self.limit
+        self.start_time = None
+        self.end_time = None
+
+    # --- AIMD ---
+
+    def _on_success(self, latency):
+        with self._lock:
+            self.successes += 1
+            self.latencies.append(latency)
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+
+    def _on_throttle(self, delay):
+        with self._lock:
+            self.throttled += 1
+            now = time.monotonic()
+            # Calls that were already in flight fail together; decrease once per pause
+            if now >= self._paused_until:
+                self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+            self._paused_until = max(self._paused_until, now + delay)
+
+    def _wait_for_pause(self):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _backoff(self, attempt):
+        # Full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    # --- Execution ---
+
+    def _call(self, fn, item):
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_pause()
+            with self._lock:
+                self.attempts += 1
+            started = time.monotonic()
+            try:
+                result = fn(item)
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                if attempt < self.max_retries and (throttled or is_transient_error(e)):
+                    hint = retry_after_seconds(e)
+                    delay = hint if hint is not None else self._backoff(attempt)
+                    with self._lock:
+                        self.retries += 1
+                    if throttled:
+                        self._on_throttle(delay)
+                        print(f"  -> Rate limited, waiting {delay:.1f}s (concurrency {self.limit:.1f})")
+                    else:
+                        print(f"  -> Transient error ({e}), retrying in {delay:.1f}s")
+                        time.sleep(delay)
+                    continue
+                e.attempts = attempt + 1
+                raise
+            self._on_success(time.monotonic() - started)
+            return result
+
+    def run(self, items, fn):
+        """
+        Call fn(item) for every item. Yields (item, result, error) as calls
+        complete (not in input order); error is None on success. Failed items
+        are added to dead_letters.
+        """
+        self.start_time = time.monotonic()
+        items = iter(items)
+        exhausted = False
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while True:
+                while not exhausted and len(pending) < int(self.limit):
+                    item = next(items, _END)
+                    if item is _END:
+                        exhausted = True
+                        break
+                    pending[executor.submit(self._call, fn, item)] = item
+                if not pending:
+                    break
+                # The timeout lets a grown limit start new calls before the next completion
+                done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        self.dead_letters.append({
+                            "item": item,
+                            "error": str(error),
+                            "attempts": getattr(error, 'attempts', 1)
+                        })
+                        yield item, None, error
+                    else:
+                        yield item, future.result(), None
+        self.end_time = time.monotonic()
+
+    def print_stats(self):
+        elapsed = (self.end_time or time.monotonic()) - (self.start_time or time.monotonic())
+        rpm = self.attempts / elapsed * 60 if elapsed > 0 else 0.0
+        print(f"Requests: {self.attempts} ({self.successes} succeeded, {self.retries} retries, "
+              f"{self.throttled} rate limited, {len(self.dead_letters)} dead letters)")
+        print(f"Achieved rate: {rpm:.1f} requests/min over {elapsed:.2f}s")
+        print(f"Latency: p50 {percentile(self.latencies, 0.5):.2f}s, p95 {percentile(self.latencies, 0.95):.2f}s")
+        print(f"Concurrency: final {self.limit:.1f}, peak {self.peak_limit:.1f} (max {self.max_concurrency})")
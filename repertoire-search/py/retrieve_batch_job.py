@@ -9,7 +9,9 @@ if not API_KEY:
     print("GEMINI_API_KEY not found.")
     sys.exit(1)
     
-BATCH_JOB_ID = "batches/z943d40ijhs0172fi6fkoxkm1yr05736liqz"
+# Job to check; can be given on the command line instead. Jobs submitted by
+# run_batch_process.py are tracked (and downloaded) there.
+BATCH_JOB_ID = sys.argv[1] if len(sys.argv) > 1 else "batches/z943d40ijhs0172fi6fkoxkm1yr05736liqz"
 
 client = genai.Client(api_key=API_KEY)
 
@@ -27,13 +29,11 @@ def check_and_download():
         output_file_name = job.dest.file_name
         print(f"✅ Job Complete! Downloading results from: {output_file_name}")
         
-        # Download the actual data
-        content_bytes = client.files.download(file=output_file_name)
-        
+        # Stream the data to disk instead of holding it in memory
         output_local_path = "gemini_results_final.jsonl"
-        with open(output_local_path, "wb") as f:
-            f.write(content_bytes)
-            
+        client.files.download(file=output_file_name, destination=output_local_path + ".part")
+        os.replace(output_local_path + ".part", output_local_path)
+
         print(f"🚀 Success! Data saved to {output_local_path}")
     
     elif state in ['JOB_STATE_FAILED', 'JOB_STATE_CANCELLED']:
@@ -1,68 +1,63 @@
 import sys
+import os
 import time
-import json
+
 from google import genai
-import os
+
+from batch_orchestrator import BatchOrchestrator
 
 # --- Configuration ---
-API_KEY = os.environ.get("GEMINI_API_KEY")
-if not API_KEY:
-    print("GEMINI_API_KEY not found.")
-    sys.exit(1)
-        
-INPUT_FILE_PATH = "gemini_batch_cached.jsonl"
+SHARD_MANIFEST_FILE = "gemini_batch_shards.json"  # written by prepare_batch_file.py
+JOB_STATE_FILE = "gemini_batch_jobs.json"  # job per shard; survives restarts
+OUTPUT_PATTERN = "gemini_results-{index:05d}.jsonl"
 MODEL_ID = "gemini-2.5-flash-lite"
+MAX_ACTIVE_JOBS = 10  # shards submitted and running at the same time
+MAX_ATTEMPTS = 3  # submissions per shard when jobs fail
+POLL_MIN = 30.0  # seconds; the interval grows while no job changes state
+POLL_MAX = 600.0
+POLL_FACTOR = 1.5
+# Insert each shard's results into the database as soon as they are
+# downloaded, while the other jobs are still running
+INSERT_ON_COMPLETION = False
 
-client = genai.Client(api_key=API_KEY)
+# Usage:
+#   python run_batch_process.py          submit / resume all shards
+#   python run_batch_process.py --fake   same flow against fake_genai_client, no API calls
 
-def run_batch_process():
-    # 1. Upload your JSONL to the Gemini File API
-    print(f"Uploading {INPUT_FILE_PATH}...")
-    uploaded_file = client.files.upload(
-        file=INPUT_FILE_PATH,
-        config={'mime_type': 'application/jsonl'}
-    )
-    print(f"File uploaded successfully: {uploaded_file.name}")
 
-    # 2. Create the Batch Job
-    print(f"Submitting batch job to {MODEL_ID}...")
-    batch_job = client.batches.create(
-        model=MODEL_ID,
-        src=uploaded_file.name,
-        config={'display_name': 'Musicology_Data_Analysis'}
-    )
-    
-    job_id = batch_job.name
-    print(f"Batch job created. ID: {job_id}")
+def run_batch_process(fake=False):
+    if fake:
+        from fake_genai_client import FakeClient
+        client = FakeClient()
+        sleep = lambda seconds: None
+    else:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            print("GEMINI_API_KEY not found.")
+            sys.exit(1)
+        client = genai.Client(api_key=api_key)
+        sleep = time.sleep
 
-    # 3. Monitor the Job
-    while True:
-        status = client.batches.get(name=job_id)
-        state = status.state.name
-        
-        if state == 'JOB_STATE_SUCCEEDED':
-            print("\n✅ Batch job completed!")
-            
-            # 4. Download Results
-            output_file_name = status.dest.file_name
-            print(f"Downloading results from {output_file_name}...")
-            
-            content_bytes = client.files.download(file=output_file_name)
-            with open("gemini_batch_output.jsonl", "wb") as f:
-                f.write(content_bytes)
-            
-            print("Done! Results saved to: gemini_batch_output.jsonl")
-            break
-            
-        elif state in ['JOB_STATE_FAILED', 'JOB_STATE_CANCELLED']:
-            print(f"\n❌ Job failed or was cancelled. State: {state}")
-            if hasattr(status, 'error'):
-                print(f"Error details: {status.error}")
-            break
-        else:
-            # Poll every 60 seconds (Batch jobs are not instantaneous)
-            print(f"Status: {state}... checking again in 60s", end="\r")
-            time.sleep(60)
+    on_output = None
+    if INSERT_ON_COMPLETION:
+        from insert_batch_results_to_database import LOCAL_RESULTS_FILE, insert_results_streaming
+        on_output = lambda path: insert_results_streaming([path])
+
+    orchestrator = BatchOrchestrator(
+        client, MODEL_ID, SHARD_MANIFEST_FILE, JOB_STATE_FILE, OUTPUT_PATTERN,
+        max_active_jobs=MAX_ACTIVE_JOBS,
+        max_attempts=MAX_ATTEMPTS,
+        poll_min=POLL_MIN,
+        poll_max=POLL_MAX,
+        poll_factor=POLL_FACTOR,
+        on_output=on_output,
+        sleep=sleep
+    )
+    orchestrator.run()
+    if INSERT_ON_COMPLETION and os.path.exists(LOCAL_RESULTS_FILE):
+        insert_results_streaming([LOCAL_RESULTS_FILE])
+    elif not INSERT_ON_COMPLETION:
+        print("Insert the results with insert_batch_results_to_database.py")
 
 if __name__ == "__main__":
-    run_batch_process()
\ No newline at end of file
+    run_batch_process(fake="--fake" in sys.argv[1:])
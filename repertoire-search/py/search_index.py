@@ -0,0 +1,454 @@
+"""
+Precomputed search attributes for search/api/search.php.
+
+search.php fetches every row that matches its SQL filters and then, per
+row and per query, parses the composition year, the composer's birth year
+and the duration, decodes teosed_koosseisud.intrumentatsioon and counts
+the players and instruments before it can filter and page. This script
+does that work once per work and stores the results in two indexed
+tables, so those filters and the paging can be done in SQL:
+
+    teosed_otsing  one row per (teosed_id, heliloojad_id), the same rows
+                   search.php lists: aasta, sunniaasta, pikkus_min,
+                   esitajaid, koosseis_tekst and the hash of the source
+                   values they were computed from
+    teosed_pillid  (teosed_id, instrument_id, count) for every instrument
+                   in the parts of the instrumentation
+
+The parse functions mirror the PHP ones exactly, so a query on the index
+returns the same works as the PHP filters, e.g.
+
+    SELECT ... FROM teosed_otsing o JOIN ...
+    WHERE o.esitajaid BETWEEN 2 AND 4
+      AND EXISTS (SELECT 1 FROM teosed_pillid p
+                  WHERE p.teosed_id = o.teosed_id AND p.instrument_id = 'fl')
+    ORDER BY helilooja, pealkiri LIMIT 50 OFFSET 100
+
+Refreshing is incremental: the server computes MD5 of the source values
+(teosed.aasta, teosed.pikkus, heliloojad.sunnikuupaev,
+teosed_tekstid.koosseis and teosed_koosseisud.intrumentatsioon) and only
+rows whose hash differs from the stored one are fetched and recomputed.
+Rows of works that no longer exist are removed.
+
+Usage:
+    python search_index.py            refresh new and changed works
+    python search_index.py --rebuild  recompute everything
+"""
+
+import json
+import math
+import re
+import sys
+import time
+
+import mysql.connector
+
+from db_writer import upsert_query
+
+
+# --- Configuration ---
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "emic",
+    "password": "tobias",
+    "database": "emic"
+}
+INDEX_TABLE = "teosed_otsing"
+INSTRUMENTS_TABLE = "teosed_pillid"
+BATCH_SIZE = 1000  # changed rows per write and commit
+# Numbers parsed from free text can exceed INT; they are stored clamped,
+# which keeps every comparison with a search filter bound the same
+INT_MAX = 2 ** 31 - 1
+# Instrument ids come from model output; longer ones are skipped with a
+# warning instead of failing the batch
+INSTRUMENT_ID_MAX = 255
+
+INDEX_COLUMNS = ["teosed_id", "heliloojad_id", "aasta", "sunniaasta", "pikkus_min", "esitajaid",
+                 "koosseis_tekst", "source_hash"]
+INSTRUMENTS_COLUMNS = ["teosed_id", "instrument_id", "count"]
+
+CREATE_TABLES = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {INDEX_TABLE} (
+        teosed_id INT NOT NULL,
+        heliloojad_id INT NOT NULL,
+        aasta SMALLINT NULL,
+        sunniaasta SMALLINT NULL,
+        pikkus_min INT NULL,
+        esitajaid INT NOT NULL DEFAULT 0,
+        koosseis_tekst TEXT NULL,
+        source_hash CHAR(32) NOT NULL,
+        PRIMARY KEY (teosed_id, heliloojad_id),
+        KEY idx_aasta (aasta),
+        KEY idx_sunniaasta (sunniaasta),
+        KEY idx_pikkus_min (pikkus_min),
+        KEY idx_esitajaid (esitajaid)
+    ) DEFAULT CHARSET=utf8mb4
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {INSTRUMENTS_TABLE} (
+        teosed_id INT NOT NULL,
+        instrument_id VARCHAR({INSTRUMENT_ID_MAX}) COLLATE utf8mb4_bin NOT NULL,
+        count INT NOT NULL,
+        PRIMARY KEY (teosed_id, instrument_id),
+        KEY idx_instrument (instrument_id, teosed_id)
+    ) DEFAULT CHARSET=utf8mb4
+    """,
+    # search.php compares instrument ids case-sensitively ('Vl' and 'vl'
+    # are different instruments); tables created before that are converted
+    f"""
+    ALTER TABLE {INSTRUMENTS_TABLE}
+        MODIFY instrument_id VARCHAR({INSTRUMENT_ID_MAX}) COLLATE utf8mb4_bin NOT NULL
+    """,
+]
+
+# Everything the derived values depend on; COALESCE so that a NULL
+# cannot shift the other values into its place
+SOURCE_HASH = ("MD5(CONCAT_WS('|', COALESCE(t.aasta, ''), COALESCE(t.pikkus, ''), "
+               "COALESCE(h.sunnikuupaev, ''), COALESCE(tt.koosseis, ''), "
+               "COALESCE(tk.intrumentatsioon, '')))")
+
+# Same joins as search.php; only rows whose hash changed are returned
+CHANGED_ROWS_QUERY = f"""
+    SELECT t.id, h.id, t.aasta, t.pikkus, h.sunnikuupaev, tt.koosseis, tk.intrumentatsioon,
+           {SOURCE_HASH} AS source_hash
+    FROM teosed t
+    JOIN heliloojad_teosed ht ON ht.teosed_id = t.id
+    JOIN heliloojad h ON h.id = ht.heliloojad_id
+    LEFT JOIN teosed_tekstid tt ON tt.teosed_id = t.id AND tt.keel = 'est'
+    LEFT JOIN teosed_koosseisud tk ON tk.teosed_id = t.id
+    LEFT JOIN {INDEX_TABLE} o ON o.teosed_id = t.id AND o.heliloojad_id = h.id
+    WHERE o.source_hash IS NULL OR o.source_hash <> {SOURCE_HASH}
+    ORDER BY t.id, h.id
+"""
+
+DELETE_REMOVED_QUERIES = [
+    f"""
+    DELETE FROM {INDEX_TABLE}
+    WHERE NOT EXISTS (
+        SELECT 1 FROM heliloojad_teosed ht
+        JOIN teosed t ON t.id = ht.teosed_id
+        JOIN heliloojad h ON h.id = ht.heliloojad_id
+        WHERE ht.teosed_id = {INDEX_TABLE}.teosed_id AND ht.heliloojad_id = {INDEX_TABLE}.heliloojad_id
+    )
+    """,
+    f"""
+    DELETE FROM {INSTRUMENTS_TABLE}
+    WHERE NOT EXISTS (SELECT 1 FROM {INDEX_TABLE} o WHERE o.teosed_id = {INSTRUMENTS_TABLE}.teosed_id)
+    """,
+]
+
+_YEAR_RE = re.compile(r'(18|19|20)\d{2}')
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_PHP_NUMERIC_PREFIX_RE = re.compile(r'[ \t\n\r\v\f]*[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?')
+_PHP_TRIM = " \t\n\r\0\x0b"
+_C_SPACE = " \t\n\r\x0b\x0c"  # isspace() in PHP's strip_tags
+
+
+# --- The PHP helpers of search.php, value for value ---
+# json_decode(..., true) turns JSON objects and lists alike into PHP
+# arrays, so is_array() holds for both dicts and lists here and foreach
+# runs over the values of either.
+
+def php_values(value):
+    """The values foreach would visit if is_array(value), else None."""
+    if isinstance(value, dict):
+        return list(value.values())
+    if isinstance(value, list):
+        return value
+    return None
+
+
+def php_get(array, key):
+    """$array[key] ?? null for a decoded array; JSON lists have no string keys."""
+    return array.get(key) if isinstance(array, dict) else None
+
+
+def php_int(value):
+    """(int) cast as PHP does it for values decoded from JSON."""
+    if value is None:
+        return 0
+    if isinstance(value, (bool, int)):
+        return int(value)
+    if isinstance(value, float):
+        return int(value) if math.isfinite(value) else 0
+    if isinstance(value, str):
+        # Leading numeric part, e.g. "3 players" -> 3, "1e2" -> 100, "2.5" -> 2
+        match = _PHP_NUMERIC_PREFIX_RE.match(value)
+        if not match:
+            return 0
+        number = float(match.group())
+        return int(number) if math.isfinite(number) else 0
+    return 1 if value else 0
+
+
+def php_empty(value):
+    return value is None or value is False or value == 0 or value == "" or value == "0" or value == [] or value == {}
+
+
+def php_str(value):
+    if value is None or value is False:
+        return ""
+    if value is True:
+        return "1"
+    if isinstance(value, (dict, list)):
+        return "Array"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return str(value)
+
+
+def parse_year(value):
+    if value is None or value == '':
+        return None
+    match = _YEAR_RE.search(value)
+    return int(match.group()) if match else None
+
+
+def parse_duration_minutes(value):
+    if value is None or value.strip(_PHP_TRIM) == '':
+        return None
+    clean = value.lower()
+    for search, replace in (("\\'", ' '), ("'", ' '), ('min', ' '), ('m', ' '), (',', '.')):
+        clean = clean.replace(search, replace)
+    match = _NUMBER_RE.search(clean)
+    if not match:
+        return None
+    # PHP's round() rounds halves away from zero
+    return int(math.floor(float(match.group()) + 0.5))
+
+
+def decode_instrumentation(raw):
+    """
+    json_decode of intrumentatsioon. A top-level JSON list has no string
+    keys, so for search.php it is the same as an empty array.
+    """
+    raw = php_str(raw)
+    if raw == '' or raw.lower() == 'null':
+        return {}
+    try:
+        decoded = json.loads(raw)
+    except ValueError:
+        return {}
+    return decoded if isinstance(decoded, dict) else {}
+
+
+def _parts(instrumentation):
+    """The parts search.php iterates: the array values that are arrays themselves."""
+    parts = php_values(instrumentation.get('parts', []))
+    return [part for part in parts or [] if php_values(part) is not None]
+
+
+def _part_count(part):
+    value = php_get(part, 'count')
+    return max(1, php_int(1 if value is None else value))
+
+
+def extract_instrument_ids(instrumentation):
+    ids = {}
+    for part in _parts(instrumentation):
+        instrument_id = php_str(php_get(part, 'instrument_id')).strip(_PHP_TRIM)
+        if instrument_id != '':
+            ids[instrument_id] = True
+    return list(ids)
+
+
+def has_aggregate_ensemble_context(instrumentation):
+    layout = instrumentation.get('orchestral_layout')
+    if not php_empty(layout) and php_values(layout) is not None:
+        return True
+    if not php_empty(instrumentation.get('has_vocal')):
+        return True
+    ensembles = php_values(instrumentation.get('ensembles', []))
+    if ensembles is None:
+        return False
+    for ensemble in ensembles:
+        if php_values(ensemble) is None:
+            continue
+        ensemble_id = php_str(php_get(ensemble, 'ensemble_id')).lower()
+        if 'orchestra' in ensemble_id or 'choir' in ensemble_id:
+            return True
+    return False
+
+
+def extract_player_count(instrumentation):
+    total = php_int(instrumentation.get('total_player_count'))
+    if total > 0:
+        return total
+    # Orchestra or choir without a total: the listed solo parts are not the count
+    if has_aggregate_ensemble_context(instrumentation):
+        return 0
+    return sum(_part_count(part) for part in _parts(instrumentation))
+
+
+def strip_tags(value):
+    """
+    PHP strip_tags(): removes tags (quoted '>' inside a tag does not end
+    it), comments and <?...?> blocks, but keeps a '<' that is followed by
+    whitespace, as in "vl 1 < 2 vc".
+    """
+    text = php_str(value)
+    if '<' not in text:
+        return text
+    out = []
+    state, depth, quote = "text", 0, None
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if state == "text":
+            if c != '<':
+                out.append(c)
+            elif i + 1 < n and text[i + 1] in _C_SPACE:
+                out.append(c)
+            elif text.startswith('<!--', i):
+                state = "comment"
+                i += 3
+            elif text.startswith('<?', i):
+                state = "php"
+            else:
+                state = "tag"
+        elif state == "tag":
+            if quote:
+                if c == quote and text[i - 1] != '\\':
+                    quote = None
+            elif c in '"\'':
+                quote = c
+            elif c == '<':
+                depth += 1
+            elif c == '>':
+                if depth:
+                    depth -= 1
+                else:
+                    state = "text"
+        elif state == "comment":
+            if text.startswith('-->', i):
+                state = "text"
+                i += 2
+        elif text.startswith('?>', i):
+            state = "text"
+            i += 1
+        i += 1
+    return ''.join(out)
+
+
+def instrument_counts(instrumentation):
+    """{instrument_id: players} over the parts, for teosed_pillid."""
+    counts = {}
+    for part in _parts(instrumentation):
+        instrument_id = php_str(php_get(part, 'instrument_id')).strip(_PHP_TRIM)
+        if instrument_id != '':
+            counts[instrument_id] = counts.get(instrument_id, 0) + _part_count(part)
+    return {instrument_id: _clamp(count) for instrument_id, count in counts.items()}
+
+
+def _clamp(value):
+    return None if value is None else min(value, INT_MAX)
+
+
+def index_row(row):
+    """One CHANGED_ROWS_QUERY row -> (teosed_otsing row, {instrument_id: count})."""
+    teosed_id, heliloojad_id, aasta, pikkus, sunnikuupaev, koosseis, raw_instrumentation, source_hash = row
+    instrumentation = decode_instrumentation(raw_instrumentation)
+    return (
+        (teosed_id, heliloojad_id,
+         parse_year(php_str(aasta)),
+         parse_year(php_str(sunnikuupaev)),
+         _clamp(parse_duration_minutes(php_str(pikkus))),
+         _clamp(extract_player_count(instrumentation)),
+         strip_tags(koosseis),
+         source_hash),
+        instrument_counts(instrumentation),
+    )
+
+
+# --- Refresh ---
+
+def _write_batch(cursor, rows):
+    """Upsert index rows and replace the instruments of their works."""
+    index_rows = []
+    instruments = {}
+    for row in rows:
+        index_values, counts = index_row(row)
+        index_rows.append(index_values)
+        instruments[index_values[0]] = counts  # the same for every composer of a work
+    cursor.executemany(upsert_query(INDEX_TABLE, INDEX_COLUMNS, key_columns=2), index_rows)
+    work_ids = list(instruments)
+    cursor.execute(
+        f"DELETE FROM {INSTRUMENTS_TABLE} WHERE teosed_id IN ({', '.join(['%s'] * len(work_ids))})",
+        work_ids
+    )
+    instrument_rows = []
+    for work_id, counts in instruments.items():
+        for instrument_id, count in counts.items():
+            if len(instrument_id) > INSTRUMENT_ID_MAX:
+                print(f"  Warning: work {work_id}: skipped instrument id longer than "
+                      f"{INSTRUMENT_ID_MAX} characters: {instrument_id[:40]}...")
+                continue
+            instrument_rows.append((work_id, instrument_id, count))
+    if instrument_rows:
+        cursor.executemany(upsert_query(INSTRUMENTS_TABLE, INSTRUMENTS_COLUMNS, key_columns=2), instrument_rows)
+    return len(instrument_rows)
+
+
+def refresh_index(rebuild=False):
+    """Recompute the search attributes of new and changed works."""
+    print("=" * 60)
+    print(f"Search index {INDEX_TABLE} / {INSTRUMENTS_TABLE} ({'rebuild' if rebuild else 'incremental'})")
+    print("=" * 60)
+
+    try:
+        # The changed rows are streamed on one connection and written on the other
+        read_conn = mysql.connector.connect(**DB_CONFIG)
+        write_conn = mysql.connector.connect(**DB_CONFIG)
+        write_cursor = write_conn.cursor()
+        print("✓ Connected to database")
+    except mysql.connector.Error as e:
+        print(f"✗ Error connecting to database: {e}")
+        return
+
+    stats = {"rows": 0, "instruments": 0, "removed": 0}
+    start_time = time.perf_counter()
+    try:
+        for query in CREATE_TABLES:
+            write_cursor.execute(query)
+        if rebuild:
+            write_cursor.execute(f"DELETE FROM {INSTRUMENTS_TABLE}")
+            write_cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+        for query in DELETE_REMOVED_QUERIES:
+            write_cursor.execute(query)
+            stats["removed"] += max(0, write_cursor.rowcount)
+        write_conn.commit()
+
+        read_cursor = read_conn.cursor(buffered=False)
+        read_cursor.execute(CHANGED_ROWS_QUERY)
+        while True:
+            rows = read_cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            stats["instruments"] += _write_batch(write_cursor, rows)
+            write_conn.commit()
+            stats["rows"] += len(rows)
+            elapsed = time.perf_counter() - start_time
+            print(f"  {stats['rows']} rows indexed ({stats['rows'] / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+        read_cursor.close()
+    except mysql.connector.Error as e:
+        print(f"✗ Database error: {e}")
+        write_conn.rollback()
+    finally:
+        write_cursor.close()
+        write_conn.close()
+        read_conn.close()
+
+    elapsed = time.perf_counter() - start_time
+    print()
+    print("=" * 60)
+    print("Summary:")
+    print(f"  New or changed rows indexed: {stats['rows']}")
+    print(f"  Instrument rows written: {stats['instruments']}")
+    print(f"  Rows of removed works deleted: {stats['removed']}")
+    print(f"  Runtime: {elapsed:.2f}s")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    refresh_index(rebuild="--rebuild" in sys.argv[1:])
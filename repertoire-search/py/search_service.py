@@ -0,0 +1,542 @@
+"""
+In-memory repertoire search service.
+
+A long-running alternative to search/api/search.php. All works are loaded
+once into NumPy columns (composer id, gender, birth year, composition
+year, duration, player count) with one boolean array per genre and per
+instrument. Every request is then answered with vectorized masks instead
+of a multi-table JOIN and per-row PHP filtering:
+
+    mask = composer_id == 12 & players >= 2 & instruments["fl"] & instruments["hp"]
+
+The rows are kept sorted by composer and title, so the indices of the
+mask are already in result order and a page is a slice of them. For the
+text filters (title, keyword, textAuthor) each text column is kept as one
+string; a filter either scans it with str.find or, when the other filters
+left few rows, looks only inside those rows' texts.
+
+The service accepts the same POST body as search.php and returns the
+same JSON ({ok, total, page, perPage, items}), so search.js only needs
+SEARCH_URL changed to point at it. Derived values come from the same
+PHP-compatible helpers as search_index.py. Text matching follows the
+database collation (utf8mb4_unicode_ci): case and accents are ignored.
+The data is reloaded from the database every RELOAD_INTERVAL seconds.
+
+Usage:
+    python search_service.py                    serve on HOST:PORT
+    python search_service.py --benchmark        time the filters on synthetic works
+    python search_service.py --benchmark 250000
+"""
+
+import bisect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mysql.connector
+import numpy as np
+
+from search_index import (decode_instrumentation, extract_instrument_ids, extract_player_count,
+                          parse_duration_minutes, parse_year, php_empty, php_int, php_str, strip_tags)
+
+
+# --- Configuration ---
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "emic",
+    "password": "tobias",
+    "database": "emic"
+}
+HOST = "127.0.0.1"
+PORT = 8765
+RELOAD_INTERVAL = 600  # seconds between reloads from the database; 0 disables
+ALLOWED_ORIGIN = "*"  # Access-Control-Allow-Origin for search.js on another host
+WORK_URL = "https://www.emic.ee/?sisu=heliloojad&mid=32&id={composer_id}&lang=est&action=view&method=teosed#{work_id}"
+BENCHMARK_WORKS = 100000
+
+KEYWORD_FIELDS = ["pealkiri", "ppealkiri", "seletusrida", "esiettekanne", "koosseis", "lisainfo",
+                  "lisatekst", "lisamarkused", "kirjastaja", "cd"]
+MATCH_MODES = ("partial", "word", "exact")
+GENDERS = {"m": 1, "n": 2, "x": 3}  # heliloojad.sugu -> code in the gender column
+
+# Same rows as search.php, plus what its filters look at
+WORKS_QUERY = f"""
+    SELECT DISTINCT
+        t.id, h.id, h.nimi, h.sugu, h.sunnikuupaev, t.aasta, t.pikkus,
+        {', '.join('tt.' + field for field in KEYWORD_FIELDS)},
+        tk.intrumentatsioon
+    FROM teosed t
+    JOIN heliloojad_teosed ht ON ht.teosed_id = t.id
+    JOIN heliloojad h ON h.id = ht.heliloojad_id
+    LEFT JOIN teosed_tekstid tt ON tt.teosed_id = t.id AND tt.keel = 'est'
+    LEFT JOIN teosed_koosseisud tk ON tk.teosed_id = t.id
+"""
+GENRES_QUERY = "SELECT teoseId, zanrId FROM teosed_zanrid"
+# textAuthor is matched against the texts of every language
+AUTHORS_QUERY = "SELECT teosed_id, TRIM(tekstiAutor) FROM teosed_tekstid WHERE tekstiAutor IS NOT NULL"
+
+NO_TITLE = "(pealkiri puudub)"
+# Never in the data: between the fields of one row, and between rows
+FIELD_SEPARATOR = "\x00"
+ROW_SEPARATOR = "\x01"
+SEPARATORS = FIELD_SEPARATOR + ROW_SEPARATOR
+# Text filters look inside the candidate rows' texts when fewer than
+# 1 / SCAN_ROW_RATIO of the rows are left, and scan the whole column otherwise
+SCAN_ROW_RATIO = 20
+# Numbers parsed from free text can be arbitrarily large; in the int32
+# columns they are clamped, which keeps every comparison with a filter
+# bound the same (the items keep the exact value)
+INT32_MAX = np.iinfo(np.int32).max
+
+
+def fold(text):
+    """Case and accent folding, close to utf8mb4_unicode_ci comparisons."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _is_word_char(c):
+    return c.isalnum() or c == '_'
+
+
+class TextMatcher:
+    """LIKE '%term%', REGEXP word match or '=' on folded text."""
+
+    def __init__(self, term, mode):
+        term = fold(term)
+        self.mode = mode
+        self.term = term.rstrip(' ') if mode == "exact" else term  # '=' ignores trailing spaces
+        self.regex = None
+        if mode == "partial" and ('%' in term or '_' in term):
+            # LIKE wildcards in the search term count, as the PHP passes them through
+            self.regex = re.compile(''.join(
+                '[^\x00\x01]*' if c == '%' else '[^\x00\x01]' if c == '_' else re.escape(c) for c in term
+            ))
+        # A term that folds to nothing (e.g. a lone combining accent) is
+        # ignorable in the collation, so LIKE '%term%' matches every value
+        self.matches_all = mode == "partial" and term == ""
+        # [[:<:]]term[[:>:]] needs word characters at both ends of the term
+        self.impossible = mode == "word" and not (term and _is_word_char(term[0]) and _is_word_char(term[-1]))
+
+    def _accepts(self, blob, position):
+        """Whether the occurrence of the term at position counts."""
+        if self.mode == "partial":
+            return True
+        before, after = blob[position - 1], blob[position + len(self.term)]
+        if self.mode == "exact":
+            return before in SEPARATORS and after in SEPARATORS
+        return not _is_word_char(before) and not _is_word_char(after)
+
+    def search(self, blob, start, end):
+        """Start of the first accepted occurrence in blob[start:end], or -1."""
+        if self.regex is not None:
+            match = self.regex.search(blob, start, end)
+            return match.start() if match else -1
+        position = blob.find(self.term, start, end)
+        while position != -1:
+            if position + len(self.term) >= len(blob):
+                # Only an empty term is found at the very end of the blob
+                return -1
+            if self._accepts(blob, position):
+                return position
+            position = blob.find(self.term, position + 1, end)
+        return -1
+
+
+class TextColumn:
+    """Folded texts of all rows as one string, searched with str.find."""
+
+    def __init__(self, texts):
+        self.present = np.array([text is not None for text in texts], dtype=bool)  # NULL never matches
+        texts = [text or '' for text in texts]
+        self.blob = ROW_SEPARATOR + ROW_SEPARATOR.join(texts) + ROW_SEPARATOR
+        self.starts = []  # blob offset of each row; the next row starts after a separator
+        position = 1
+        for text in texts:
+            self.starts.append(position)
+            position += len(text) + 1
+        self.starts.append(position)
+
+    def matches(self, matcher, candidates):
+        """Boolean array of the rows in the candidates mask that match."""
+        mask = np.zeros(len(self.present), dtype=bool)
+        if matcher.impossible:
+            return mask
+        if matcher.matches_all:
+            return candidates & self.present
+        rows = np.flatnonzero(candidates & self.present)
+        starts, blob = self.starts, self.blob
+        if len(rows) * SCAN_ROW_RATIO < len(self.present):
+            # Few candidates left: look only inside their texts
+            matched = [row for row in rows.tolist()
+                       if matcher.search(blob, starts[row], starts[row + 1] - 1) != -1]
+        else:
+            # Scan the whole column, jumping to the next row after each match
+            matched = []
+            position, end = 1, len(blob)
+            while position < end:
+                position = matcher.search(blob, position, end)
+                if position == -1:
+                    break
+                row = bisect.bisect_right(starts, position) - 1
+                matched.append(row)
+                position = starts[row + 1]
+        mask[matched] = True
+        return mask & candidates & self.present
+
+
+class RepertoireColumns:
+    """All works as columns, one entry per (work, composer) row of search.php."""
+
+    def __init__(self, rows, genres=(), authors=()):
+        # ORDER BY helilooja, pealkiri
+        rows = sorted(rows, key=lambda row: (fold(php_str(row[2])), fold(php_str(row[7]) or NO_TITLE)))
+        n = len(rows)
+        self.size = n
+        self.work_id = np.zeros(n, dtype=np.int32)
+        self.composer_id = np.zeros(n, dtype=np.int32)
+        self.gender = np.zeros(n, dtype=np.int8)  # GENDERS code, 0: other
+        self.born_year = np.zeros(n, dtype=np.int16)  # 0: unknown
+        self.year = np.zeros(n, dtype=np.int16)  # 0: unknown
+        self.duration = np.full(n, -1, dtype=np.int32)  # -1: unknown
+        self.players = np.zeros(n, dtype=np.int32)
+        self.instrument_count = np.zeros(n, dtype=np.int32)
+        self.instruments = {}  # instrument_id -> bool array
+        self.genres = {}  # zanrId -> bool array
+        titles = []  # folded tt.pealkiri, None without an Estonian text
+        keyword_texts = []  # folded keyword fields joined by FIELD_SEPARATOR
+        self.items = []  # the result item of each row, built once
+
+        rows_of_work = {}
+        for i, row in enumerate(rows):
+            work_id, composer_id, composer, gender, birth_date, year, duration = row[:7]
+            fields = row[7:7 + len(KEYWORD_FIELDS)]
+            instrumentation = decode_instrumentation(row[7 + len(KEYWORD_FIELDS)])
+            title, koosseis = fields[0], fields[KEYWORD_FIELDS.index("koosseis")]
+
+            self.work_id[i] = work_id
+            self.composer_id[i] = composer_id
+            self.gender[i] = GENDERS.get(php_str(gender).lower(), 0)
+            self.born_year[i] = parse_year(php_str(birth_date)) or 0
+            composition_year = parse_year(php_str(year))
+            self.year[i] = composition_year or 0
+            minutes = parse_duration_minutes(php_str(duration))
+            if minutes is not None:
+                self.duration[i] = min(minutes, INT32_MAX)
+            players = extract_player_count(instrumentation)
+            self.players[i] = min(players, INT32_MAX)
+            instrument_ids = extract_instrument_ids(instrumentation)
+            self.instrument_count[i] = len(instrument_ids)
+            for instrument_id in instrument_ids:
+                if instrument_id not in self.instruments:
+                    self.instruments[instrument_id] = np.zeros(n, dtype=bool)
+                self.instruments[instrument_id][i] = True
+
+            titles.append(None if title is None else fold(title).rstrip(' '))
+            keyword_texts.append(FIELD_SEPARATOR.join(fold(field).rstrip(' ') for field in fields if field is not None))
+            rows_of_work.setdefault(work_id, []).append(i)
+            self.items.append({
+                'teos_id': int(work_id),
+                'helilooja': php_str(composer),
+                'pealkiri': php_str(title) or NO_TITLE,
+                'koosseis_tekst': strip_tags(koosseis),
+                'aasta': composition_year,
+                'pikkus_min': minutes,
+                'esitajaid': players,
+                'url': WORK_URL.format(composer_id=int(composer_id), work_id=int(work_id)),
+            })
+
+        for work_id, genre_id in genres:
+            if genre_id not in self.genres:
+                self.genres[genre_id] = np.zeros(n, dtype=bool)
+            self.genres[genre_id][rows_of_work.get(work_id, [])] = True
+
+        authors_of_work = {}
+        for work_id, author in authors:
+            if author is not None:
+                authors_of_work.setdefault(work_id, []).append(fold(author))
+        self.titles = TextColumn(titles)
+        self.keywords = TextColumn(keyword_texts)
+        self.authors = TextColumn([FIELD_SEPARATOR.join(authors_of_work[work_id]) if work_id in authors_of_work else None
+                                   for work_id in self.work_id.tolist()])
+
+    def mask(self, filters, active, selected_instruments):
+        """Boolean array of the rows that pass every filter."""
+        mask = np.ones(self.size, dtype=bool)
+        if filters['genreId'] > 0:
+            genre = self.genres.get(filters['genreId'])
+            if genre is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= genre
+        if filters['composerId'] > 0:
+            mask &= self.composer_id == filters['composerId']
+        if filters['sugu'].lower() in GENDERS:
+            mask &= self.gender == GENDERS[filters['sugu'].lower()]
+
+        if active['bornYear']:
+            if filters['bornYearFrom'] > 0:
+                mask &= self.born_year >= filters['bornYearFrom']
+            if filters['bornYearTo'] > 0:
+                mask &= (self.born_year <= filters['bornYearTo']) & (self.born_year > 0)
+        if active['compositionYear']:
+            if filters['compositionYearFrom'] > 0:
+                mask &= self.year >= filters['compositionYearFrom']
+            if filters['compositionYearTo'] > 0:
+                mask &= (self.year <= filters['compositionYearTo']) & (self.year > 0)
+        if active['duration']:
+            if filters['durationFrom'] > 0:
+                mask &= self.duration >= filters['durationFrom']
+            if 0 < filters['durationTo'] < 60:
+                mask &= (self.duration <= filters['durationTo']) & (self.duration >= 0)
+        if active['performers']:
+            mask &= self.players >= filters['performersFrom']
+            if filters['performersTo'] < 16:
+                mask &= self.players <= filters['performersTo']
+
+        if selected_instruments:
+            for instrument_id in selected_instruments:
+                instrument = self.instruments.get(instrument_id)
+                if instrument is None:
+                    return np.zeros(self.size, dtype=bool)
+                mask &= instrument
+            if filters['onlySelectedInstruments']:
+                # Has all the selected ones, so no others means exactly that many
+                mask &= self.instrument_count == len(selected_instruments)
+
+        # Text filters last, so they only look at what is left
+        if filters['title']:
+            mask = self.titles.matches(TextMatcher(filters['title'], filters['titleMatchMode']), mask)
+        if filters['textAuthor']:
+            mask = self.authors.matches(TextMatcher(filters['textAuthor'], "partial"), mask)
+        if filters['keyword']:
+            mask = self.keywords.matches(TextMatcher(filters['keyword'], filters['keywordMatchMode']), mask)
+        return mask
+
+    def search(self, filters, active, selected_instruments):
+        """Row indices of the matches, in result order."""
+        return np.flatnonzero(self.mask(filters, active, selected_instruments))
+
+
+def load_columns():
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(WORKS_QUERY)
+        rows = cursor.fetchall()
+        cursor.execute(GENRES_QUERY)
+        genres = cursor.fetchall()
+        cursor.execute(AUTHORS_QUERY)
+        authors = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return RepertoireColumns(rows, genres, authors)
+
+
+def parse_request(data):
+    """The page and filters of a search request, with search.php's casts and defaults."""
+    page = max(1, php_int(data.get('page', 1)))
+    per_page = min(100, max(1, php_int(data.get('perPage', 50))))
+    text = lambda key, default='': php_str(data.get(key, default)).strip()
+    number = lambda key, default=0: php_int(data.get(key, default))
+    filters = {
+        'genreId': number('genreId'),
+        'composerId': number('composerId'),
+        'sugu': text('sugu'),
+        'title': text('title'),
+        'textAuthor': text('textAuthor'),
+        'keyword': text('keyword'),
+        'titleMatchMode': text('titleMatchMode', 'partial'),
+        'keywordMatchMode': text('keywordMatchMode', 'partial'),
+        'bornYearFrom': number('bornYearFrom'),
+        'bornYearTo': number('bornYearTo'),
+        'compositionYearFrom': number('compositionYearFrom'),
+        'compositionYearTo': number('compositionYearTo'),
+        'durationFrom': number('durationFrom'),
+        'durationTo': number('durationTo', 60),
+        'performersFrom': number('performersFrom'),
+        'performersTo': number('performersTo', 16),
+        'onlySelectedInstruments': not php_empty(data.get('onlySelectedInstruments', False)),
+    }
+    for key in ('titleMatchMode', 'keywordMatchMode'):
+        if filters[key] not in MATCH_MODES:
+            filters[key] = 'partial'
+
+    active_input = data.get('activeFilters')
+    if not isinstance(active_input, dict):
+        active_input = {}
+    active = {key: not php_empty(active_input.get(key, False))
+              for key in ('bornYear', 'compositionYear', 'duration', 'performers')}
+
+    selected = data.get('selectedInstruments')
+    selected_instruments = {}
+    for instrument_id in selected if isinstance(selected, list) else []:
+        instrument_id = php_str(instrument_id).strip()
+        if instrument_id:
+            selected_instruments[instrument_id] = True
+    return page, per_page, filters, active, list(selected_instruments)
+
+
+def search_response(columns, data):
+    page, per_page, filters, active, selected_instruments = parse_request(data)
+    rows = columns.search(filters, active, selected_instruments)
+    offset = (page - 1) * per_page
+    return {
+        'ok': True,
+        'total': int(len(rows)),
+        'page': page,
+        'perPage': per_page,
+        'items': [columns.items[i] for i in rows[offset:offset + per_page].tolist()],
+    }
+
+
+class SearchService:
+    def __init__(self, columns=None):
+        self.columns = columns if columns is not None else load_columns()
+        print(f"Loaded {self.columns.size} rows, {len(self.columns.instruments)} instruments, "
+              f"{len(self.columns.genres)} genres")
+
+    def reload_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                started = time.perf_counter()
+                columns = load_columns()
+            except mysql.connector.Error as e:
+                print(f"✗ Reload failed, keeping the loaded data: {e}")
+                continue
+            # Requests in flight keep the columns they started with
+            self.columns = columns
+            print(f"Reloaded {columns.size} rows in {time.perf_counter() - started:.1f}s")
+
+
+def make_handler(service):
+    class SearchHandler(BaseHTTPRequestHandler):
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            self.send_header('Access-Control-Allow-Origin', ALLOWED_ORIGIN)
+            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            self.end_headers()
+
+        def do_POST(self):
+            try:
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                try:
+                    data = json.loads(raw) if raw.strip() else {}
+                except ValueError:
+                    data = {}
+                if not isinstance(data, dict):
+                    data = {}
+                self._send_json(search_response(service.columns, data))
+            except Exception as e:
+                debug = os.environ.get('EMIC_DEBUG', '')
+                message = str(e) if debug == '1' or debug.lower() == 'true' else 'Otsing ebaonnestus.'
+                self._send_json({'ok': False, 'error': message}, 500)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SearchHandler
+
+
+def serve():
+    service = SearchService()
+    if RELOAD_INTERVAL > 0:
+        threading.Thread(target=service.reload_forever, args=(RELOAD_INTERVAL,), daemon=True).start()
+    server = ThreadingHTTPServer((HOST, PORT), make_handler(service))
+    print(f"Serving repertoire search on http://{HOST}:{PORT}/")
+    server.serve_forever()
+
+
+# --- Benchmark ---
+
+def synthetic_rows(count, seed=1):
+    """Rows shaped like WORKS_QUERY results, for timing without a database."""
+    rng = random.Random(seed)
+    instruments = ["fl", "ob", "cl", "fg", "cor", "tr", "trb", "tb", "pf", "org", "hp", "perc",
+                   "vn", "va", "vc", "cb", "git", "acc", "kannel", "sax"]
+    instruments += [f"i{n}" for n in range(180)]
+    words = ["sonaat", "kvartett", "laul", "missa", "süit", "prelüüd", "fantaasia", "tants", "öö", "meri"]
+    rows = []
+    for work_id in range(1, count + 1):
+        parts = [{"instrument_id": rng.choice(instruments[:20] if rng.random() < 0.9 else instruments),
+                  "count": rng.choice([1, 1, 1, 2])} for _ in range(rng.randint(1, 6))]
+        instrumentation = {"total_player_count": 0 if rng.random() < 0.5 else rng.randint(1, 40), "parts": parts}
+        title = f"{rng.choice(words).capitalize()} nr {rng.randint(1, 30)}"
+        fields = [title] + [None] * (len(KEYWORD_FIELDS) - 1)
+        fields[KEYWORD_FIELDS.index("koosseis")] = ", ".join(p["instrument_id"] for p in parts)
+        composer_id = rng.randint(1, 400)
+        rows.append((work_id, composer_id, f"Helilooja {composer_id}", rng.choice("mnx"),
+                     f"{rng.randint(1, 28)}.{rng.randint(1, 12)}.{rng.randint(1850, 2005)}",
+                     str(rng.randint(1880, 2025)), f"{rng.randint(1, 90)}'", *fields,
+                     json.dumps(instrumentation)))
+    genres = [(work_id, rng.randint(1, 30)) for work_id in range(1, count + 1)]
+    return rows, genres
+
+
+def benchmark(count=BENCHMARK_WORKS, repeats=200):
+    print(f"Building columns for {count} synthetic works...")
+    started = time.perf_counter()
+    rows, genres = synthetic_rows(count)
+    columns = RepertoireColumns(rows, genres)
+    print(f"  built in {time.perf_counter() - started:.1f}s")
+
+    queries = {
+        "no filters": {},
+        "composer": {"composerId": 12},
+        "genre + years": {"genreId": 3, "compositionYearFrom": 1950, "compositionYearTo": 2000,
+                          "activeFilters": {"compositionYear": True}},
+        "duration + players": {"durationFrom": 5, "durationTo": 20, "performersFrom": 2, "performersTo": 4,
+                               "activeFilters": {"duration": True, "performers": True}},
+        "fl + hp": {"selectedInstruments": ["fl", "hp"]},
+        "only fl + hp": {"selectedInstruments": ["fl", "hp"], "onlySelectedInstruments": True},
+        "everything numeric": {"genreId": 3, "sugu": "n", "bornYearFrom": 1900, "bornYearTo": 1980,
+                               "durationFrom": 5, "durationTo": 30, "performersFrom": 1, "performersTo": 8,
+                               "selectedInstruments": ["vn"],
+                               "activeFilters": {"bornYear": True, "duration": True, "performers": True}},
+        "title word": {"title": "sonaat", "titleMatchMode": "word"},
+        "keyword partial": {"keyword": "kannel"},
+        "composer + keyword": {"keyword": "kannel", "composerId": 12},
+        "keyword exact": {"keyword": "Meri nr 3", "keywordMatchMode": "exact"},
+    }
+    print(f"{'query':<22} {'matches':>8} {'filter ms (p50 / p99)':>24} {'response ms (p50)':>18}")
+    for name, data in queries.items():
+        _, _, filters, active, selected = parse_request(data)
+        filter_times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            matches = columns.search(filters, active, selected)
+            filter_times.append((time.perf_counter() - started) * 1000)
+        response_times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            json.dumps(search_response(columns, data), ensure_ascii=False)
+            response_times.append((time.perf_counter() - started) * 1000)
+        filter_times.sort()
+        response_times.sort()
+        print(f"{name:<22} {len(matches):>8} {filter_times[len(filter_times) // 2]:>11.3f} / "
+              f"{filter_times[int(len(filter_times) * 0.99)]:<10.3f} {response_times[len(response_times) // 2]:>18.3f}")
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv[1:]:
+        args = [arg for arg in sys.argv[1:] if arg != "--benchmark"]
+        benchmark(int(args[0]) if args else BENCHMARK_WORKS)
+    else:
+        serve()
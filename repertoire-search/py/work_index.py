@@ -0,0 +1,105 @@
+"""
+On-disk keyed index of a works JSON file (teosed_koik.json and friends).
+
+The JSON list is streamed element by element into a SQLite file next to
+it (<file>.idx.sqlite), so a work can be looked up by id without keeping
+the whole list in memory. The index is rebuilt when the size or
+modification time of the JSON file changes.
+"""
+
+import json
+import os
+import sqlite3
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """Yield the elements of a top-level JSON list one by one from a sliding buffer."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        position = buffer.find('[')
+        while position < 0:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            position = buffer.find('[')
+        position += 1
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if buffer.startswith(']', position):
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Element cut off at the end of the buffer: read on
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item
+
+
+class WorkIndex:
+    def __init__(self, json_path, index_path=None):
+        self.json_path = json_path
+        self.index_path = index_path or json_path + ".idx.sqlite"
+        self.conn = sqlite3.connect(self.index_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS works (id TEXT PRIMARY KEY, pealkiri TEXT, koosseis TEXT)"
+        )
+        if not self._is_current():
+            self.rebuild()
+
+    def _source_stamp(self):
+        stat = os.stat(self.json_path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _is_current(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        return row is not None and row[0] == self._source_stamp()
+
+    def rebuild(self, batch_size=5000):
+        print(f"Building index {self.index_path} from {self.json_path}...")
+        self.conn.execute("DELETE FROM works")
+        batch = []
+        count = 0
+        for item in iter_json_array(self.json_path):
+            batch.append((str(item['id']), item.get('pealkiri'), item.get('koosseis')))
+            if len(batch) >= batch_size:
+                self.conn.executemany("INSERT OR REPLACE INTO works VALUES (?, ?, ?)", batch)
+                count += len(batch)
+                batch = []
+        self.conn.executemany("INSERT OR REPLACE INTO works VALUES (?, ?, ?)", batch)
+        count += len(batch)
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (self._source_stamp(),))
+        self.conn.commit()
+        print(f"Indexed {count} works.")
+
+    def get(self, work_id):
+        """Return {'pealkiri', 'koosseis'} of a work, or None."""
+        row = self.conn.execute(
+            "SELECT pealkiri, koosseis FROM works WHERE id = ?", (str(work_id),)
+        ).fetchone()
+        return {"pealkiri": row[0], "koosseis": row[1]} if row else None
+
+    def get_many(self, work_ids):
+        """Return {id: {'pealkiri', 'koosseis'}} for the ids that exist."""
+        found = {}
+        ids = [str(work_id) for work_id in work_ids]
+        # SQLite limits the number of host parameters per statement
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            query = f"SELECT id, pealkiri, koosseis FROM works WHERE id IN ({', '.join('?' * len(part))})"
+            for work_id, title, text in self.conn.execute(query, part):
+                found[work_id] = {"pealkiri": title, "koosseis": text}
+        return found
+
+    def close(self):
+        self.conn.close()
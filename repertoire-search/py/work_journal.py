@@ -0,0 +1,164 @@
+"""
+Append-only JSONL journal of processed works.
+
+Every processed work is one line:
+
+    {"status": "success", "entry": {"id": 12, "title": ..., "instrumentation": ...}}
+    {"status": "failed", "entry": {"id": 13, "title": ..., "error": ...}}
+    {"status": "skipped", "entry": {"id": 14, "title": ..., "error": ...}}
+
+Lines are flushed immediately and fsynced in batches, so the cost per work
+does not depend on how many works were processed before. A work can appear
+more than once (a failed work retried in a later run); the last line wins.
+Successes and skipped works (nothing to process) are done for good; failed
+works are retried. Skipped works are listed with the failures in the
+snapshot.
+
+A crash can leave a half-written last line, which is dropped on the next
+start. Any other unreadable line is skipped with a warning, so the records
+after it are kept.
+
+The JSON files with all successes and failures are written from the
+journal only when asked for (snapshot()).
+"""
+
+import json
+import os
+import time
+
+
+DONE_STATUSES = ("success", "skipped")
+
+
+class WorkJournal:
+    def __init__(self, path, fsync_every=50, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.completed = set()  # ids whose last record is in DONE_STATUSES
+        self.success_count = 0
+        self.failed_count = 0
+        self._repair_and_load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _repair_and_load(self):
+        """Read the completed ids; drop a half-written last line left by a crash."""
+        if not os.path.exists(self.path):
+            return
+        good_size = 0
+        unreadable = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                record = _parse_record(line)
+                if record is None:
+                    if not line.endswith(b'\n'):
+                        break  # the last line, cut off by a crash
+                    unreadable += 1
+                    good_size += len(line)
+                    continue
+                good_size += len(line)
+                work_id = str(record["entry"].get("id"))
+                if record["status"] in DONE_STATUSES:
+                    self.completed.add(work_id)
+                else:
+                    self.completed.discard(work_id)
+        if unreadable:
+            print(f"Journal {self.path}: skipped {unreadable} unreadable records")
+        if good_size < os.path.getsize(self.path):
+            print(f"Journal {self.path}: dropping an incomplete last record")
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_size)
+
+    def is_completed(self, work_id):
+        return str(work_id) in self.completed
+
+    def _append(self, status, entry):
+        self._file.write(json.dumps({"status": status, "entry": entry}, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def success(self, entry):
+        self.completed.add(str(entry.get("id")))
+        self.success_count += 1
+        self._append("success", entry)
+
+    def failure(self, entry):
+        self.completed.discard(str(entry.get("id")))
+        self.failed_count += 1
+        self._append("failed", entry)
+
+    def skipped(self, entry):
+        """A work with nothing to process; it is not retried on restart."""
+        self.completed.add(str(entry.get("id")))
+        self.failed_count += 1
+        self._append("skipped", entry)
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
+def _parse_record(line):
+    """One journal line -> record, or None if the line is not a complete record."""
+    try:
+        record = json.loads(line)
+        record["entry"].get("id")
+        record["status"]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return record
+
+
+def _iter_records(journal_path):
+    """Yield (line number, record) for every readable line of the journal."""
+    with open(journal_path, 'rb') as f:
+        for number, line in enumerate(f):
+            record = _parse_record(line)
+            if record is not None:
+                yield number, record
+
+
+def _write_json_list(path, entries):
+    """Write entries as a JSON list, formatted like json.dump(..., indent=2)."""
+    count = 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for entry in entries:
+            text = json.dumps(entry, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            f.write((',\n  ' if count else '\n  ') + text)
+            count += 1
+        f.write('\n]' if count else ']')
+    os.replace(tmp_path, path)
+    return count
+
+
+def _iter_final_records(journal_path, statuses):
+    """Yield the entries with one of `statuses`, using only the last record of every work."""
+    # First pass: line number of the last record of every id (small), second
+    # pass: stream the records that are final
+    last_line = {}
+    for number, record in _iter_records(journal_path):
+        last_line[str(record["entry"].get("id"))] = number
+    for number, record in _iter_records(journal_path):
+        if record["status"] in statuses and last_line[str(record["entry"].get("id"))] == number:
+            yield record["entry"]
+
+
+def snapshot(journal_path, output_file, failed_file):
+    """Write the success and failure JSON files from the journal. Returns (successes, failures)."""
+    if not os.path.exists(journal_path):
+        return 0, 0
+    successes = _write_json_list(output_file, _iter_final_records(journal_path, ("success",)))
+    failures = _write_json_list(failed_file, _iter_final_records(journal_path, ("failed", "skipped")))
+    return successes, failures
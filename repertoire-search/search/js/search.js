@@ -8,6 +8,9 @@ const instrumentMenu = document.getElementById('instrumentMenu');
 const instrumentTags = document.getElementById('instrumentTags');
 const resetBtn = document.getElementById('resetBtn');
 
+// py/search_service.py answers the same requests, e.g. 'http://127.0.0.1:8765/'
+const SEARCH_URL = './api/search.php';
+
 let selectedInstruments = [];
 let instrumentCache = [];
 let defaultRangeFilters = null;
@@ -254,7 +257,7 @@ async function runSearch(page = 1) {
     page
   };
 
-  const data = await fetchJson('./api/search.php', {
+  const data = await fetchJson(SEARCH_URL, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(payload)